@@ -6,7 +6,8 @@ import arxiv
 import httpx
 import asyncio
 import tempfile
-from typing import Dict, List, Optional, Any, Tuple
+import unicodedata
+from typing import Dict, List, Optional, Any, Tuple, Callable
 import aiohttp
 from urllib.request import urlretrieve
 import logging
@@ -17,18 +18,83 @@ from .config import (
     CURRENT_VOLCANO_MODEL, 
     ARXIV_RESULTS_PER_QUERY, 
     ARXIV_SORT_BY,
-    PDF_DIR
+    ARXIV_API_URL,
+    PDF_DIR,
+    CACHE_DIR,
+    SEARCH_CACHE_TTL,
+    SEARCH_CACHE_STALE_TTL,
+    SEARCH_CACHE_MEMORY_ENTRIES,
+    SEARCH_CACHE_MAX_BYTES,
+    TRANSLATION_CACHE_MEMORY_ENTRIES,
+    TRANSLATION_CACHE_MAX_BYTES
 )
+from .http_client import http_clients
+from .downloader import downloader
+from .extraction import extraction_service
+from .cache import TieredCache
+from .metrics import llm_tokens, timed_stage
+from .context import pack_context, context_budget, estimate_tokens
+from .corpus import corpus
+from .embeddings import embedding_index
+from .documents import document_ingestor
 
 # 配置日志
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("ai_service")
 
+# arXiv API地址(测试和压测时可以指向本地服务)
+arxiv.Client.query_url_format = ARXIV_API_URL
+
+# arXiv搜索结果缓存
+search_cache = TieredCache(
+    os.path.join(CACHE_DIR, "arxiv_search.db"),
+    SEARCH_CACHE_MAX_BYTES,
+    memory_entries=SEARCH_CACHE_MEMORY_ENTRIES,
+    ttl=SEARCH_CACHE_TTL,
+    stale_ttl=SEARCH_CACHE_STALE_TTL,
+    name="search_cache"
+)
+
+# 主题翻译缓存，翻译结果不会过期，仅受容量限制
+translation_cache = TieredCache(
+    os.path.join(CACHE_DIR, "translation.db"),
+    TRANSLATION_CACHE_MAX_BYTES,
+    memory_entries=TRANSLATION_CACHE_MEMORY_ENTRIES,
+    name="translation_cache"
+)
+
+def normalize_topic(topic: str) -> str:
+    """规范化主题: 统一全角字符和大小写，去掉标点，合并空白，中文字符之间的空白无意义直接删除"""
+    topic = unicodedata.normalize("NFKC", topic).lower()
+    topic = "".join(" " if unicodedata.category(c).startswith(("P", "Z")) else c for c in topic)
+    topic = " ".join(topic.split())
+    return re.sub(r'(?<=[\u4e00-\u9fff]) (?=[\u4e00-\u9fff])', '', topic)
+
 async def translate_to_english(topic: str) -> str:
-    """将中文主题翻译为英文关键词"""
+    """将中文主题翻译为英文关键词
+
+    先按原文精确匹配缓存，再按规范化后的主题匹配；并发的相同翻译请求只调用一次模型
+    """
     if not re.search(r'[\u4e00-\u9fff]', topic):
         return topic  # 如果不包含中文，直接返回
     
+    exact_key = f"exact:{topic}"
+    translation = await asyncio.to_thread(translation_cache.peek, exact_key)
+    if translation is not None:
+        logger.info(f"翻译缓存命中: {topic} -> {translation}")
+        return translation
+    
+    translation = await translation_cache.get_or_load(
+        f"normalized:{normalize_topic(topic)}",
+        lambda: _translate(topic),
+        should_cache=lambda result: result != topic  # 翻译失败时返回原文，不缓存
+    )
+    if translation != topic:
+        await asyncio.to_thread(translation_cache.put, exact_key, translation)
+    return translation
+
+async def _translate(topic: str) -> str:
+    """调用豆包API翻译主题"""
     logger.info(f"翻译主题: {topic}")
     
     # 构造翻译请求
@@ -49,31 +115,58 @@ async def translate_to_english(topic: str) -> str:
     
     try:
         # 调用豆包API进行翻译
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                VOLCANO_API_URL,
-                headers={
-                    "Content-Type": "application/json",
-                    "Authorization": f"Bearer {VOLCANO_API_KEY}"
-                },
-                json=data,
-                timeout=30.0
-            )
+        client = http_clients.get_client(VOLCANO_API_URL)
+        response = await client.post(
+            VOLCANO_API_URL,
+            headers={
+                "Content-Type": "application/json",
+                "Authorization": f"Bearer {VOLCANO_API_KEY}"
+            },
+            json=data,
+            timeout=30.0
+        )
             
-            response_data = response.json()
-            if "choices" in response_data and len(response_data["choices"]) > 0:
-                translation = response_data["choices"][0]["message"]["content"].strip()
-                logger.info(f"翻译结果: {translation}")
-                return translation
-            else:
-                logger.error(f"翻译失败: {response_data}")
-                return topic  # 失败时返回原始主题
+        response_data = response.json()
+        record_token_usage(response_data.get("usage"), "translate")
+        if "choices" in response_data and len(response_data["choices"]) > 0:
+            translation = response_data["choices"][0]["message"]["content"].strip()
+            logger.info(f"翻译结果: {translation}")
+            return translation
+        else:
+            logger.error(f"翻译失败: {response_data}")
+            return topic  # 失败时返回原始主题
     except Exception as e:
         logger.error(f"翻译过程出错: {str(e)}")
         return topic  # 出错时返回原始主题
 
+def record_token_usage(usage: Optional[Dict[str, Any]], call: str):
+    """记录大模型API返回的token用量"""
+    if not usage:
+        return
+    for kind in ("prompt", "completion"):
+        tokens = usage.get(f"{kind}_tokens")
+        if tokens:
+            llm_tokens.inc(tokens, call=call, kind=kind)
+
+def normalize_query(query: str) -> str:
+    """规范化搜索词: 统一全角字符，去掉引号和多余的标点、空白
+
+    不改变大小写，arXiv的AND/OR等布尔运算符必须大写
+    """
+    query = unicodedata.normalize("NFKC", query)
+    query = re.sub(r"[\"'`“”‘’]", "", query)
+    query = re.sub(r"[,;.!?，。；！？、\s]+", " ", query)
+    return query.strip()
+
 async def search_arxiv_papers(query: str, max_results: int = 5) -> List[Dict[str, Any]]:
-    """搜索arXiv相关论文"""
+    """搜索arXiv相关论文，结果按规范化后的查询缓存"""
+    query = normalize_query(query)
+    # 不转小写，否则"a AND b"和"a and b"会共用缓存；换用新前缀，不再命中按小写写入的旧缓存
+    cache_key = f"arxiv-q:{ARXIV_SORT_BY}:{max_results}:{query}"
+    return await search_cache.get_or_load(cache_key, lambda: _search_arxiv(query, max_results))
+
+async def _search_arxiv(query: str, max_results: int) -> List[Dict[str, Any]]:
+    """调用arXiv API搜索论文"""
     logger.info(f"搜索arXiv论文: {query}, 最大结果: {max_results}")
     
     try:
@@ -81,7 +174,7 @@ async def search_arxiv_papers(query: str, max_results: int = 5) -> List[Dict[str
         search = arxiv.Search(
             query=query,
             max_results=max_results,
-            sort_by=ARXIV_SORT_BY
+            sort_by=arxiv.SortCriterion(ARXIV_SORT_BY)
         )
         
         papers = []
@@ -115,56 +208,10 @@ async def search_arxiv_papers(query: str, max_results: int = 5) -> List[Dict[str
         return []
 
 async def download_papers(papers: List[Dict[str, Any]], timeout: int = 30) -> List[Dict[str, Any]]:
-    """下载论文PDF并更新本地路径"""
+    """并发下载论文PDF并更新本地路径，每篇论文的下载耗时记录在paper["download"]中"""
     logger.info(f"开始下载 {len(papers)} 篇论文")
     
-    for i, paper in enumerate(papers):
-        try:
-            # 构建PDF文件路径
-            filename = f"{paper['id']}.pdf"
-            local_path = os.path.join(PDF_DIR, filename)
-            
-            # 如果PDF已经存在，跳过下载
-            if os.path.exists(local_path):
-                paper["local_path"] = local_path
-                logger.info(f"论文PDF已存在: {filename}")
-                continue
-            
-            # 下载PDF
-            logger.info(f"下载论文 {i+1}/{len(papers)}: {paper['title']}")
-            
-            # 使用urlretrieve下载PDF，添加超时控制
-            async def download_with_timeout():
-                try:
-                    # 使用httpx替代urlretrieve，以便更好地控制超时
-                    async with httpx.AsyncClient(timeout=timeout) as client:
-                        response = await client.get(paper["pdf_url"])
-                        if response.status_code == 200:
-                            with open(local_path, "wb") as f:
-                                f.write(response.content)
-                            return local_path
-                        else:
-                            logger.warning(f"下载论文失败，状态码: {response.status_code}")
-                            return None
-                except Exception as e:
-                    logger.error(f"下载过程出错: {str(e)}")
-                    return None
-            
-            # 执行下载，设置超时
-            try:
-                result_path = await asyncio.wait_for(download_with_timeout(), timeout=timeout)
-                if result_path:
-                    paper["local_path"] = result_path
-                    logger.info(f"成功下载论文: {filename}")
-                else:
-                    logger.warning(f"论文 {paper['id']} 下载失败，跳过")
-            except asyncio.TimeoutError:
-                logger.warning(f"下载论文 {paper['id']} 超时，跳过")
-            
-            # 避免同时发起太多请求
-            await asyncio.sleep(1)
-        except Exception as e:
-            logger.error(f"下载论文 {paper['id']} 时出错: {str(e)}")
+    await downloader.download_all(papers, timeout=timeout)
     
     # 过滤掉没有成功下载的论文
     valid_papers = [p for p in papers if p.get("local_path")]
@@ -191,34 +238,21 @@ async def extract_paper_content(paper: Dict[str, Any], max_pages: int = 5) -> st
         return paper.get('summary', '')
     
     try:
-        # 定义同步提取函数
-        def extract_pdf_content(file_path, max_pages):
-            try:
-                import fitz  # PyMuPDF
-                
-                logger.info(f"提取论文内容: {paper['title']}")
-                doc = fitz.open(file_path)
-                
-                # 只提取前几页内容以节省token
-                content = ""
-                for i in range(min(max_pages, len(doc))):
-                    page = doc[i]
-                    content += page.get_text()
-                
-                return content
-            except Exception as e:
-                logger.error(f"PDF内容提取出错: {str(e)}")
-                return paper.get('summary', '')
-        
-        # 在事件循环中执行PDF提取，设置超时
+        # 在进程池中执行PDF提取，超时由提取服务的时间预算控制
+        logger.info(f"提取论文内容: {paper['title']}")
         try:
-            loop = asyncio.get_event_loop()
-            content = await asyncio.wait_for(
-                loop.run_in_executor(None, lambda: extract_pdf_content(paper["local_path"], max_pages)),
-                timeout=15
-            )
+            with timed_stage("extract"):
+                content = await extraction_service.extract_pdf(paper["local_path"], max_pages)
             # 标记为已提取
             paper["content_extracted"] = True
+            # 加入本地论文索引和语义索引，索引失败不影响本次处理
+            def index_paper():
+                if corpus.add_paper(paper, content) or not embedding_index.has_paper(paper["id"]):
+                    embedding_index.add_paper(paper, content)
+            try:
+                await asyncio.to_thread(index_paper)
+            except Exception as e:
+                logger.error(f"论文 {paper['id']} 加入本地索引时出错: {str(e)}")
             return content
         except asyncio.TimeoutError:
             logger.warning(f"提取论文 {paper['id']} 内容超时，使用摘要代替")
@@ -232,9 +266,17 @@ async def generate_technical_proposal(
     papers: List[Dict[str, Any]],
     extracted_contents: List[str] = None,
     model_type: str = "default",
-    max_tokens: int = 4000
+    max_tokens: int = 4000,
+    on_token: Optional[Callable[[str], None]] = None,
+    query: Optional[str] = None,
+    documents: Optional[List[Dict[str, Any]]] = None
 ) -> Dict[str, Any]:
-    """生成技术方案"""
+    """生成技术方案，on_token在每个流式token到达时被调用
+
+    论文正文和用户上传文档的片段(documents，[{"filename", "chunks"}])按与query
+    (默认为topic，传入翻译后的英文关键词效果更好)的相关性在token预算内选取。
+    返回结果中的prompt_stats记录提示词大小。
+    """
     logger.info(f"生成技术方案: {topic}, 使用模型类型: {model_type}")
     
     # 构建提示词
@@ -260,21 +302,8 @@ async def generate_technical_proposal(
 请以Markdown格式输出，确保方案具有可执行性和技术深度。使用表格展示比较信息，使用列表说明有序步骤。
 如果可能，添加一个用Mermaid语法表示的系统架构图。"""
     
-    # 构建论文信息
-    papers_info = []
-    for i, paper in enumerate(papers):
-        paper_info = f"论文 {i+1}:\n"
-        paper_info += f"标题: {paper['title']}\n"
-        paper_info += f"作者: {', '.join(paper['authors'])}\n"
-        paper_info += f"摘要: {paper['summary']}\n"
-        if extracted_contents and i < len(extracted_contents) and extracted_contents[i]:
-            paper_info += f"内容摘录: {extracted_contents[i][:3000]}...\n"  # 限制内容长度
-        papers_info.append(paper_info)
-    
-    papers_text = "\n\n".join(papers_info)
-    
     # 构建用户提示词
-    user_prompt = f"""请基于以下研究主题和相关论文，生成一份详细的技术方案：
+    user_prompt_template = """请基于以下研究主题和相关论文，生成一份详细的技术方案：
 
 研究主题: {topic}
 
@@ -290,6 +319,19 @@ async def generate_technical_proposal(
 
 方案应当既有理论基础，又具备实用性和可执行性。"""
     
+    # 在上下文窗口和预算内组织论文信息
+    reserved_tokens = estimate_tokens(system_prompt) + estimate_tokens(user_prompt_template.format(topic=topic, papers_text=""))
+    papers_text, prompt_stats = pack_context(
+        query or topic,
+        papers,
+        extracted_contents,
+        context_budget(max_tokens, reserved_tokens),
+        documents
+    )
+    user_prompt = user_prompt_template.format(topic=topic, papers_text=papers_text)
+    prompt_stats["prompt_tokens"] = estimate_tokens(system_prompt) + estimate_tokens(user_prompt)
+    logger.info(f"提示词约 {prompt_stats['prompt_tokens']} tokens, 选取 {prompt_stats['chunks_selected']}/{prompt_stats['chunks_total']} 个正文片段")
+    
     # 构造API请求数据
     data = {
         "model": CURRENT_VOLCANO_MODEL,
@@ -306,104 +348,126 @@ async def generate_technical_proposal(
         "max_tokens": max_tokens,
         "temperature": 0.7,  # 控制生成的随机性
         "top_p": 0.9,        # 使用nucleus采样
-        "seed": 1234         # 设置固定种子，提高一致性
+        "seed": 1234,        # 设置固定种子，提高一致性
+        "stream": True,      # 流式输出，尽早返回首个token
+        "stream_options": {"include_usage": True}  # 最后一个数据块返回token用量
     }
     
     try:
-        # 调用豆包API生成技术方案
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                VOLCANO_API_URL,
-                headers={
-                    "Content-Type": "application/json",
-                    "Authorization": f"Bearer {VOLCANO_API_KEY}"
-                },
-                json=data,
-                timeout=120.0  # 生成复杂内容，增加超时时间
-            )
-            
-            response_data = response.json()
-            if "choices" in response_data and len(response_data["choices"]) > 0:
-                proposal = response_data["choices"][0]["message"]["content"]
-                
-                # 提取架构图（如果有）
-                architecture_diagram = None
-                diagram_match = re.search(r"```mermaid\s+([\s\S]+?)\s+```", proposal)
-                if diagram_match:
-                    architecture_diagram = diagram_match.group(1)
-                
-                # 提取实施步骤
-                steps = []
-                steps_section = re.search(r"## 实施步骤[\s\S]+?(?=##|$)", proposal)
-                if steps_section:
-                    steps_text = steps_section.group(0)
-                    step_matches = re.findall(r"\d+\.\s+(.+?)(?=\n\d+\.|\n##|\Z)", steps_text)
-                    steps = [{"step": i+1, "description": step.strip()} for i, step in enumerate(step_matches)]
-                
-                # 提取所需资源
-                resources = []
-                resources_section = re.search(r"## 所需资源[\s\S]+?(?=##|$)", proposal)
-                if resources_section:
-                    resources_text = resources_section.group(0)
-                    resource_matches = re.findall(r"-\s+(.+?)(?=\n-|\n##|\Z)", resources_text)
-                    resources = [{"type": "resource", "description": res.strip()} for res in resource_matches]
-                
-                # 构建结果
-                result = {
-                    "technical_proposal": proposal,
-                    "architecture_diagram": architecture_diagram,
-                    "implementation_steps": steps,
-                    "resources_needed": resources,
-                    "references": [
-                        {
-                            "id": p["id"],
-                            "title": p["title"],
-                            "authors": p["authors"],
-                            "summary": p["summary"],
-                            "published": p["published"],
-                            "pdf_url": p["pdf_url"],
-                            "local_path": p.get("local_path")
-                        } for p in papers
-                    ]
-                }
-                
-                return result
-            else:
+        # 调用豆包API生成技术方案（流式输出）
+        proposal = ""
+        client = http_clients.get_client(VOLCANO_API_URL)
+        async with client.stream(
+            "POST",
+            VOLCANO_API_URL,
+            headers={
+                "Content-Type": "application/json",
+                "Authorization": f"Bearer {VOLCANO_API_KEY}"
+            },
+            json=data,
+            timeout=httpx.Timeout(120.0, read=60.0)  # read为两个token之间的最长等待时间
+        ) as response:
+            if response.status_code != 200:
+                body = await response.aread()
+                try:
+                    response_data = json.loads(body)
+                except ValueError:
+                    response_data = {"status_code": response.status_code, "body": body.decode("utf-8", errors="ignore")}
                 logger.error(f"生成技术方案失败: {response_data}")
                 return {"error": "生成技术方案失败", "details": response_data}
+
+            async for line in response.aiter_lines():
+                # SSE格式: "data: {...}"，以"data: [DONE]"结束
+                if not line.startswith("data:"):
+                    continue
+                payload = line[len("data:"):].strip()
+                if payload == "[DONE]":
+                    break
+                try:
+                    chunk = json.loads(payload)
+                except ValueError:
+                    logger.warning(f"无法解析的流式数据: {payload[:200]}")
+                    continue
+
+                if chunk.get("usage"):
+                    record_token_usage(chunk["usage"], "generate")
+                    prompt_stats["reported_prompt_tokens"] = chunk["usage"].get("prompt_tokens")
+                choices = chunk.get("choices") or []
+                if not choices:
+                    continue
+                token = (choices[0].get("delta") or {}).get("content")
+                if token:
+                    proposal += token
+                    if on_token:
+                        on_token(token)
+
+        if not proposal:
+            logger.error("生成技术方案失败: 模型未返回内容")
+            return {"error": "生成技术方案失败", "details": {"reason": "empty completion"}}
+
+        result = build_proposal_result(proposal, papers)
+        result["prompt_stats"] = prompt_stats
+        return result
     except Exception as e:
         logger.error(f"生成技术方案时出错: {str(e)}")
         return {"error": str(e)}
 
-async def process_uploaded_file(file_path: str, file_type: str) -> str:
-    """处理上传的文件，提取内容"""
+def build_proposal_result(proposal: str, papers: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """从方案文本中提取结构化信息并构建结果"""
+    # 提取架构图（如果有）
+    architecture_diagram = None
+    diagram_match = re.search(r"```mermaid\s+([\s\S]+?)\s+```", proposal)
+    if diagram_match:
+        architecture_diagram = diagram_match.group(1)
+    
+    # 提取实施步骤
+    steps = []
+    steps_section = re.search(r"## 实施步骤[\s\S]+?(?=##|$)", proposal)
+    if steps_section:
+        steps_text = steps_section.group(0)
+        step_matches = re.findall(r"\d+\.\s+(.+?)(?=\n\d+\.|\n##|\Z)", steps_text)
+        steps = [{"step": i+1, "description": step.strip()} for i, step in enumerate(step_matches)]
+    
+    # 提取所需资源
+    resources = []
+    resources_section = re.search(r"## 所需资源[\s\S]+?(?=##|$)", proposal)
+    if resources_section:
+        resources_text = resources_section.group(0)
+        resource_matches = re.findall(r"-\s+(.+?)(?=\n-|\n##|\Z)", resources_text)
+        resources = [{"type": "resource", "description": res.strip()} for res in resource_matches]
+    
+    # 构建结果
+    return {
+        "technical_proposal": proposal,
+        "architecture_diagram": architecture_diagram,
+        "implementation_steps": steps,
+        "resources_needed": resources,
+        "references": [
+            {
+                "id": p["id"],
+                "title": p["title"],
+                "authors": p["authors"],
+                "summary": p["summary"],
+                "published": p["published"],
+                "pdf_url": p["pdf_url"],
+                "local_path": p.get("local_path")
+            } for p in papers
+        ]
+    }
+
+async def process_uploaded_file(file_path: str, file_type: str, sha256: str) -> str:
+    """提交上传文件的后台解析任务，返回解析状态
+
+    文件按页提取并切分成片段写入文档索引，生成方案时选取其中与主题相关的片段。
+    file_type为文件名或扩展名，sha256为文件内容摘要，相同内容只解析一次。
+    """
     logger.info(f"处理上传的文件: {file_path}, 类型: {file_type}")
     
     try:
-        content = ""
-        
-        # 根据文件类型使用不同的处理方法
-        if file_type.endswith('.pdf'):
-            import fitz  # PyMuPDF
-            doc = fitz.open(file_path)
-            for page in doc:
-                content += page.get_text()
-        
-        elif file_type.endswith(('.txt', '.md')):
-            with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-                content = f.read()
-        
-        elif file_type.endswith(('.docx', '.doc')):
-            import docx
-            doc = docx.Document(file_path)
-            content = '\n'.join([paragraph.text for paragraph in doc.paragraphs])
-        
-        # 可以继续添加对其他文件类型的支持
-        
-        return content
+        return await document_ingestor.submit(sha256, file_path, file_type)
     except Exception as e:
         logger.error(f"处理上传文件时出错: {str(e)}")
-        return ""
+        return "failed"
 
 async def analyze_web_content(url: str) -> str:
     """使用LinkReader插件分析网页内容"""
@@ -444,24 +508,25 @@ async def analyze_web_content(url: str) -> str:
     
     try:
         # 调用豆包API进行网页内容分析
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                VOLCANO_API_URL,
-                headers={
-                    "Content-Type": "application/json",
-                    "Authorization": f"Bearer {VOLCANO_API_KEY}"
-                },
-                json=data,
-                timeout=60.0
-            )
+        client = http_clients.get_client(VOLCANO_API_URL)
+        response = await client.post(
+            VOLCANO_API_URL,
+            headers={
+                "Content-Type": "application/json",
+                "Authorization": f"Bearer {VOLCANO_API_KEY}"
+            },
+            json=data,
+            timeout=60.0
+        )
             
-            response_data = response.json()
-            if "choices" in response_data and len(response_data["choices"]) > 0:
-                result = response_data["choices"][0]["message"]["content"]
-                return result
-            else:
-                logger.error(f"网页内容分析失败: {response_data}")
-                return ""
+        response_data = response.json()
+        record_token_usage(response_data.get("usage"), "analyze_web")
+        if "choices" in response_data and len(response_data["choices"]) > 0:
+            result = response_data["choices"][0]["message"]["content"]
+            return result
+        else:
+            logger.error(f"网页内容分析失败: {response_data}")
+            return ""
     except Exception as e:
         logger.error(f"网页内容分析出错: {str(e)}")
         return ""
\ No newline at end of file
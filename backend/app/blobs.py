@@ -0,0 +1,248 @@
+import os
+import time
+import uuid
+import shutil
+import sqlite3
+import hashlib
+import threading
+import logging
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Any, Tuple
+
+from .config import BLOB_DIR, BLOB_GC_GRACE_HOURS
+
+# 配置日志
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("blobs")
+
+def hash_file(file_path: str) -> str:
+    """计算文件的SHA-256"""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def paper_alias(paper_id: str) -> str:
+    """论文PDF在文件存储中的别名"""
+    return f"paper:{paper_id}"
+
+def project_owner(project_id: str) -> str:
+    """项目持有的文件引用的所有者名称"""
+    return f"project:{project_id}"
+
+class BlobStore:
+    """按SHA-256寻址的文件存储，保存论文PDF和上传文件
+
+    文件保存在 BLOB_DIR/<摘要前2位>/<3~4位>/<摘要>，相同内容只保存一份。
+    项目通过引用(所有者, 名称) -> 摘要使用文件，blobs表的refcount记录引用数；
+    项目过期时释放它的全部引用，引用数为0且超过宽限期未使用的文件由collect_garbage删除。
+    别名(如paper:<arXiv ID>)把外部ID映射到内容，不计入引用数。
+    索引保存在SQLite中，写入和删除在BEGIN IMMEDIATE事务中进行，多个进程共享同一个存储。
+    """
+
+    def __init__(self, root: str = BLOB_DIR):
+        self.root = root
+        self.temp_dir = os.path.join(root, "tmp")
+        os.makedirs(self.temp_dir, exist_ok=True)
+        self.lock = threading.RLock()
+        self.conn = sqlite3.connect(os.path.join(root, "index.db"), check_same_thread=False,
+                                    timeout=30, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS blobs (
+                sha256 TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                refcount INTEGER NOT NULL DEFAULT 0,
+                last_used_at REAL NOT NULL
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_blobs_unreferenced ON blobs (refcount, last_used_at)")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS refs (
+                owner TEXT NOT NULL,
+                name TEXT NOT NULL,
+                sha256 TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                PRIMARY KEY (owner, name)
+            )
+        """)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS aliases (
+                name TEXT PRIMARY KEY,
+                sha256 TEXT NOT NULL
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_aliases_sha256 ON aliases (sha256)")
+
+    @contextmanager
+    def _transaction(self):
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield
+                self.conn.execute("COMMIT")
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def path(self, sha256: str) -> str:
+        return os.path.join(self.root, sha256[:2], sha256[2:4], sha256)
+
+    def put_file(self, source_path: str, sha256: Optional[str] = None) -> Tuple[str, str, bool]:
+        """把文件移动到存储中，返回(摘要, 存储路径, 是否已存在相同内容)
+
+        已存在相同内容时删除source_path。新写入或重复写入的文件在宽限期内不会被回收，
+        调用方应在宽限期内建立引用。
+        """
+        sha256 = sha256 or hash_file(source_path)
+        path = self.path(sha256)
+        size = os.path.getsize(source_path)
+        with self._transaction():
+            deduplicated = os.path.exists(path) and self.conn.execute(
+                "SELECT 1 FROM blobs WHERE sha256 = ?", (sha256,)
+            ).fetchone() is not None
+            if deduplicated:
+                os.remove(source_path)
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                shutil.move(source_path, path)
+            self.conn.execute(
+                "INSERT INTO blobs (sha256, size, refcount, last_used_at) VALUES (?, ?, 0, ?) "
+                "ON CONFLICT (sha256) DO UPDATE SET size = excluded.size, last_used_at = excluded.last_used_at",
+                (sha256, size, time.time())
+            )
+        return sha256, path, deduplicated
+
+    def put_bytes(self, content: bytes) -> Tuple[str, str, bool]:
+        """保存内存中的内容，返回值同put_file"""
+        temp_path = os.path.join(self.temp_dir, f"{uuid.uuid4().hex}.part")
+        with open(temp_path, "wb") as f:
+            f.write(content)
+        try:
+            return self.put_file(temp_path, hashlib.sha256(content).hexdigest())
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def set_alias(self, name: str, sha256: str):
+        with self.lock:
+            self.conn.execute("INSERT OR REPLACE INTO aliases (name, sha256) VALUES (?, ?)", (name, sha256))
+
+    def resolve(self, name: str, touch: bool = False) -> Optional[str]:
+        """返回别名对应文件的存储路径，touch为True时重新开始计算宽限期"""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT a.sha256 FROM aliases a JOIN blobs b ON b.sha256 = a.sha256 WHERE a.name = ?", (name,)
+            ).fetchone()
+            if row is None:
+                return None
+            if touch:
+                self.conn.execute("UPDATE blobs SET last_used_at = ? WHERE sha256 = ?", (time.time(), row[0]))
+        path = self.path(row[0])
+        return path if os.path.exists(path) else None
+
+    def _retain(self, owner: str, name: str, sha256: str):
+        previous = self.conn.execute(
+            "SELECT sha256 FROM refs WHERE owner = ? AND name = ?", (owner, name)
+        ).fetchone()
+        if previous and previous[0] == sha256:
+            return
+        if previous:
+            self.conn.execute("UPDATE blobs SET refcount = refcount - 1, last_used_at = ? WHERE sha256 = ?",
+                              (time.time(), previous[0]))
+        self.conn.execute(
+            "INSERT OR REPLACE INTO refs (owner, name, sha256, created_at) VALUES (?, ?, ?, ?)",
+            (owner, name, sha256, time.time())
+        )
+        self.conn.execute("UPDATE blobs SET refcount = refcount + 1 WHERE sha256 = ?", (sha256,))
+
+    def retain(self, owner: str, name: str, sha256: str):
+        """建立引用，同一所有者的同名引用指向新内容时释放旧内容"""
+        with self._transaction():
+            if self.conn.execute("SELECT 1 FROM blobs WHERE sha256 = ?", (sha256,)).fetchone() is None:
+                raise KeyError(f"文件存储中没有内容 {sha256}")
+            self._retain(owner, name, sha256)
+
+    def retain_aliases(self, owner: str, names: List[str]) -> int:
+        """按别名建立引用(引用名与别名相同)，忽略不存在的别名，返回建立的引用数"""
+        if not names:
+            return 0
+        with self._transaction():
+            rows = self.conn.execute(
+                f"SELECT a.name, a.sha256 FROM aliases a JOIN blobs b ON b.sha256 = a.sha256 "
+                f"WHERE a.name IN ({','.join('?' * len(names))})", names
+            ).fetchall()
+            for name, sha256 in rows:
+                self._retain(owner, name, sha256)
+        return len(rows)
+
+    def release(self, owners: List[str]) -> int:
+        """在一个事务中释放这些所有者的全部引用，返回释放的引用数"""
+        if not owners:
+            return 0
+        placeholders = ",".join("?" * len(owners))
+        with self._transaction():
+            counts = self.conn.execute(
+                f"SELECT sha256, COUNT(*) FROM refs WHERE owner IN ({placeholders}) GROUP BY sha256", owners
+            ).fetchall()
+            now = time.time()
+            for sha256, count in counts:
+                self.conn.execute("UPDATE blobs SET refcount = refcount - ?, last_used_at = ? WHERE sha256 = ?",
+                                  (count, now, sha256))
+            self.conn.execute(f"DELETE FROM refs WHERE owner IN ({placeholders})", owners)
+        return sum(count for _, count in counts)
+
+    def collect_garbage(self, grace_hours: float = BLOB_GC_GRACE_HOURS, limit: int = -1) -> Dict[str, int]:
+        """删除没有引用且超过宽限期未使用的文件及其别名，最多删除limit个(-1表示不限)
+
+        返回删除的文件数blobs、字节数bytes和摘要列表sha256s
+        """
+        removed = {"blobs": 0, "bytes": 0, "sha256s": []}
+        with self._transaction():
+            rows = self.conn.execute(
+                "SELECT sha256, size FROM blobs WHERE refcount <= 0 AND last_used_at < ? LIMIT ?",
+                (time.time() - grace_hours * 3600, limit)
+            ).fetchall()
+            for sha256, size in rows:
+                try:
+                    os.remove(self.path(sha256))
+                except FileNotFoundError:
+                    pass
+                self.conn.execute("DELETE FROM aliases WHERE sha256 = ?", (sha256,))
+                self.conn.execute("DELETE FROM blobs WHERE sha256 = ?", (sha256,))
+                removed["blobs"] += 1
+                removed["bytes"] += size
+                removed["sha256s"].append(sha256)
+        if removed["blobs"]:
+            logger.info(f"回收 {removed['blobs']} 个未引用的文件，释放 {removed['bytes']} 字节")
+        return removed
+
+    def usage(self) -> Dict[str, Any]:
+        """磁盘占用统计
+
+        bytes为实际占用，referenced_bytes为所有引用的内容大小之和(不去重时的占用)，
+        saved_bytes为去重节省的空间。
+        """
+        with self.lock:
+            blobs, stored, unreferenced, unreferenced_bytes = self.conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(refcount <= 0), 0), "
+                "COALESCE(SUM(CASE WHEN refcount <= 0 THEN size ELSE 0 END), 0) FROM blobs"
+            ).fetchone()
+            refs, referenced = self.conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(b.size), 0) FROM refs r JOIN blobs b ON b.sha256 = r.sha256"
+            ).fetchone()
+            aliases = self.conn.execute("SELECT COUNT(*) FROM aliases").fetchone()[0]
+        return {
+            "blobs": blobs,
+            "bytes": stored,
+            "refs": refs,
+            "referenced_bytes": referenced,
+            "saved_bytes": max(0, referenced - (stored - unreferenced_bytes)),
+            "unreferenced_blobs": unreferenced,
+            "unreferenced_bytes": unreferenced_bytes,
+            "aliases": aliases
+        }
+
+# 创建全局文件存储实例
+blob_store = BlobStore()
@@ -0,0 +1,344 @@
+import os
+import json
+import time
+import zlib
+import copy
+import asyncio
+import sqlite3
+import hashlib
+import threading
+import logging
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Any, Tuple, Callable, Awaitable
+
+# 配置日志
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("cache")
+
+class SqliteCache:
+    """基于SQLite的持久化键值缓存
+
+    值以JSON序列化并用zlib压缩后存储，总大小超过max_bytes时按最近访问时间
+    淘汰(LRU)，淘汰到上限的90%为止。可在多个线程中使用。
+
+    缓存文件由API进程和工作进程共享，总大小保存在meta表中，与写入和淘汰在同一个
+    BEGIN IMMEDIATE事务中更新，各进程看到的都是整个文件的大小。
+    """
+
+    def __init__(self, path: str, max_bytes: int, name: str = "cache"):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.name = name
+        self.lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                value BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_accessed ON entries (accessed_at)")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value INTEGER NOT NULL
+            )
+        """)
+        # 旧版本的缓存文件没有meta表，按现有条目初始化总大小
+        with self._transaction():
+            self.conn.execute(
+                "INSERT OR IGNORE INTO meta (key, value) SELECT 'total_bytes', COALESCE(SUM(size), 0) FROM entries"
+            )
+
+    @contextmanager
+    def _transaction(self):
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield
+                self.conn.execute("COMMIT")
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def _add_bytes(self, delta: int) -> int:
+        """调整总大小并返回调整后的值，调用方需在写事务中"""
+        self.conn.execute("UPDATE meta SET value = value + ? WHERE key = 'total_bytes'", (delta,))
+        return self.conn.execute("SELECT value FROM meta WHERE key = 'total_bytes'").fetchone()[0]
+
+    @property
+    def total_bytes(self) -> int:
+        with self.lock:
+            return self.conn.execute("SELECT value FROM meta WHERE key = 'total_bytes'").fetchone()[0]
+
+    def get(self, key: str) -> Optional[Any]:
+        """读取缓存，未命中时返回None"""
+        entry = self.get_entry(key)
+        return entry[0] if entry else None
+
+    def get_entry(self, key: str) -> Optional[Tuple[Any, float]]:
+        """读取缓存值及其写入时间，未命中时返回None"""
+        with self.lock:
+            row = self.conn.execute("SELECT value, created_at FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.conn.execute("UPDATE entries SET accessed_at = ? WHERE key = ?", (time.time(), key))
+            self.hits += 1
+        return json.loads(zlib.decompress(row[0]).decode("utf-8")), row[1]
+
+    def set(self, key: str, value: Any, created_at: Optional[float] = None):
+        """写入缓存"""
+        blob = zlib.compress(json.dumps(value, ensure_ascii=False).encode("utf-8"))
+        now = time.time()
+        created_at = created_at or now
+        with self._transaction():
+            old = self.conn.execute("SELECT size FROM entries WHERE key = ?", (key,)).fetchone()
+            self.conn.execute(
+                "INSERT OR REPLACE INTO entries (key, value, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, blob, len(blob), created_at, now)
+            )
+            total_bytes = self._add_bytes(len(blob) - (old[0] if old else 0))
+            if total_bytes > self.max_bytes:
+                self._evict(total_bytes)
+
+    def delete(self, key: str):
+        """删除缓存项"""
+        with self._transaction():
+            row = self.conn.execute("SELECT size FROM entries WHERE key = ?", (key,)).fetchone()
+            if row:
+                self.conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self._add_bytes(-row[0])
+
+    def _evict(self, total_bytes: int):
+        """按最近访问时间淘汰，直到总大小降到上限的90%，调用方需在写事务中"""
+        target = int(self.max_bytes * 0.9)
+        rows = self.conn.execute("SELECT key, size FROM entries ORDER BY accessed_at").fetchall()
+        evicted = []
+        freed = 0
+        for key, size in rows:
+            if total_bytes - freed <= target:
+                break
+            evicted.append((key,))
+            freed += size
+        self.conn.executemany("DELETE FROM entries WHERE key = ?", evicted)
+        self._add_bytes(-freed)
+        self.evictions += len(evicted)
+        logger.info(f"{self.name} 淘汰 {len(evicted)} 条缓存")
+
+    def stats(self) -> Dict[str, Any]:
+        """获取命中率等统计信息"""
+        with self.lock:
+            entries = self.conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+            lookups = self.hits + self.misses
+            return {
+                "entries": entries,
+                "bytes": self.total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions
+            }
+
+class TieredCache:
+    """内存LRU + SQLite两级缓存，支持TTL、过期后后台刷新和并发请求合并
+
+    - 未过期(ttl内)的结果直接返回
+    - 已过期但在stale_ttl宽限期内的结果先返回旧值，同时在后台刷新
+    - 同一事件循环中对同一键的并发加载只执行一次(single-flight)
+    ttl为None时缓存项永不过期，仅受容量限制。返回值均为深拷贝，调用方可以随意修改。
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_bytes: int,
+        memory_entries: int = 256,
+        ttl: Optional[float] = None,
+        stale_ttl: float = 0,
+        name: str = "cache"
+    ):
+        self.disk = SqliteCache(path, max_bytes, name=name)
+        self.memory: "OrderedDict[str, Tuple[Any, float]]" = OrderedDict()
+        self.memory_entries = memory_entries
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.name = name
+        self.in_flight: Dict[str, asyncio.Future] = {}
+        self.background: set = set()
+        self.lock = threading.RLock()
+        self.memory_hits = 0
+        self.stale_hits = 0
+        self.coalesced = 0
+
+    def _remember(self, key: str, entry: Tuple[Any, float]):
+        with self.lock:
+            self.memory[key] = entry
+            self.memory.move_to_end(key)
+            while len(self.memory) > self.memory_entries:
+                self.memory.popitem(last=False)
+
+    def _lookup(self, key: str) -> Optional[Tuple[Any, float]]:
+        """依次查询内存和磁盘"""
+        with self.lock:
+            entry = self.memory.get(key)
+            if entry is not None:
+                self.memory.move_to_end(key)
+                self.memory_hits += 1
+                return entry
+        entry = self.disk.get_entry(key)
+        if entry is not None:
+            self._remember(key, entry)
+        return entry
+
+    def _age_state(self, created_at: float) -> str:
+        """根据写入时间判断缓存状态: fresh / stale / expired"""
+        if self.ttl is None:
+            return "fresh"
+        age = time.time() - created_at
+        if age < self.ttl:
+            return "fresh"
+        if age < self.ttl + self.stale_ttl:
+            return "stale"
+        return "expired"
+
+    def peek(self, key: str) -> Optional[Any]:
+        """读取未过期的缓存值，不触发加载"""
+        entry = self._lookup(key)
+        if entry is not None and self._age_state(entry[1]) == "fresh":
+            return copy.deepcopy(entry[0])
+        return None
+
+    def put(self, key: str, value: Any):
+        """写入两级缓存"""
+        entry = (value, time.time())
+        self._remember(key, entry)
+        self.disk.set(key, value, created_at=entry[1])
+
+    async def get_or_load(
+        self,
+        key: str,
+        loader: Callable[[], Awaitable[Any]],
+        should_cache: Callable[[Any], bool] = bool
+    ) -> Any:
+        """读取缓存，未命中时调用loader加载；should_cache返回False的结果不写入缓存"""
+        entry = await asyncio.to_thread(self._lookup, key)
+        if entry is not None:
+            state = self._age_state(entry[1])
+            if state == "fresh":
+                return copy.deepcopy(entry[0])
+            if state == "stale":
+                with self.lock:
+                    self.stale_hits += 1
+                self._refresh_in_background(key, loader, should_cache)
+                return copy.deepcopy(entry[0])
+
+        return copy.deepcopy(await self._load(key, loader, should_cache))
+
+    async def _load(self, key: str, loader: Callable[[], Awaitable[Any]], should_cache: Callable[[Any], bool]) -> Any:
+        """合并同一键的并发加载"""
+        loop = asyncio.get_running_loop()
+        with self.lock:
+            pending = self.in_flight.get(key)
+            if pending is not None and pending.get_loop() is loop:
+                self.coalesced += 1
+            else:
+                pending = None
+                future = loop.create_future()
+                self.in_flight[key] = future
+
+        if pending is not None:
+            return await asyncio.shield(pending)
+
+        try:
+            value = await loader()
+            if should_cache(value):
+                await asyncio.to_thread(self.put, key, value)
+            future.set_result(value)
+            return value
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # 避免没有其他等待者时出现"exception was never retrieved"警告
+            future.exception()
+            raise
+        finally:
+            with self.lock:
+                if self.in_flight.get(key) is future:
+                    del self.in_flight[key]
+
+    def _refresh_in_background(self, key: str, loader: Callable[[], Awaitable[Any]], should_cache: Callable[[Any], bool]):
+        """在后台刷新过期缓存"""
+        with self.lock:
+            if key in self.in_flight:
+                return
+
+        async def refresh():
+            try:
+                await self._load(key, loader, should_cache)
+            except Exception as e:
+                logger.warning(f"{self.name} 后台刷新失败: {str(e)}")
+
+        task = asyncio.create_task(refresh())
+        self.background.add(task)
+        task.add_done_callback(self.background.discard)
+
+    def stats(self) -> Dict[str, Any]:
+        """获取统计信息"""
+        stats = self.disk.stats()
+        with self.lock:
+            hits = stats["hits"] + self.memory_hits
+            lookups = hits + stats["misses"]
+            stats.update({
+                "hits": hits,
+                "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+                "memory_entries": len(self.memory),
+                "memory_hits": self.memory_hits,
+                "stale_hits": self.stale_hits,
+                "coalesced": self.coalesced
+            })
+        return stats
+
+class FileHasher:
+    """计算文件SHA-256，按(路径, 修改时间, 大小)记忆结果避免重复读取"""
+
+    def __init__(self, max_entries: int = 10000):
+        self.max_entries = max_entries
+        self.memo: Dict[str, tuple] = {}
+        self.lock = threading.Lock()
+
+    def sha256(self, file_path: str) -> str:
+        st = os.stat(file_path)
+        signature = (st.st_mtime_ns, st.st_size)
+        with self.lock:
+            memo = self.memo.get(file_path)
+            if memo and memo[0] == signature:
+                return memo[1]
+
+        digest = hashlib.sha256()
+        with open(file_path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+        result = digest.hexdigest()
+
+        with self.lock:
+            if len(self.memo) >= self.max_entries:
+                self.memo.clear()
+            self.memo[file_path] = (signature, result)
+        return result
+
+# 创建全局文件哈希实例
+file_hasher = FileHasher()
@@ -27,11 +27,106 @@ elif os.getenv("USE_DOUBAO_PRO", "").lower() in ("true", "1", "yes"):
 # arXiv API配置
 ARXIV_RESULTS_PER_QUERY = 5
 ARXIV_SORT_BY = "relevance"  # 可选: relevance, lastUpdatedDate, submittedDate
+ARXIV_API_URL = os.getenv("ARXIV_API_URL", "http://export.arxiv.org/api/query?{}")  # {}处填入查询参数
 
 # 本地文件存储
-DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data")
+DATA_DIR = os.getenv("DATA_DIR", os.path.join(os.path.dirname(os.path.dirname(__file__)), "data"))
 PDF_DIR = os.path.join(DATA_DIR, "pdfs")
 os.makedirs(PDF_DIR, exist_ok=True)
+UPLOAD_DIR = os.path.join(DATA_DIR, "uploads")
+os.makedirs(UPLOAD_DIR, exist_ok=True)
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(50 * 1024 * 1024)))  # 单个上传文件的大小上限
 
 # 数据库清理设置 (24小时)
 DATA_RETENTION_HOURS = 24
+RETENTION_INTERVAL = int(os.getenv("RETENTION_INTERVAL", "3600"))        # 清理间隔(秒)
+RETENTION_BATCH_SIZE = int(os.getenv("RETENTION_BATCH_SIZE", "100"))     # 每批删除的项目/文件数
+RETENTION_MAX_BATCHES = int(os.getenv("RETENTION_MAX_BATCHES", "50"))    # 每次清理最多执行的批数，剩余的留到下一次
+
+# 按内容寻址的文件存储(论文PDF和上传文件)
+BLOB_DIR = os.getenv("BLOB_DIR", os.path.join(DATA_DIR, "blobs"))
+BLOB_GC_GRACE_HOURS = float(os.getenv("BLOB_GC_GRACE_HOURS", str(DATA_RETENTION_HOURS)))  # 未被项目引用的文件保留时间
+
+# 出站HTTP连接池配置 (所有方舟API和arXiv请求共享)
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "20"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "10"))
+HTTP2_ENABLED = os.getenv("HTTP2_ENABLED", "true").lower() in ("true", "1", "yes")
+
+# 论文PDF下载配置
+DOWNLOAD_CONCURRENCY = int(os.getenv("DOWNLOAD_CONCURRENCY", "4"))          # 同时下载的最大数量
+DOWNLOAD_HOST_INTERVAL = float(os.getenv("DOWNLOAD_HOST_INTERVAL", "0.5"))  # 同一主机两次请求的最小间隔(秒)
+DOWNLOAD_MAX_RETRIES = int(os.getenv("DOWNLOAD_MAX_RETRIES", "3"))
+DOWNLOAD_RETRY_BACKOFF = float(os.getenv("DOWNLOAD_RETRY_BACKOFF", "1.0"))   # 重试退避基数(秒)
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+# 论文处理流水线配置
+EXTRACTION_WORKERS = int(os.getenv("EXTRACTION_WORKERS", str(min(4, os.cpu_count() or 1))))  # PDF提取进程数
+PIPELINE_QUORUM_RATIO = float(os.getenv("PIPELINE_QUORUM_RATIO", "0.8"))   # 达到该比例的论文就绪后开始生成
+PIPELINE_GRACE_SECONDS = float(os.getenv("PIPELINE_GRACE_SECONDS", "5"))   # 达到法定数量后等待剩余论文的时间
+
+# PDF文本提取配置
+EXTRACTION_PAGES_PER_TASK = int(os.getenv("EXTRACTION_PAGES_PER_TASK", "8"))     # 每个子任务处理的页数
+EXTRACTION_TIME_BUDGET = float(os.getenv("EXTRACTION_TIME_BUDGET", "15"))        # 每个文档的最长耗时(秒)
+EXTRACTION_CPU_BUDGET = float(os.getenv("EXTRACTION_CPU_BUDGET", "10"))          # 每个子任务的最长CPU时间(秒)
+
+# 缓存配置
+CACHE_DIR = os.path.join(DATA_DIR, "cache")
+os.makedirs(CACHE_DIR, exist_ok=True)
+EXTRACTION_CACHE_MAX_BYTES = int(os.getenv("EXTRACTION_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))  # 压缩后的最大占用
+SEARCH_CACHE_TTL = float(os.getenv("SEARCH_CACHE_TTL", str(6 * 3600)))             # arXiv搜索结果有效期(秒)
+SEARCH_CACHE_STALE_TTL = float(os.getenv("SEARCH_CACHE_STALE_TTL", str(24 * 3600)))  # 过期后仍可返回旧结果的宽限期(秒)
+SEARCH_CACHE_MEMORY_ENTRIES = int(os.getenv("SEARCH_CACHE_MEMORY_ENTRIES", "256"))
+SEARCH_CACHE_MAX_BYTES = int(os.getenv("SEARCH_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+TRANSLATION_CACHE_MEMORY_ENTRIES = int(os.getenv("TRANSLATION_CACHE_MEMORY_ENTRIES", "1024"))
+TRANSLATION_CACHE_MAX_BYTES = int(os.getenv("TRANSLATION_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+
+# 项目存储后端: sqlite 或 json (每个项目一个目录)
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "sqlite").lower()
+SQLITE_DB_PATH = os.getenv("SQLITE_DB_PATH", os.path.join(DATA_DIR, "projects.db"))
+PROJECT_FLUSH_INTERVAL = float(os.getenv("PROJECT_FLUSH_INTERVAL", "1.0"))  # 项目状态批量写入间隔(秒)
+STORAGE_IO_THREADS = int(os.getenv("STORAGE_IO_THREADS", "4"))  # 异步接口读取项目数据的I/O线程数
+
+# 任务调度配置
+SCHEDULER_MAX_CONCURRENT = int(os.getenv("SCHEDULER_MAX_CONCURRENT", "4"))   # 同时运行的最大任务数
+SCHEDULER_MAX_QUEUE = int(os.getenv("SCHEDULER_MAX_QUEUE", "50"))            # 等待队列上限，超过后拒绝新任务
+TASK_RECORD_TTL = float(os.getenv("TASK_RECORD_TTL", "3600"))            # 已结束任务记录的保留时间(秒)
+TASK_MAX_FINISHED = int(os.getenv("TASK_MAX_FINISHED", "10000"))         # 最多保留的已结束任务记录数
+
+# 持久化任务队列配置
+JOB_DB_PATH = os.getenv("JOB_DB_PATH", os.path.join(DATA_DIR, "jobs.db"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))   # 任务最多执行次数(含重启后恢复)
+# 任务执行方式: inline(在API进程内执行) 或 worker(由独立的worker.py进程执行)
+JOB_EXECUTION_MODE = os.getenv("JOB_EXECUTION_MODE", "inline")
+JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", "60"))            # 任务租约时长，过期未续约的任务可被其他进程接管
+JOB_HEARTBEAT_INTERVAL = int(os.getenv("JOB_HEARTBEAT_INTERVAL", "15"))  # 续约间隔
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1.0"))         # 空闲时查询任务队列的间隔(秒)
+
+# 方案生成提示词的上下文配置
+CONTEXT_WINDOW_TOKENS = int(os.getenv("CONTEXT_WINDOW_TOKENS", "32000"))  # 模型上下文窗口
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "8000"))     # 论文信息最多占用的token数
+CONTEXT_CHUNK_TOKENS = int(os.getenv("CONTEXT_CHUNK_TOKENS", "300"))      # 论文正文切分的段落大小
+
+# 本地论文全文索引配置
+CORPUS_DB_PATH = os.getenv("CORPUS_DB_PATH", os.path.join(DATA_DIR, "corpus.db"))
+CORPUS_MIN_COVERAGE = float(os.getenv("CORPUS_MIN_COVERAGE", "0.6"))  # 论文需要匹配的检索词比例
+CORPUS_SKIP_SEARCH = os.getenv("CORPUS_SKIP_SEARCH", "true").lower() in ("true", "1", "yes")  # 本地论文足够时跳过arXiv搜索
+
+# 论文片段和历史项目的语义索引配置(哈希n-gram向量)
+EMBEDDING_DIR = os.getenv("EMBEDDING_DIR", os.path.join(DATA_DIR, "embeddings"))
+EMBEDDING_DIM = int(os.getenv("EMBEDDING_DIM", "512"))
+EMBEDDING_PAPER_THRESHOLD = float(os.getenv("EMBEDDING_PAPER_THRESHOLD", "0.3"))       # 复用论文片段的最低相似度
+EMBEDDING_PROJECT_THRESHOLD = float(os.getenv("EMBEDDING_PROJECT_THRESHOLD", "0.5"))   # 复用历史项目论文的最低相似度
+EMBEDDING_PROPOSAL_THRESHOLD = float(os.getenv("EMBEDDING_PROPOSAL_THRESHOLD", "0.95"))  # 直接复用历史方案的最低相似度，大于1时关闭
+
+# 技术方案结果缓存配置
+PROPOSAL_CACHE_DB_PATH = os.getenv("PROPOSAL_CACHE_DB_PATH", os.path.join(DATA_DIR, "proposals.db"))
+PROPOSAL_CACHE_TTL = float(os.getenv("PROPOSAL_CACHE_TTL", "21600"))  # 相同请求直接返回缓存结果的有效期(秒)，0表示关闭
+
+# 上传文档解析配置
+DOCUMENT_DB_PATH = os.getenv("DOCUMENT_DB_PATH", os.path.join(DATA_DIR, "documents.db"))
+DOCUMENT_TIME_BUDGET = float(os.getenv("DOCUMENT_TIME_BUDGET", "120"))           # 每个上传文档的最长解析时间(秒)
+DOCUMENT_INGEST_CONCURRENCY = int(os.getenv("DOCUMENT_INGEST_CONCURRENCY", "2"))  # 每个进程同时解析的文档数
+DOCUMENT_WAIT_SECONDS = float(os.getenv("DOCUMENT_WAIT_SECONDS", "30"))          # 生成方案前等待上传文档解析完成的最长时间
+DOCUMENT_CONTEXT_CHUNKS = int(os.getenv("DOCUMENT_CONTEXT_CHUNKS", "16"))         # 从上传文档中选取的候选片段数
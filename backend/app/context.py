@@ -0,0 +1,198 @@
+import re
+import math
+import logging
+from collections import Counter
+from typing import Dict, List, Optional, Any, Tuple
+
+from .config import CONTEXT_WINDOW_TOKENS, CONTEXT_TOKEN_BUDGET, CONTEXT_CHUNK_TOKENS
+
+# 配置日志
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("context")
+
+CJK_PATTERN = re.compile(r"[\u4e00-\u9fff]")
+WORD_PATTERN = re.compile(r"[a-z0-9]+")
+
+# 常见英文虚词，不参与相关性计算
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or that the this to was were "
+    "which with we our these those can using based via into than then also such".split()
+)
+
+# 每篇论文最多列出的作者数
+MAX_AUTHORS = 3
+
+def estimate_tokens(text: str) -> int:
+    """估算token数: 中文约每字1个token，其他字符约每4个字符1个token"""
+    if not text:
+        return 0
+    cjk = len(CJK_PATTERN.findall(text))
+    return cjk + math.ceil((len(text) - cjk) / 4)
+
+def tokenize(text: str) -> List[str]:
+    """切分检索词: 英文按单词(去掉虚词)，中文按相邻两字"""
+    text = text.lower()
+    terms = [word for word in WORD_PATTERN.findall(text) if word not in STOPWORDS and len(word) > 1]
+    for run in re.findall(r"[\u4e00-\u9fff]+", text):
+        terms.extend(run[i:i + 2] for i in range(max(1, len(run) - 1)))
+    return terms
+
+def split_chunks(text: str, chunk_tokens: int = CONTEXT_CHUNK_TOKENS) -> List[str]:
+    """按段落把正文切成约chunk_tokens大小的片段，过长的段落按句子切分"""
+    pieces = []
+    for paragraph in re.split(r"\n\s*\n", text):
+        paragraph = re.sub(r"\s+", " ", paragraph).strip()
+        if not paragraph:
+            continue
+        if estimate_tokens(paragraph) <= chunk_tokens:
+            pieces.append(paragraph)
+        else:
+            pieces.extend(s for s in re.split(r"(?<=[.!?。！？])\s*", paragraph) if s)
+
+    chunks, current, current_tokens = [], [], 0
+    for piece in pieces:
+        tokens = estimate_tokens(piece)
+        if current and current_tokens + tokens > chunk_tokens:
+            chunks.append(" ".join(current))
+            current, current_tokens = [], 0
+        if tokens > chunk_tokens:
+            # 没有句子边界的超长文本按字符截断
+            step = chunk_tokens * 4
+            chunks.extend(piece[i:i + step] for i in range(0, len(piece), step))
+            continue
+        current.append(piece)
+        current_tokens += tokens
+    if current:
+        chunks.append(" ".join(current))
+    return chunks
+
+class BM25:
+    """BM25相关性评分"""
+
+    def __init__(self, documents: List[List[str]], k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.term_freqs = [Counter(doc) for doc in documents]
+        self.lengths = [len(doc) for doc in documents]
+        self.avg_length = sum(self.lengths) / len(documents) if documents else 0.0
+        doc_freqs = Counter(term for freqs in self.term_freqs for term in freqs)
+        total = len(documents)
+        self.idf = {term: math.log(1 + (total - df + 0.5) / (df + 0.5)) for term, df in doc_freqs.items()}
+
+    def score(self, query: List[str], index: int) -> float:
+        freqs = self.term_freqs[index]
+        norm = self.k1 * (1 - self.b + self.b * self.lengths[index] / (self.avg_length or 1))
+        score = 0.0
+        for term in set(query):
+            tf = freqs.get(term)
+            if tf:
+                score += self.idf[term] * tf * (self.k1 + 1) / (tf + norm)
+        return score
+
+def context_budget(max_tokens: int, reserved_tokens: int) -> int:
+    """论文信息可用的token数: 不超过配置的预算，也不超出上下文窗口的剩余空间"""
+    return max(0, min(CONTEXT_TOKEN_BUDGET, CONTEXT_WINDOW_TOKENS - max_tokens - reserved_tokens))
+
+def paper_header(index: int, paper: Dict[str, Any], summary_tokens: Optional[int] = None) -> str:
+    """论文的标题、作者和摘要"""
+    authors = paper.get("authors") or []
+    author_text = ", ".join(authors[:MAX_AUTHORS]) + (" 等" if len(authors) > MAX_AUTHORS else "")
+    summary = paper.get("summary", "")
+    if summary_tokens is not None and estimate_tokens(summary) > summary_tokens:
+        summary = summary[:summary_tokens * 4].rsplit(" ", 1)[0] + "..."
+    return f"论文 {index + 1}:\n标题: {paper['title']}\n作者: {author_text}\n摘要: {summary}\n"
+
+def document_header(index: int, document: Dict[str, Any]) -> str:
+    """用户上传文档的标题"""
+    return f"上传文档 {index + 1}: {document['filename']}\n"
+
+def pack_context(
+    query: str,
+    papers: List[Dict[str, Any]],
+    extracted_contents: Optional[List[str]],
+    budget: int,
+    documents: Optional[List[Dict[str, Any]]] = None
+) -> Tuple[str, Dict[str, Any]]:
+    """在token预算内组织论文信息
+
+    每篇论文的标题、作者和摘要总是保留(预算不足时截短摘要)，剩余预算按BM25相关性
+    从所有论文的正文片段中挑选。同一论文已入选的片段越多，其余片段的得分折扣越大，
+    避免预算集中在一篇论文上。入选片段按原文顺序排列。
+    documents为用户上传文档[{"filename", "chunks"}]，其片段(已切分)与论文片段一起参与挑选，
+    排在所有论文之后。
+
+    返回(论文信息文本, 统计信息)
+    """
+    headers = [paper_header(i, paper) for i, paper in enumerate(papers)]
+    header_tokens = sum(estimate_tokens(h) for h in headers)
+    if header_tokens > budget and papers:
+        # 预算不足时平均截短每篇论文的摘要
+        summary_tokens = max(20, budget // len(papers) - 40)
+        headers = [paper_header(i, paper, summary_tokens) for i, paper in enumerate(papers)]
+        header_tokens = sum(estimate_tokens(h) for h in headers)
+    documents = documents or []
+    document_headers = [document_header(i, document) for i, document in enumerate(documents)]
+    headers += document_headers
+    header_tokens += sum(estimate_tokens(h) for h in document_headers)
+
+    chunks: List[Tuple[int, int, str]] = []  # (来源序号, 片段序号, 文本)，上传文档的序号排在论文之后
+    for i, content in enumerate(extracted_contents or []):
+        if i >= len(papers) or not content or content == papers[i].get("summary"):
+            continue
+        chunks.extend((i, j, chunk) for j, chunk in enumerate(split_chunks(content)))
+    for i, document in enumerate(documents):
+        chunks.extend((len(papers) + i, j, chunk) for j, chunk in enumerate(document.get("chunks") or []))
+
+    selected: Dict[int, List[Tuple[int, str]]] = {}
+    remaining = budget - header_tokens
+    if chunks and remaining > 0:
+        bm25 = BM25([tokenize(text) for _, _, text in chunks])
+        query_terms = tokenize(query)
+        scores = [bm25.score(query_terms, k) for k in range(len(chunks))]
+        candidates = set(range(len(chunks)))
+        while candidates and remaining > 0:
+            # 得分相同时优先论文靠前的片段，没有匹配时相当于按原文顺序轮流选取
+            best = max(candidates, key=lambda k: (
+                scores[k] / (1 + 0.5 * len(selected.get(chunks[k][0], []))),
+                -len(selected.get(chunks[k][0], [])),
+                -chunks[k][1],
+                -chunks[k][0]
+            ))
+            candidates.discard(best)
+            paper_index, chunk_index, text = chunks[best]
+            # 片段分隔符和每篇论文的"内容摘录"标题也计入预算
+            tokens = estimate_tokens(text) + (2 if paper_index in selected else 4)
+            if tokens > remaining:
+                continue
+            selected.setdefault(paper_index, []).append((chunk_index, text))
+            remaining -= tokens
+
+    sections = []
+    paper_stats = []
+    document_stats = []
+    for i, header in enumerate(headers):
+        picked = sorted(selected.get(i, []))
+        section = header
+        if picked:
+            section += "内容摘录:\n" + "\n...\n".join(text for _, text in picked) + "\n"
+        sections.append(section)
+        if i < len(papers):
+            paper_stats.append({"id": papers[i].get("id"), "chunks": len(picked), "tokens": estimate_tokens(section)})
+        else:
+            document_stats.append({
+                "filename": documents[i - len(papers)]["filename"],
+                "chunks": len(picked),
+                "tokens": estimate_tokens(section)
+            })
+
+    text = "\n\n".join(sections)
+    stats = {
+        "budget": budget,
+        "context_tokens": estimate_tokens(text),
+        "chunks_total": len(chunks),
+        "chunks_selected": sum(len(v) for v in selected.values()),
+        "papers": paper_stats
+    }
+    if documents:
+        stats["documents"] = document_stats
+    return text, stats
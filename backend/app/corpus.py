@@ -0,0 +1,179 @@
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+import logging
+from typing import Dict, List, Optional, Any
+
+from .config import CORPUS_DB_PATH, CORPUS_MIN_COVERAGE
+from .context import tokenize, split_chunks
+
+# 配置日志
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("corpus")
+
+# 检索时最多读取的片段数
+MAX_CANDIDATE_PASSAGES = 200
+
+class PaperCorpus:
+    """本地论文全文索引
+
+    基于SQLite FTS5倒排索引，保存所有处理过的论文的元数据和正文片段。
+    论文内容提取完成后增量加入索引，相同内容不重复索引。
+    检索词使用与上下文选取相同的切分规则(英文单词、中文相邻两字)，
+    预先切分后写入索引，不依赖FTS5的分词器。片段原文保存在普通表中，按论文ID索引。
+    """
+
+    def __init__(self, db_path: str = CORPUS_DB_PATH):
+        self.db_path = db_path
+        self.lock = threading.RLock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS papers (
+                id TEXT PRIMARY KEY,
+                metadata TEXT NOT NULL,
+                content_hash TEXT NOT NULL,
+                chunks INTEGER NOT NULL,
+                indexed_at REAL NOT NULL
+            )
+        """)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS chunks (
+                rowid INTEGER PRIMARY KEY,
+                paper_id TEXT NOT NULL,
+                chunk INTEGER NOT NULL,
+                text TEXT NOT NULL,
+                terms TEXT NOT NULL
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_chunks_paper ON chunks (paper_id, chunk)")
+        # 倒排索引只保存检索词，片段原文保存在chunks表中
+        self.conn.execute("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS passages USING fts5(
+                terms, content='chunks', content_rowid='rowid'
+            )
+        """)
+
+    def add_paper(self, paper: Dict[str, Any], content: str) -> bool:
+        """把论文加入索引，内容未变化时跳过，返回是否写入"""
+        if not content or not paper.get("id"):
+            return False
+        content_hash = hashlib.sha256(content.encode("utf-8")).hexdigest()
+        metadata = {k: paper.get(k) for k in ("id", "title", "authors", "summary", "published", "pdf_url")}
+        # 标题和摘要作为第0个片段，正文片段从1开始
+        chunks = [f"{paper.get('title', '')}. {paper.get('summary', '')}"] + split_chunks(content)
+
+        with self.lock:
+            row = self.conn.execute("SELECT content_hash FROM papers WHERE id = ?", (paper["id"],)).fetchone()
+            if row and row[0] == content_hash:
+                return False
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                # 删除旧片段，外部内容的FTS5表需要显式删除对应的索引项
+                old_rows = self.conn.execute(
+                    "SELECT rowid, terms FROM chunks WHERE paper_id = ?", (paper["id"],)
+                ).fetchall()
+                self.conn.executemany(
+                    "INSERT INTO passages (passages, rowid, terms) VALUES ('delete', ?, ?)", old_rows
+                )
+                self.conn.execute("DELETE FROM chunks WHERE paper_id = ?", (paper["id"],))
+                for i, text in enumerate(chunks):
+                    terms = " ".join(tokenize(text))
+                    cursor = self.conn.execute(
+                        "INSERT INTO chunks (paper_id, chunk, text, terms) VALUES (?, ?, ?, ?)",
+                        (paper["id"], i, text, terms)
+                    )
+                    self.conn.execute("INSERT INTO passages (rowid, terms) VALUES (?, ?)", (cursor.lastrowid, terms))
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO papers (id, metadata, content_hash, chunks, indexed_at) VALUES (?, ?, ?, ?, ?)",
+                    (paper["id"], json.dumps(metadata, ensure_ascii=False), content_hash, len(chunks), time.time())
+                )
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        logger.info(f"论文 {paper['id']} 已加入本地索引 ({len(chunks)} 个片段)")
+        return True
+
+    def _match_expression(self, terms: List[str]) -> str:
+        return " OR ".join(f'"{term}"' for term in sorted(set(terms)))
+
+    def search(self, query: str, limit: int = 10) -> List[Dict[str, Any]]:
+        """检索与query最相关的正文片段"""
+        terms = tokenize(query)
+        if not terms:
+            return []
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT c.paper_id, c.chunk, c.text, bm25(passages) FROM passages "
+                "JOIN chunks c ON c.rowid = passages.rowid WHERE passages MATCH ? "
+                "ORDER BY rank LIMIT ?",
+                (self._match_expression(terms), limit)
+            ).fetchall()
+            titles = self._titles({row[0] for row in rows})
+        return [
+            {"paper_id": paper_id, "title": titles.get(paper_id), "chunk": chunk, "text": text, "score": round(-score, 4)}
+            for paper_id, chunk, text, score in rows
+        ]
+
+    def _titles(self, paper_ids) -> Dict[str, str]:
+        if not paper_ids:
+            return {}
+        ids = list(paper_ids)
+        rows = self.conn.execute(
+            f"SELECT id, metadata FROM papers WHERE id IN ({','.join('?' * len(ids))})", ids
+        ).fetchall()
+        return {paper_id: json.loads(metadata).get("title") for paper_id, metadata in rows}
+
+    def find_papers(self, query: str, limit: int, min_coverage: float = CORPUS_MIN_COVERAGE) -> List[Dict[str, Any]]:
+        """查找覆盖query的本地论文
+
+        论文的覆盖率为其片段中出现的检索词占全部检索词的比例，只返回覆盖率不低于
+        min_coverage的论文，按覆盖率和BM25得分排序。返回的论文带有正文content。
+        """
+        terms = set(tokenize(query))
+        if not terms:
+            return []
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT c.paper_id, c.terms, bm25(passages) FROM passages "
+                "JOIN chunks c ON c.rowid = passages.rowid WHERE passages MATCH ? "
+                "ORDER BY rank LIMIT ?",
+                (self._match_expression(list(terms)), MAX_CANDIDATE_PASSAGES)
+            ).fetchall()
+
+        matched: Dict[str, set] = {}
+        scores: Dict[str, float] = {}
+        for paper_id, passage_terms, score in rows:
+            matched.setdefault(paper_id, set()).update(terms.intersection(passage_terms.split()))
+            scores[paper_id] = scores.get(paper_id, 0.0) - score
+
+        ranked = sorted(
+            (paper_id for paper_id in matched if len(matched[paper_id]) / len(terms) >= min_coverage),
+            key=lambda paper_id: (len(matched[paper_id]), scores[paper_id]),
+            reverse=True
+        )[:limit]
+        return [dict(self.get_paper(paper_id), coverage=round(len(matched[paper_id]) / len(terms), 3)) for paper_id in ranked]
+
+    def get_paper(self, paper_id: str) -> Optional[Dict[str, Any]]:
+        """获取论文元数据和正文(按片段顺序拼接)"""
+        with self.lock:
+            row = self.conn.execute("SELECT metadata FROM papers WHERE id = ?", (paper_id,)).fetchone()
+            if row is None:
+                return None
+            chunks = self.conn.execute(
+                "SELECT text FROM chunks WHERE paper_id = ? AND chunk > 0 ORDER BY chunk", (paper_id,)
+            ).fetchall()
+        return dict(json.loads(row[0]), content="\n\n".join(text for (text,) in chunks))
+
+    def stats(self) -> Dict[str, Any]:
+        """获取索引规模"""
+        with self.lock:
+            papers = self.conn.execute("SELECT COUNT(*) FROM papers").fetchone()[0]
+            passages = self.conn.execute("SELECT COALESCE(SUM(chunks), 0) FROM papers").fetchone()[0]
+        return {"papers": papers, "passages": passages}
+
+# 创建全局论文索引实例
+corpus = PaperCorpus()
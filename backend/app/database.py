@@ -1,65 +1,457 @@
 import json
 import os
 import time
+import base64
+import asyncio
+import functools
+import heapq
 import shutil
-from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Any
+import sqlite3
+from datetime import datetime
+from typing import Dict, List, Optional, Any, Tuple, Callable
 import threading
 import uuid
+from concurrent.futures import ThreadPoolExecutor, Future
 
-from .config import DATA_DIR, DATA_RETENTION_HOURS
+from .config import DATA_DIR, STORAGE_BACKEND, SQLITE_DB_PATH, PROJECT_FLUSH_INTERVAL, STORAGE_IO_THREADS
+from .blobs import blob_store, paper_alias, project_owner
+from .retention import RetentionEngine, remove_tree
 
 # 确保数据目录存在
 os.makedirs(DATA_DIR, exist_ok=True)
 
-# 虚拟数据库 - 使用文件系统实现简单持久化
+# 进入这些状态时立即写入存储
+TERMINAL_STATUSES = ("completed", "failed")
+# 读取项目时与批量写入冲突的最大重试次数
+READ_RETRIES = 3
+
+def write_json_atomic(path: str, data: Any):
+    """先写临时文件再重命名，避免并发读取到写了一半的文件"""
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def encode_cursor(created_at: str, project_id: str) -> str:
+    """把分页位置编码为不透明的游标"""
+    return base64.urlsafe_b64encode(f"{created_at}|{project_id}".encode("utf-8")).decode("ascii")
+
+def decode_cursor(cursor: str) -> Tuple[str, str]:
+    """解析分页游标，返回(created_at, project_id)"""
+    created_at, project_id = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8").split("|", 1)
+    return created_at, project_id
+
+class StorageBackend:
+    """项目存储后端接口"""
+
+    def create(self, metadata: Dict[str, Any]):
+        raise NotImplementedError
+
+    def get_metadata(self, project_id: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def update(self, project_id: str, data: Dict[str, Any]) -> Dict[str, Any]:
+        """合并更新元数据并返回更新后的元数据"""
+        raise NotImplementedError
+
+    def update_many(self, updates: Dict[str, Dict[str, Any]]):
+        """批量合并更新多个项目"""
+        for project_id, data in updates.items():
+            self.update(project_id, data)
+
+    def get_result(self, project_id: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def save_result(self, project_id: str, result_data: Dict[str, Any]):
+        raise NotImplementedError
+
+    def list(self, limit: int, cursor: Optional[str] = None,
+             status: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """按创建时间倒序列出项目，返回(项目列表, 下一页游标)"""
+        raise NotImplementedError
+
+    def list_expired(self, before: str, limit: int) -> List[str]:
+        """按创建时间从早到晚返回最多limit个创建时间早于before的项目ID"""
+        raise NotImplementedError
+
+    def delete(self, project_id: str):
+        raise NotImplementedError
+
+    def delete_many(self, project_ids: List[str]) -> int:
+        """删除多个项目，返回释放的字节数"""
+        for project_id in project_ids:
+            self.delete(project_id)
+        return 0
+
+class JsonDirectoryBackend(StorageBackend):
+    """每个项目一个目录，元数据和结果分别保存为metadata.json和result.json
+
+    过期清理使用按(created_at, 项目ID)排序的最小堆，首次清理时扫描一次目录建立，之后随创建项目更新。
+    """
+
+    def __init__(self, projects_dir: str):
+        self.projects_dir = projects_dir
+        # 保护元数据的读-改-写
+        self.lock = threading.RLock()
+        self.expiry: Optional[List[Tuple[str, str]]] = None
+
+    def _meta_file(self, project_id: str) -> str:
+        return os.path.join(self.projects_dir, project_id, "metadata.json")
+
+    def create(self, metadata: Dict[str, Any]):
+        project_dir = os.path.join(self.projects_dir, metadata["id"])
+        os.makedirs(project_dir, exist_ok=True)
+        write_json_atomic(self._meta_file(metadata["id"]), metadata)
+        self._track(metadata)
+
+    def _track(self, metadata: Dict[str, Any]):
+        """把新项目加入过期索引"""
+        with self.lock:
+            if self.expiry is not None:
+                heapq.heappush(self.expiry, (metadata.get("created_at", ""), metadata["id"]))
+
+    def get_metadata(self, project_id: str) -> Optional[Dict[str, Any]]:
+        meta_file = self._meta_file(project_id)
+        if not os.path.exists(meta_file):
+            return None
+        with open(meta_file, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def update(self, project_id: str, data: Dict[str, Any]) -> Dict[str, Any]:
+        os.makedirs(os.path.join(self.projects_dir, project_id), exist_ok=True)
+        with self.lock:
+            metadata = self.get_metadata(project_id)
+            if metadata is None:
+                metadata = {"id": project_id, "created_at": datetime.now().isoformat()}
+                self._track(metadata)
+            metadata.update(data)
+            write_json_atomic(self._meta_file(project_id), metadata)
+        return metadata
+
+    def get_result(self, project_id: str) -> Optional[Dict[str, Any]]:
+        result_file = os.path.join(self.projects_dir, project_id, "result.json")
+        if not os.path.exists(result_file):
+            return None
+        with open(result_file, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def save_result(self, project_id: str, result_data: Dict[str, Any]):
+        project_dir = os.path.join(self.projects_dir, project_id)
+        os.makedirs(project_dir, exist_ok=True)
+        write_json_atomic(os.path.join(project_dir, "result.json"), result_data)
+
+    def _all_metadata(self) -> List[Dict[str, Any]]:
+        projects = []
+        for project_id in os.listdir(self.projects_dir):
+            metadata = self.get_metadata(project_id)
+            if metadata:
+                projects.append(metadata)
+        return projects
+
+    def list(self, limit: int, cursor: Optional[str] = None,
+             status: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        projects = self._all_metadata()
+        if status:
+            projects = [p for p in projects if p.get("status") == status]
+        projects.sort(key=lambda x: (x.get("created_at", ""), x.get("id", "")), reverse=True)
+        if cursor:
+            position = decode_cursor(cursor)
+            projects = [p for p in projects if (p.get("created_at", ""), p.get("id", "")) < position]
+        page = projects[:limit]
+        next_cursor = None
+        if len(projects) > limit:
+            next_cursor = encode_cursor(page[-1].get("created_at", ""), page[-1]["id"])
+        return page, next_cursor
+
+    def list_expired(self, before: str, limit: int) -> List[str]:
+        with self.lock:
+            if self.expiry is None:
+                self.expiry = [(p.get("created_at", "2000-01-01T00:00:00"), p["id"]) for p in self._all_metadata()]
+                heapq.heapify(self.expiry)
+            expired = []
+            while self.expiry and self.expiry[0][0] < before and len(expired) < limit:
+                _, project_id = heapq.heappop(self.expiry)
+                # 已经删除的项目直接跳过
+                if os.path.isdir(os.path.join(self.projects_dir, project_id)):
+                    expired.append(project_id)
+        return expired
+
+    def delete(self, project_id: str):
+        shutil.rmtree(os.path.join(self.projects_dir, project_id), ignore_errors=True)
+
+    def delete_many(self, project_ids: List[str]) -> int:
+        return sum(remove_tree(os.path.join(self.projects_dir, project_id)) for project_id in project_ids)
+
+class SqliteBackend(StorageBackend):
+    """SQLite存储后端(WAL模式)
+
+    元数据和结果以JSON保存，created_at和status单独成列并建立索引，
+    列表查询使用(created_at, id)游标分页，无需读取全部项目。
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self.lock = threading.RLock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS projects (
+                id TEXT PRIMARY KEY,
+                created_at TEXT NOT NULL,
+                updated_at TEXT,
+                status TEXT,
+                metadata TEXT NOT NULL,
+                result TEXT
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_projects_created ON projects (created_at DESC, id DESC)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_projects_status ON projects (status, created_at DESC, id DESC)")
+
+    def is_empty(self) -> bool:
+        with self.lock:
+            return self.conn.execute("SELECT 1 FROM projects LIMIT 1").fetchone() is None
+
+    def create(self, metadata: Dict[str, Any]):
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO projects (id, created_at, updated_at, status, metadata) VALUES (?, ?, ?, ?, ?)",
+                (metadata["id"], metadata.get("created_at", ""), metadata.get("updated_at"),
+                 metadata.get("status"), json.dumps(metadata, ensure_ascii=False))
+            )
+
+    def get_metadata(self, project_id: str) -> Optional[Dict[str, Any]]:
+        with self.lock:
+            row = self.conn.execute("SELECT metadata FROM projects WHERE id = ?", (project_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _merge(self, project_id: str, data: Dict[str, Any]) -> Dict[str, Any]:
+        """在当前事务中合并更新一个项目的元数据"""
+        row = self.conn.execute("SELECT metadata FROM projects WHERE id = ?", (project_id,)).fetchone()
+        metadata = json.loads(row[0]) if row else {"id": project_id, "created_at": datetime.now().isoformat()}
+        metadata.update(data)
+        self.conn.execute(
+            "INSERT INTO projects (id, created_at, updated_at, status, metadata) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT(id) DO UPDATE SET updated_at = excluded.updated_at, status = excluded.status, "
+            "metadata = excluded.metadata",
+            (project_id, metadata.get("created_at", ""), metadata.get("updated_at"),
+             metadata.get("status"), json.dumps(metadata, ensure_ascii=False))
+        )
+        return metadata
+
+    def update(self, project_id: str, data: Dict[str, Any]) -> Dict[str, Any]:
+        return self._transaction(lambda: self._merge(project_id, data))
+
+    def update_many(self, updates: Dict[str, Dict[str, Any]]):
+        self._transaction(lambda: [self._merge(project_id, data) for project_id, data in updates.items()])
+
+    def _transaction(self, func):
+        """在写事务中执行func，BEGIN IMMEDIATE获取写锁，保证读-改-写在多进程间也是原子的"""
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = func()
+                self.conn.execute("COMMIT")
+                return result
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def get_result(self, project_id: str) -> Optional[Dict[str, Any]]:
+        with self.lock:
+            row = self.conn.execute("SELECT result FROM projects WHERE id = ?", (project_id,)).fetchone()
+        return json.loads(row[0]) if row and row[0] else None
+
+    def save_result(self, project_id: str, result_data: Dict[str, Any]):
+        with self.lock:
+            self.conn.execute(
+                "UPDATE projects SET result = ? WHERE id = ?",
+                (json.dumps(result_data, ensure_ascii=False), project_id)
+            )
+
+    def list(self, limit: int, cursor: Optional[str] = None,
+             status: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        conditions, params = [], []
+        if status:
+            conditions.append("status = ?")
+            params.append(status)
+        if cursor:
+            conditions.append("(created_at, id) < (?, ?)")
+            params.extend(decode_cursor(cursor))
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+        with self.lock:
+            rows = self.conn.execute(
+                f"SELECT id, created_at, metadata FROM projects {where} ORDER BY created_at DESC, id DESC LIMIT ?",
+                params + [limit + 1]
+            ).fetchall()
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(rows[-1][1], rows[-1][0])
+        return [json.loads(row[2]) for row in rows], next_cursor
+
+    def list_expired(self, before: str, limit: int) -> List[str]:
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT id FROM projects WHERE created_at < ? ORDER BY created_at, id LIMIT ?", (before, limit)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def delete(self, project_id: str):
+        with self.lock:
+            self.conn.execute("DELETE FROM projects WHERE id = ?", (project_id,))
+
+    def delete_many(self, project_ids: List[str]) -> int:
+        placeholders = ",".join("?" * len(project_ids))
+
+        def delete():
+            size = self.conn.execute(
+                f"SELECT COALESCE(SUM(LENGTH(metadata) + COALESCE(LENGTH(result), 0)), 0) "
+                f"FROM projects WHERE id IN ({placeholders})", project_ids
+            ).fetchone()[0]
+            self.conn.execute(f"DELETE FROM projects WHERE id IN ({placeholders})", project_ids)
+            return size
+        return self._transaction(delete)
+
+def create_backend(projects_dir: str) -> StorageBackend:
+    """根据配置创建存储后端"""
+    if STORAGE_BACKEND == "json":
+        return JsonDirectoryBackend(projects_dir)
+
+    backend = SqliteBackend(SQLITE_DB_PATH)
+    # 首次使用SQLite时导入已有的JSON项目
+    if backend.is_empty() and os.path.isdir(projects_dir):
+        legacy = JsonDirectoryBackend(projects_dir)
+        imported = 0
+        for project_id in os.listdir(projects_dir):
+            metadata = legacy.get_metadata(project_id)
+            if not metadata:
+                continue
+            backend.create(metadata)
+            result = legacy.get_result(project_id)
+            if result:
+                backend.save_result(project_id, result)
+            imported += 1
+        if imported:
+            print(f"已将 {imported} 个项目导入SQLite存储")
+    return backend
+
+# 虚拟数据库 - 项目数据由可替换的存储后端保存，上传文件和论文PDF保存在按内容寻址的文件存储中，
+# 项目持有文件的引用，项目过期时释放引用并回收不再被引用的文件
+#
+# 项目更新先合并到内存中的待写入增量(pending)，由写入线程每隔PROJECT_FLUSH_INTERVAL秒
+# 批量写入存储后端；项目进入完成/失败状态时立即写入。读取时在存储数据上叠加待写入增量，
+# 因此调用方总能读到自己刚写入的数据。
 class VirtualDatabase:
-    def __init__(self):
+    def __init__(self, backend: Optional[StorageBackend] = None):
         self.projects_dir = os.path.join(DATA_DIR, "projects")
         os.makedirs(self.projects_dir, exist_ok=True)
-        
-        # 启动清理线程
-        self.cleanup_thread = threading.Thread(target=self._cleanup_scheduler, daemon=True)
-        self.cleanup_thread.start()
-    
-    def _cleanup_scheduler(self):
-        """定期清理过期数据的调度器"""
+        self.backend = backend or create_backend(self.projects_dir)
+
+        # 待写入的项目增量
+        self.pending: Dict[str, Dict[str, Any]] = {}
+        # 正在写入存储的增量，写入期间读取仍叠加这部分
+        self.flushing: Dict[str, Dict[str, Any]] = {}
+        self.pending_lock = threading.RLock()
+        # 串行执行写入，保证同一项目先后取出的增量按顺序写入；写入期间不持有pending_lock
+        self.flush_lock = threading.Lock()
+        # 每次把增量写入存储后加1，读取时据此判断读取期间增量是否已移出待写入队列
+        self.flush_generation = 0
+        self.flush_stats = {"updates": 0, "flushes": 0, "flushed_projects": 0}
+        # 过期数据由路由层的定期任务通过AsyncDatabase.cleanup_old_data分批清理
+        self.retention = RetentionEngine(self)
+
+        # 启动批量写入线程
+        self.flush_thread = threading.Thread(target=self._flush_scheduler, daemon=True)
+        self.flush_thread.start()
+
+    def _flush_scheduler(self):
+        """定期把待写入增量批量写入存储后端"""
         while True:
-            self.cleanup_old_data()
-            # 每小时检查一次
-            time.sleep(3600)
-    
-    def cleanup_old_data(self):
-        """清理超过保留期的数据"""
-        current_time = datetime.now()
-        retention_limit = current_time - timedelta(hours=DATA_RETENTION_HOURS)
-        
-        try:
-            for project_id in os.listdir(self.projects_dir):
-                project_path = os.path.join(self.projects_dir, project_id)
-                if not os.path.isdir(project_path):
-                    continue
-                    
-                # 检查项目元数据
-                meta_file = os.path.join(project_path, "metadata.json")
-                if os.path.exists(meta_file):
-                    with open(meta_file, "r", encoding="utf-8") as f:
-                        metadata = json.load(f)
-                    
-                    # 检查创建时间
-                    created_time = datetime.fromisoformat(metadata.get("created_at", "2000-01-01T00:00:00"))
-                    if created_time < retention_limit:
-                        print(f"清理过期项目: {project_id}, 创建时间: {created_time}")
-                        shutil.rmtree(project_path)
-        except Exception as e:
-            print(f"清理过程发生错误: {e}")
-    
+            time.sleep(PROJECT_FLUSH_INTERVAL)
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"写入项目数据时发生错误: {e}")
+
+    def flush(self, project_id: Optional[str] = None):
+        """把待写入增量写入存储后端，project_id为None时写入全部项目
+
+        在pending_lock内取出增量后释放锁再写入，写入期间更新和读取项目不必等待磁盘I/O。
+        """
+        with self.flush_lock:
+            with self.pending_lock:
+                if project_id is None:
+                    updates, self.pending = self.pending, {}
+                elif project_id in self.pending:
+                    updates = {project_id: self.pending.pop(project_id)}
+                else:
+                    return
+                if not updates:
+                    return
+                self.flushing = updates
+            try:
+                self.backend.update_many(updates)
+            except Exception:
+                with self.pending_lock:
+                    # 写入失败时放回待写入队列，之后的增量覆盖旧值
+                    for pid, data in updates.items():
+                        self.pending[pid] = dict(data, **self.pending.get(pid, {}))
+                    self.flushing = {}
+                    self.flush_generation += 1
+                raise
+            with self.pending_lock:
+                self.flushing = {}
+                self.flush_generation += 1
+                self.flush_stats["flushes"] += 1
+                self.flush_stats["flushed_projects"] += len(updates)
+
+    def _with_pending(self, metadata: Dict[str, Any]) -> Dict[str, Any]:
+        """在存储的元数据上依次叠加正在写入和尚未写入的增量，调用方需持有pending_lock"""
+        for deltas in (self.flushing, self.pending):
+            delta = deltas.get(metadata.get("id"))
+            if delta:
+                metadata.update(delta)
+        return metadata
+
+    def _read_with_pending(self, read: Callable[[], Any]) -> Any:
+        """读取存储中的元数据(单个、None或列表)并叠加待写入增量
+
+        读取存储和叠加增量之间，写入线程可能已把增量写入存储并移出待写入队列，
+        这时读到的是写入前的旧数据，却叠加不到任何内容。读取期间发生过写入时重新读取，
+        多次冲突后在持有pending_lock的情况下读取(此时写入完成前无法清除正在写入的增量)。
+        """
+        for _ in range(READ_RETRIES):
+            with self.pending_lock:
+                generation = self.flush_generation
+            value = read()
+            with self.pending_lock:
+                if self.flush_generation == generation:
+                    return self._overlay(value)
+        with self.pending_lock:
+            return self._overlay(read())
+
+    def _overlay(self, value: Any) -> Any:
+        if value is None:
+            return None
+        if isinstance(value, list):
+            return [self._with_pending(metadata) for metadata in value]
+        return self._with_pending(value)
+
+    def cleanup_old_data(self) -> Dict[str, Any]:
+        """清理超过保留期的项目和不再被引用的文件，返回清理报告"""
+        return self.retention.run()
+
     def create_project(self, title: str, topic: str, params: Dict[str, Any]) -> str:
         """创建新的项目"""
         project_id = str(uuid.uuid4())
-        project_dir = os.path.join(self.projects_dir, project_id)
-        os.makedirs(project_dir, exist_ok=True)
-        
+
         # 创建项目元数据
         metadata = {
             "id": project_id,
@@ -69,96 +461,146 @@ class VirtualDatabase:
             "status": "pending",
             "params": params
         }
-        
-        with open(os.path.join(project_dir, "metadata.json"), "w", encoding="utf-8") as f:
-            json.dump(metadata, f, ensure_ascii=False, indent=2)
-        
+
+        self.backend.create(metadata)
         return project_id
-    
+
     def update_project(self, project_id: str, data: Dict[str, Any]):
-        """更新项目数据"""
-        project_dir = os.path.join(self.projects_dir, project_id)
-        if not os.path.exists(project_dir):
-            os.makedirs(project_dir, exist_ok=True)
-        
-        meta_file = os.path.join(project_dir, "metadata.json")
-        if os.path.exists(meta_file):
-            with open(meta_file, "r", encoding="utf-8") as f:
-                metadata = json.load(f)
-        else:
-            metadata = {"id": project_id, "created_at": datetime.now().isoformat()}
-        
-        # 更新元数据
-        metadata.update(data)
-        metadata["updated_at"] = datetime.now().isoformat()
-        
-        with open(meta_file, "w", encoding="utf-8") as f:
-            json.dump(metadata, f, ensure_ascii=False, indent=2)
-    
+        """更新项目数据，进入终止状态时立即写入，否则由写入线程合并后批量写入"""
+        with self.pending_lock:
+            delta = self.pending.setdefault(project_id, {})
+            delta.update(data)
+            delta["updated_at"] = datetime.now().isoformat()
+            self.flush_stats["updates"] += 1
+        if data.get("status") in TERMINAL_STATUSES:
+            self.flush(project_id)
+
     def save_project_result(self, project_id: str, result_data: Dict[str, Any]):
         """保存项目生成结果"""
-        project_dir = os.path.join(self.projects_dir, project_id)
-        if not os.path.exists(project_dir):
-            os.makedirs(project_dir, exist_ok=True)
-        
-        # 保存结果数据
-        with open(os.path.join(project_dir, "result.json"), "w", encoding="utf-8") as f:
-            json.dump(result_data, f, ensure_ascii=False, indent=2)
-        
+        self.backend.save_result(project_id, result_data)
+
         # 更新项目状态
         self.update_project(project_id, {"status": "completed"})
-    
+
     def get_project(self, project_id: str) -> Optional[Dict[str, Any]]:
         """获取项目详情"""
-        project_dir = os.path.join(self.projects_dir, project_id)
-        meta_file = os.path.join(project_dir, "metadata.json")
-        
-        if not os.path.exists(meta_file):
+        metadata = self._read_with_pending(lambda: self.backend.get_metadata(project_id))
+        if metadata is None:
+            # 项目可能还只存在于待写入增量中
+            self.flush(project_id)
+            metadata = self._read_with_pending(lambda: self.backend.get_metadata(project_id))
+        if metadata is None:
             return None
-        
-        with open(meta_file, "r", encoding="utf-8") as f:
-            metadata = json.load(f)
-        
-        # 检查是否有结果文件
-        result_file = os.path.join(project_dir, "result.json")
-        if os.path.exists(result_file):
-            with open(result_file, "r", encoding="utf-8") as f:
-                result_data = json.load(f)
+
+        # 检查是否有结果
+        result_data = self.backend.get_result(project_id)
+        if result_data is not None:
             metadata["result"] = result_data
-        
+
         return metadata
-    
-    def list_projects(self, limit: int = 10) -> List[Dict[str, Any]]:
+
+    def list_projects(self, limit: int = 10, cursor: Optional[str] = None,
+                      status: Optional[str] = None) -> List[Dict[str, Any]]:
         """列出最近的项目"""
-        if not os.path.exists(self.projects_dir):
-            return []
-        
-        projects = []
-        for project_id in os.listdir(self.projects_dir):
-            project_dir = os.path.join(self.projects_dir, project_id)
-            meta_file = os.path.join(project_dir, "metadata.json")
-            
-            if os.path.exists(meta_file):
-                with open(meta_file, "r", encoding="utf-8") as f:
-                    metadata = json.load(f)
-                projects.append(metadata)
-        
-        # 按创建时间排序
-        projects.sort(key=lambda x: x.get("created_at", ""), reverse=True)
-        return projects[:limit]
-    
+        return self.list_projects_page(limit, cursor, status)[0]
+
+    def list_projects_page(self, limit: int = 10, cursor: Optional[str] = None,
+                           status: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """分页列出项目，返回(项目列表, 下一页游标)"""
+        if status:
+            # 按状态筛选依赖存储中的状态列，先写入待写入增量
+            self.flush()
+        page: Dict[str, Optional[str]] = {}
+
+        def read() -> List[Dict[str, Any]]:
+            projects, page["next_cursor"] = self.backend.list(limit, cursor, status)
+            return projects
+
+        return self._read_with_pending(read), page["next_cursor"]
+
     def save_file(self, project_id: str, filename: str, content: bytes) -> str:
-        """保存上传的文件"""
-        project_dir = os.path.join(self.projects_dir, project_id)
-        files_dir = os.path.join(project_dir, "files")
-        os.makedirs(files_dir, exist_ok=True)
-        
-        file_path = os.path.join(files_dir, filename)
-        with open(file_path, "wb") as f:
-            f.write(content)
-        
+        """保存上传的文件并关联到项目"""
+        sha256, _, _ = blob_store.put_bytes(content)
+        return self.attach_file(project_id, filename, sha256)
+
+    def attach_file(self, project_id: str, filename: str, sha256: str) -> str:
+        """把文件存储中的内容关联到项目，不复制文件内容，同名文件指向新内容"""
+        blob_store.retain(project_owner(project_id), f"file:{filename}", sha256)
+
         # 返回相对路径
-        return os.path.join("files", filename)
+        return os.path.relpath(blob_store.path(sha256), DATA_DIR)
+
+    def attach_papers(self, project_id: str, paper_ids: List[str]) -> int:
+        """让项目引用已下载的论文PDF，项目保留期内这些PDF不会被回收"""
+        return blob_store.retain_aliases(project_owner(project_id), [paper_alias(paper_id) for paper_id in paper_ids])
+
+# VirtualDatabase的异步接口
+#
+# 存储操作在专用线程中执行，不阻塞事件循环。读取操作在I/O线程池中并发执行；
+# 写入操作由单个写入线程按提交顺序执行，保证同一项目的多次更新不会乱序。
+class AsyncDatabase:
+    def __init__(self, database: VirtualDatabase, io_threads: int = STORAGE_IO_THREADS):
+        self.database = database
+        self.read_executor = ThreadPoolExecutor(max_workers=io_threads, thread_name_prefix="storage-read")
+        self.write_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="storage-write")
+
+    async def _read(self, func, *args, **kwargs):
+        return await asyncio.get_running_loop().run_in_executor(
+            self.read_executor, functools.partial(func, *args, **kwargs)
+        )
+
+    async def _write(self, func, *args, **kwargs):
+        return await asyncio.wrap_future(self.write_executor.submit(func, *args, **kwargs))
+
+    async def run(self, func, *args, **kwargs):
+        """在I/O线程池中执行其他阻塞的存储操作"""
+        return await self._read(func, *args, **kwargs)
+
+    async def create_project(self, title: str, topic: str, params: Dict[str, Any]) -> str:
+        return await self._write(self.database.create_project, title, topic, params)
+
+    async def update_project(self, project_id: str, data: Dict[str, Any]):
+        await self._write(self.database.update_project, project_id, data)
+
+    def update_project_nowait(self, project_id: str, data: Dict[str, Any]) -> Future:
+        """提交更新但不等待完成，用于同步回调，写入顺序与其他写操作一致"""
+        return self.write_executor.submit(self.database.update_project, project_id, data)
+
+    async def save_project_result(self, project_id: str, result_data: Dict[str, Any]):
+        await self._write(self.database.save_project_result, project_id, result_data)
+
+    async def save_file(self, project_id: str, filename: str, content: bytes) -> str:
+        return await self._write(self.database.save_file, project_id, filename, content)
+
+    async def attach_file(self, project_id: str, filename: str, sha256: str) -> str:
+        return await self._write(self.database.attach_file, project_id, filename, sha256)
+
+    async def attach_papers(self, project_id: str, paper_ids: List[str]) -> int:
+        return await self._write(self.database.attach_papers, project_id, paper_ids)
+
+    async def flush(self, project_id: Optional[str] = None):
+        await self._write(self.database.flush, project_id)
+
+    async def cleanup_old_data(self) -> Dict[str, Any]:
+        """分批清理，每批之间让出写入线程，清理期间其他写操作不会长时间等待"""
+        retention = self.database.retention
+        report = retention.start()
+        while await self._write(retention.step, report):
+            pass
+        return retention.finish(report)
+
+    async def get_project(self, project_id: str) -> Optional[Dict[str, Any]]:
+        return await self._read(self.database.get_project, project_id)
+
+    async def list_projects_page(self, limit: int = 10, cursor: Optional[str] = None,
+                                 status: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        return await self._read(self.database.list_projects_page, limit, cursor, status)
+
+    def shutdown(self):
+        """等待已提交的写入完成后关闭线程"""
+        self.write_executor.shutdown(wait=True)
+        self.read_executor.shutdown(wait=False)
 
 # 创建虚拟数据库实例
-db = VirtualDatabase() 
\ No newline at end of file
+db = VirtualDatabase()
+async_db = AsyncDatabase(db)
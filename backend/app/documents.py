@@ -0,0 +1,270 @@
+import time
+import sqlite3
+import asyncio
+import threading
+import logging
+from typing import Dict, List, Optional, Any, Set, Tuple
+
+from .config import (
+    DOCUMENT_DB_PATH,
+    DOCUMENT_TIME_BUDGET,
+    DOCUMENT_INGEST_CONCURRENCY
+)
+from .context import tokenize, split_chunks
+from .extraction import extraction_service
+
+# 配置日志
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("documents")
+
+# 支持解析的上传文档类型
+DOCUMENT_TYPES = (".pdf", ".docx", ".txt", ".md")
+# 等待解析完成时查询状态的间隔(秒)
+POLL_INTERVAL = 0.25
+# 解析中的文档超过该时间没有进展时视为中断(进程退出等)，可以重新解析
+STALE_SECONDS = DOCUMENT_TIME_BUDGET * 2
+
+def is_supported(file_type: str) -> bool:
+    """file_type为文件名或扩展名"""
+    return (file_type or "").lower().endswith(DOCUMENT_TYPES)
+
+class DocumentIngestor:
+    """上传文档的后台解析和片段索引
+
+    文档按内容SHA-256登记，解析在后台任务中进行：提取服务按页(或文本块)逐批产出文本，
+    每批切分成与论文正文相同大小的片段后立即写入SQLite，不在内存中拼接整个文档。
+    相同内容只解析一次，结果供所有引用它的项目使用。片段建有FTS5索引，
+    生成方案时只读取与主题相关的片段。
+    解析状态保存在数据库中，API进程和worker进程可以互相等待对方的解析结果。
+    """
+
+    def __init__(self, db_path: str = DOCUMENT_DB_PATH, concurrency: int = DOCUMENT_INGEST_CONCURRENCY):
+        self.concurrency = concurrency
+        self.lock = threading.RLock()
+        # asyncio.Semaphore绑定事件循环，按事件循环分别创建
+        self.semaphores: Dict[asyncio.AbstractEventLoop, asyncio.Semaphore] = {}
+        # 持有后台任务的引用，避免任务在完成前被回收
+        self.tasks: Set[asyncio.Task] = set()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS documents (
+                sha256 TEXT PRIMARY KEY,
+                filename TEXT NOT NULL,
+                status TEXT NOT NULL,
+                pages INTEGER NOT NULL DEFAULT 0,
+                chunks INTEGER NOT NULL DEFAULT 0,
+                truncated INTEGER NOT NULL DEFAULT 0,
+                error TEXT,
+                updated_at REAL NOT NULL
+            )
+        """)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS document_chunks (
+                rowid INTEGER PRIMARY KEY,
+                sha256 TEXT NOT NULL,
+                chunk INTEGER NOT NULL,
+                page INTEGER NOT NULL,
+                text TEXT NOT NULL,
+                terms TEXT NOT NULL
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_document_chunks ON document_chunks (sha256, chunk)")
+        self.conn.execute("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS document_passages USING fts5(
+                terms, content='document_chunks', content_rowid='rowid'
+            )
+        """)
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        with self.lock:
+            semaphore = self.semaphores.get(loop)
+            if semaphore is None:
+                semaphore = asyncio.Semaphore(self.concurrency)
+                self.semaphores[loop] = semaphore
+            return semaphore
+
+    def _claim(self, sha256: str, filename: str) -> Tuple[bool, str]:
+        """登记文档，返回(是否由当前调用方解析, 当前状态)
+
+        已解析完成、解析失败(相同内容再次解析也会失败)、不支持的类型和其他任务正在解析(未超时)的文档不再重复解析。
+        """
+        now = time.time()
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self.conn.execute(
+                    "SELECT status, updated_at FROM documents WHERE sha256 = ?", (sha256,)
+                ).fetchone()
+                if row and (row[0] in ("ready", "failed", "unsupported") or
+                            (row[0] == "processing" and row[1] > now - STALE_SECONDS)):
+                    self.conn.execute("COMMIT")
+                    return False, row[0]
+                status = "processing" if is_supported(filename) else "unsupported"
+                self._delete_chunks(sha256)
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO documents (sha256, filename, status, updated_at) VALUES (?, ?, ?, ?)",
+                    (sha256, filename, status, now)
+                )
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        return status == "processing", status
+
+    def _delete_chunks(self, sha256: str):
+        # 外部内容的FTS5表需要显式删除对应的索引项
+        rows = self.conn.execute("SELECT rowid, terms FROM document_chunks WHERE sha256 = ?", (sha256,)).fetchall()
+        self.conn.executemany("INSERT INTO document_passages (document_passages, rowid, terms) VALUES ('delete', ?, ?)", rows)
+        self.conn.execute("DELETE FROM document_chunks WHERE sha256 = ?", (sha256,))
+
+    def _add_chunks(self, sha256: str, first_chunk: int, rows: List[Tuple[int, str]]):
+        """写入一批片段，同时更新进度"""
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                for i, (page, text) in enumerate(rows):
+                    terms = " ".join(tokenize(text))
+                    cursor = self.conn.execute(
+                        "INSERT INTO document_chunks (sha256, chunk, page, text, terms) VALUES (?, ?, ?, ?, ?)",
+                        (sha256, first_chunk + i, page, text, terms)
+                    )
+                    self.conn.execute("INSERT INTO document_passages (rowid, terms) VALUES (?, ?)",
+                                      (cursor.lastrowid, terms))
+                self.conn.execute(
+                    "UPDATE documents SET pages = MAX(pages, ?), chunks = ?, updated_at = ? WHERE sha256 = ?",
+                    (rows[-1][0] + 1 if rows else 0, first_chunk + len(rows), time.time(), sha256)
+                )
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def _finish(self, sha256: str, status: str, pages: int, truncated: bool = False, error: Optional[str] = None):
+        with self.lock:
+            self.conn.execute(
+                "UPDATE documents SET status = ?, pages = ?, truncated = ?, error = ?, updated_at = ? WHERE sha256 = ?",
+                (status, pages, int(truncated), error, time.time(), sha256)
+            )
+
+    async def submit(self, sha256: str, file_path: str, filename: str) -> str:
+        """提交后台解析任务，返回文档当前状态
+
+        任务在调用方的事件循环中执行，提取在进程池或I/O线程中进行，不阻塞事件循环。
+        """
+        claimed, status = await asyncio.to_thread(self._claim, sha256, filename)
+        if claimed:
+            task = asyncio.ensure_future(self.ingest(sha256, file_path, filename))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+        return status
+
+    async def ingest(self, sha256: str, file_path: str, filename: str):
+        """解析文档，按页逐批切分并写入片段"""
+        async with self._get_semaphore():
+            started = time.monotonic()
+            pages, chunks, truncated = 0, 0, False
+            try:
+                try:
+                    async for first_page, texts, partial in extraction_service.iter_document_pages(
+                        file_path, filename, DOCUMENT_TIME_BUDGET
+                    ):
+                        rows = [(first_page + i, chunk) for i, text in enumerate(texts) for chunk in split_chunks(text)]
+                        if rows:
+                            await asyncio.to_thread(self._add_chunks, sha256, chunks, rows)
+                        # 缺页的批次(超出CPU预算或提取出错)同样记为截断
+                        truncated = truncated or partial
+                        pages = max(pages, first_page + len(texts))
+                        chunks += len(rows)
+                except asyncio.TimeoutError as e:
+                    logger.warning(f"{str(e)}，使用已解析的部分")
+                    truncated = True
+                await asyncio.to_thread(self._finish, sha256, "ready", pages, truncated)
+                logger.info(f"上传文档 {filename} 解析完成: {pages} 页, {chunks} 个片段, "
+                            f"耗时 {time.monotonic() - started:.2f}秒")
+            except Exception as e:
+                logger.error(f"解析上传文档 {filename} 时出错: {str(e)}")
+                await asyncio.to_thread(self._finish, sha256, "failed", pages, error=str(e)[:200])
+
+    def get_many(self, sha256s: List[str]) -> Dict[str, Dict[str, Any]]:
+        if not sha256s:
+            return {}
+        with self.lock:
+            rows = self.conn.execute(
+                f"SELECT sha256, filename, status, pages, chunks, truncated, error FROM documents "
+                f"WHERE sha256 IN ({','.join('?' * len(sha256s))})", sha256s
+            ).fetchall()
+        return {
+            row[0]: {"filename": row[1], "status": row[2], "pages": row[3], "chunks": row[4],
+                     "truncated": bool(row[5]), "error": row[6]}
+            for row in rows
+        }
+
+    async def wait(self, sha256s: List[str], timeout: float) -> Dict[str, Dict[str, Any]]:
+        """等待文档解析结束(最多timeout秒)，返回各文档的状态"""
+        deadline = time.monotonic() + timeout
+        while True:
+            states = await asyncio.to_thread(self.get_many, sha256s)
+            if all(state["status"] != "processing" for state in states.values()) or time.monotonic() >= deadline:
+                return states
+            await asyncio.sleep(POLL_INTERVAL)
+
+    def top_chunks(self, sha256s: List[str], query: str, limit: int) -> Dict[str, List[str]]:
+        """从文档中选取与query最相关的最多limit个片段，按文档分组并保持原文顺序
+
+        相关片段不足时按原文顺序用各文档开头的片段补足。
+        """
+        if not sha256s or limit <= 0:
+            return {}
+        placeholders = ",".join("?" * len(sha256s))
+        terms = sorted(set(tokenize(query)))
+        with self.lock:
+            picked = []
+            if terms:
+                picked = self.conn.execute(
+                    f"SELECT c.sha256, c.chunk, c.text FROM document_passages "
+                    f"JOIN document_chunks c ON c.rowid = document_passages.rowid "
+                    f"WHERE document_passages MATCH ? AND c.sha256 IN ({placeholders}) ORDER BY rank LIMIT ?",
+                    [" OR ".join(f'"{term}"' for term in terms)] + sha256s + [limit]
+                ).fetchall()
+            if len(picked) < limit:
+                seen = {(sha256, chunk) for sha256, chunk, _ in picked}
+                quota = max(1, (limit - len(picked)) // len(sha256s))
+                for sha256 in sha256s:
+                    rows = self.conn.execute(
+                        "SELECT sha256, chunk, text FROM document_chunks WHERE sha256 = ? ORDER BY chunk LIMIT ?",
+                        (sha256, quota + len(seen))
+                    ).fetchall()
+                    fresh = [row for row in rows if (row[0], row[1]) not in seen][:quota]
+                    picked.extend(fresh[:max(0, limit - len(picked))])
+        grouped: Dict[str, List[Tuple[int, str]]] = {}
+        for sha256, chunk, text in picked:
+            grouped.setdefault(sha256, []).append((chunk, text))
+        return {sha256: [text for _, text in sorted(rows)] for sha256, rows in grouped.items()}
+
+    def forget(self, sha256s: List[str]):
+        """删除已从文件存储中回收的文档的片段"""
+        if not sha256s:
+            return
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                for sha256 in sha256s:
+                    self._delete_chunks(sha256)
+                self.conn.execute(
+                    f"DELETE FROM documents WHERE sha256 IN ({','.join('?' * len(sha256s))})", sha256s
+                )
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            rows = self.conn.execute("SELECT status, COUNT(*) FROM documents GROUP BY status").fetchall()
+            chunks = self.conn.execute("SELECT COUNT(*) FROM document_chunks").fetchone()[0]
+        return dict(rows, chunks=chunks, running=len(self.tasks))
+
+# 创建全局文档解析实例
+document_ingestor = DocumentIngestor()
@@ -0,0 +1,221 @@
+import os
+import time
+import asyncio
+import threading
+import logging
+from typing import Dict, List, Optional, Any
+from urllib.parse import urlparse
+
+import httpx
+
+from .config import (
+    PDF_DIR,
+    DOWNLOAD_CONCURRENCY,
+    DOWNLOAD_HOST_INTERVAL,
+    DOWNLOAD_MAX_RETRIES,
+    DOWNLOAD_RETRY_BACKOFF,
+    DOWNLOAD_CHUNK_SIZE
+)
+from .http_client import http_clients
+from .blobs import blob_store, paper_alias
+from .metrics import download_bytes, stage_seconds
+
+# 配置日志
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("downloader")
+
+# 这些状态码视为临时错误，可以重试
+RETRYABLE_STATUS_CODES = (429, 500, 502, 503, 504)
+
+class DownloadError(Exception):
+    """下载失败"""
+
+    def __init__(self, message: str, retryable: bool = True):
+        super().__init__(message)
+        self.retryable = retryable
+
+class HostRateLimiter:
+    """按主机限制请求频率，保证同一主机两次请求之间至少间隔interval秒"""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.next_slot: Dict[str, float] = {}
+        self.lock = threading.Lock()
+
+    async def wait(self, host: str):
+        """等待直到可以向该主机发起请求"""
+        if self.interval <= 0:
+            return
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot.get(host, 0.0))
+            self.next_slot[host] = slot + self.interval
+        delay = slot - now
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+class PaperDownloader:
+    """并发下载论文PDF
+
+    并发数由信号量限制，同一主机的请求频率由HostRateLimiter限制。
+    数据按块写入PDF_DIR中的临时文件(.part)，重试时利用已下载的部分通过Range请求断点续传；
+    下载完成后移入按内容寻址的文件存储，并以paper:<ID>为别名，相同内容只保存一份。
+    """
+
+    def __init__(self, concurrency: int = DOWNLOAD_CONCURRENCY):
+        self.concurrency = concurrency
+        self.rate_limiter = HostRateLimiter(DOWNLOAD_HOST_INTERVAL)
+        # asyncio.Semaphore绑定事件循环，按事件循环分别创建
+        self.semaphores: Dict[asyncio.AbstractEventLoop, asyncio.Semaphore] = {}
+        # 正在下载的文件，避免多个项目同时写同一个临时文件
+        self.in_flight: Dict[str, asyncio.Future] = {}
+        self.lock = threading.Lock()
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        with self.lock:
+            semaphore = self.semaphores.get(loop)
+            if semaphore is None:
+                semaphore = asyncio.Semaphore(self.concurrency)
+                self.semaphores[loop] = semaphore
+            return semaphore
+
+    def cached_path(self, paper_id: str) -> Optional[str]:
+        """返回已下载的论文PDF在文件存储中的路径，旧版本直接保存在PDF_DIR中的文件在这里迁移到文件存储"""
+        path = blob_store.resolve(paper_alias(paper_id), touch=True)
+        if path is None:
+            legacy_path = os.path.join(PDF_DIR, f"{paper_id}.pdf")
+            if os.path.exists(legacy_path):
+                path = self._store(paper_id, legacy_path)
+        return path
+
+    def _store(self, paper_id: str, source_path: str) -> str:
+        """把下载完成的文件移入文件存储，返回存储路径"""
+        sha256, path, deduplicated = blob_store.put_file(source_path)
+        blob_store.set_alias(paper_alias(paper_id), sha256)
+        if deduplicated:
+            logger.info(f"论文 {paper_id} 与已保存的PDF内容相同，不再重复保存")
+        return path
+
+    async def _fetch(self, url: str, part_path: str, timeout: float) -> int:
+        """下载一次到临时文件，返回本次写入的字节数"""
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        headers = {"Range": f"bytes={offset}-"} if offset else {}
+
+        await self.rate_limiter.wait(urlparse(url).netloc)
+        client = http_clients.get_client(url)
+        written = 0
+        async with client.stream("GET", url, headers=headers, timeout=timeout) as response:
+            if response.status_code == 206:
+                mode = "ab"
+            elif response.status_code == 200:
+                # 服务器不支持断点续传，重新下载
+                mode = "wb"
+            elif response.status_code == 416:
+                # 已下载部分无效，删除后重试
+                os.remove(part_path)
+                raise DownloadError("断点续传范围无效")
+            else:
+                raise DownloadError(
+                    f"状态码: {response.status_code}",
+                    retryable=response.status_code in RETRYABLE_STATUS_CODES
+                )
+
+            with open(part_path, mode) as f:
+                async for chunk in response.aiter_bytes(DOWNLOAD_CHUNK_SIZE):
+                    f.write(chunk)
+                    written += len(chunk)
+                    download_bytes.inc(len(chunk))
+
+        return written
+
+    async def download(self, paper: Dict[str, Any], timeout: float = 30) -> Optional[str]:
+        """下载单篇论文，成功时返回本地路径，并在paper["download"]中记录耗时"""
+        filename = f"{paper['id']}.pdf"
+        part_path = os.path.join(PDF_DIR, f"{filename}.part")
+        started = time.monotonic()
+        stats = {"status": "failed", "cached": False, "attempts": 0, "bytes": 0, "elapsed": 0.0}
+        paper["download"] = stats
+
+        # 如果PDF已经存在，跳过下载
+        local_path = await asyncio.to_thread(self.cached_path, paper["id"])
+        if local_path:
+            stats.update({"status": "ok", "cached": True, "bytes": os.path.getsize(local_path)})
+            logger.info(f"论文PDF已存在: {filename}")
+            return local_path
+
+        if not paper.get("pdf_url"):
+            logger.warning(f"论文 {paper['id']} 没有PDF链接，跳过")
+            return None
+
+        # 同一文件已在下载中，等待其结果
+        loop = asyncio.get_running_loop()
+        with self.lock:
+            pending = self.in_flight.get(part_path)
+            if pending is None or pending.get_loop() is not loop:
+                pending = None
+                self.in_flight[part_path] = loop.create_future()
+        if pending is not None:
+            result_path = await asyncio.shield(pending)
+            stats.update({"status": "ok" if result_path else "failed", "shared": True,
+                          "elapsed": round(time.monotonic() - started, 3)})
+            return result_path
+
+        local_path = None
+        try:
+            local_path = await self._download(paper, part_path, stats, started, timeout)
+            return local_path
+        finally:
+            with self.lock:
+                future = self.in_flight.pop(part_path, None)
+            if future is not None and not future.done():
+                future.set_result(local_path)
+
+    async def _download(self, paper: Dict[str, Any], part_path: str, stats: Dict[str, Any],
+                        started: float, timeout: float) -> Optional[str]:
+        """带重试的下载过程，成功时返回文件存储中的路径"""
+        filename = f"{paper['id']}.pdf"
+        local_path = None
+        async with self._get_semaphore():
+            queued = time.monotonic() - started
+            for attempt in range(1, DOWNLOAD_MAX_RETRIES + 1):
+                stats["attempts"] = attempt
+                try:
+                    stats["bytes"] += await asyncio.wait_for(
+                        self._fetch(paper["pdf_url"], part_path, timeout), timeout=timeout
+                    )
+                    local_path = await asyncio.to_thread(self._store, paper["id"], part_path)
+                    stats["status"] = "ok"
+                    logger.info(f"成功下载论文: {filename}")
+                    break
+                except DownloadError as e:
+                    logger.warning(f"下载论文 {paper['id']} 失败 (第{attempt}次): {str(e)}")
+                    if not e.retryable:
+                        break
+                except (httpx.HTTPError, asyncio.TimeoutError, OSError) as e:
+                    logger.warning(f"下载论文 {paper['id']} 出错 (第{attempt}次): {type(e).__name__} {str(e)}")
+
+                if attempt < DOWNLOAD_MAX_RETRIES:
+                    await asyncio.sleep(DOWNLOAD_RETRY_BACKOFF * (2 ** (attempt - 1)))
+
+        stats["queued"] = round(queued, 3)
+        stats["elapsed"] = round(time.monotonic() - started, 3)
+        stage_seconds.observe(stats["elapsed"], stage="download")
+        return local_path
+
+    async def download_all(self, papers: List[Dict[str, Any]], timeout: float = 30):
+        """并发下载所有论文，更新每篇论文的local_path"""
+        async def run(paper: Dict[str, Any]):
+            try:
+                result_path = await self.download(paper, timeout)
+                if result_path:
+                    paper["local_path"] = result_path
+                else:
+                    logger.warning(f"论文 {paper['id']} 下载失败，跳过")
+            except Exception as e:
+                logger.error(f"下载论文 {paper['id']} 时出错: {str(e)}")
+
+        await asyncio.gather(*(run(paper) for paper in papers))
+
+# 创建全局下载器实例
+downloader = PaperDownloader()
@@ -0,0 +1,302 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+import logging
+from functools import lru_cache
+from typing import Dict, List, Optional, Any, Tuple
+
+import numpy as np
+
+from .config import (
+    EMBEDDING_DIR,
+    EMBEDDING_DIM,
+    EMBEDDING_PAPER_THRESHOLD,
+    EMBEDDING_PROJECT_THRESHOLD,
+    EMBEDDING_PROPOSAL_THRESHOLD
+)
+from .context import tokenize, split_chunks
+from .corpus import corpus
+
+# 配置日志
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("embeddings")
+
+# 向量文件每次扩容的最小行数
+MIN_CAPACITY = 1024
+# 查找相关论文时读取的候选片段数
+CANDIDATE_CHUNKS = 50
+
+@lru_cache(maxsize=65536)
+def feature_slot(feature: str, dim: int) -> Tuple[int, float]:
+    """特征哈希: 返回特征所在的维度和符号"""
+    value = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "little")
+    return value % dim, 1.0 if value >> 63 else -1.0
+
+def text_features(text: str) -> List[Tuple[str, float]]:
+    """提取文本特征
+
+    检索词、相邻检索词组合、英文单词的字符三元组(容忍词形变化)，
+    以及相邻2~3个英文单词的首字母缩写(使large language model与llm相近)。
+    """
+    terms = tokenize(text)
+    features = [(f"w:{term}", 1.0) for term in terms]
+    features.extend((f"b:{a} {b}", 0.5) for a, b in zip(terms, terms[1:]))
+    words = [term if re.fullmatch(r"[a-z][a-z0-9]*", term) else None for term in terms]
+    for term in filter(None, words):
+        if len(term) > 3:
+            padded = f"<{term}>"
+            features.extend((f"c:{padded[i:i + 3]}", 0.25) for i in range(len(padded) - 2))
+    for size in (2, 3):
+        for i in range(len(words) - size + 1):
+            window = words[i:i + size]
+            if all(window):
+                features.append((f"w:{''.join(word[0] for word in window)}", 0.5))
+    return features
+
+def embed_text(text: str, dim: int = EMBEDDING_DIM) -> np.ndarray:
+    """把文本编码为L2归一化的哈希n-gram向量，不依赖模型文件，只使用CPU"""
+    vector = np.zeros(dim, dtype=np.float32)
+    for feature, weight in text_features(text):
+        slot, sign = feature_slot(feature, dim)
+        vector[slot] += sign * weight
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else vector
+
+class VectorIndex:
+    """内存映射的向量矩阵，支持按类型过滤的top-k余弦相似度检索
+
+    向量按行保存在vectors.f32中，通过numpy.memmap映射，多个进程共享同一份文件。
+    每行的键、类型和元数据保存在SQLite中，写入在BEGIN IMMEDIATE事务中分配行号，
+    其他进程检索前按行数增量刷新映射。相同的键重复写入时覆盖原来的行。
+    删除的行不回收，向量清零并把条目改为deleted类型，保持行号只增不减。
+    """
+
+    def __init__(self, directory: str = EMBEDDING_DIR, dim: int = EMBEDDING_DIM):
+        os.makedirs(directory, exist_ok=True)
+        self.dim = dim
+        self.vector_path = os.path.join(directory, "vectors.f32")
+        self.lock = threading.RLock()
+        self.conn = sqlite3.connect(os.path.join(directory, "index.db"), check_same_thread=False,
+                                    timeout=30, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS entries (
+                row INTEGER PRIMARY KEY,
+                key TEXT NOT NULL UNIQUE,
+                kind TEXT NOT NULL,
+                ref TEXT NOT NULL,
+                metadata TEXT,
+                created_at REAL NOT NULL
+            )
+        """)
+        if not os.path.exists(self.vector_path):
+            self._resize(MIN_CAPACITY)
+        self.matrix: Optional[np.memmap] = None
+        self.kinds = np.empty(0, dtype="U16")
+        self.count = 0
+
+    def _resize(self, rows: int):
+        with open(self.vector_path, "ab") as f:
+            f.truncate(rows * self.dim * 4)
+
+    def _remap(self):
+        """向量文件被扩容(可能由其他进程)后重新映射"""
+        capacity = os.path.getsize(self.vector_path) // (self.dim * 4)
+        if self.matrix is None or self.matrix.shape[0] != capacity:
+            self.matrix = np.memmap(self.vector_path, dtype=np.float32, mode="r+", shape=(capacity, self.dim))
+
+    def _refresh(self):
+        """读取其他进程新写入的行"""
+        rows = self.conn.execute("SELECT row, kind FROM entries WHERE row >= ? ORDER BY row", (self.count,)).fetchall()
+        if rows:
+            self.kinds = np.concatenate([self.kinds, np.array([kind for _, kind in rows], dtype="U16")])
+            self.count = rows[-1][0] + 1
+        self._remap()
+
+    def add(self, items: List[Tuple[str, str, str, Optional[Dict[str, Any]], np.ndarray]]):
+        """写入向量，items为[(键, 类型, 关联ID, 元数据, 向量), ...]"""
+        if not items:
+            return
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                next_row = self.conn.execute("SELECT COALESCE(MAX(row) + 1, 0) FROM entries").fetchone()[0]
+                placements = []
+                for key, kind, ref, metadata, vector in items:
+                    existing = self.conn.execute("SELECT row FROM entries WHERE key = ?", (key,)).fetchone()
+                    row = existing[0] if existing else next_row
+                    if not existing:
+                        next_row += 1
+                    self.conn.execute(
+                        "INSERT OR REPLACE INTO entries (row, key, kind, ref, metadata, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                        (row, key, kind, ref, json.dumps(metadata, ensure_ascii=False) if metadata else None, time.time())
+                    )
+                    placements.append((row, vector))
+
+                capacity = os.path.getsize(self.vector_path) // (self.dim * 4)
+                if next_row > capacity:
+                    self._resize(max(next_row, capacity * 2, MIN_CAPACITY))
+                self._remap()
+                for row, vector in placements:
+                    self.matrix[row] = vector
+                self.matrix.flush()
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def remove(self, keys: List[str]) -> int:
+        """删除条目，返回删除的条数"""
+        if not keys:
+            return 0
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = [row for row, in self.conn.execute(
+                    f"SELECT row FROM entries WHERE key IN ({','.join('?' * len(keys))})", keys
+                )]
+                if rows:
+                    self._remap()
+                    for row in rows:
+                        self.matrix[row] = 0
+                    self.matrix.flush()
+                    self.conn.executemany(
+                        "UPDATE entries SET key = 'deleted:' || row, kind = 'deleted', ref = '', metadata = NULL "
+                        "WHERE row = ?", [(row,) for row in rows]
+                    )
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+            for row in rows:
+                if row < self.count:
+                    self.kinds[row] = "deleted"
+        return len(rows)
+
+    def has(self, key: str) -> bool:
+        with self.lock:
+            return self.conn.execute("SELECT 1 FROM entries WHERE key = ?", (key,)).fetchone() is not None
+
+    def search(self, vector: np.ndarray, k: int = 10, kind: Optional[str] = None) -> List[Dict[str, Any]]:
+        """返回与vector余弦相似度最高的k个条目(向量已归一化，内积即余弦相似度)"""
+        with self.lock:
+            self._refresh()
+            if self.count == 0:
+                return []
+            scores = np.asarray(self.matrix[:self.count] @ vector)
+            if kind is not None:
+                scores = np.where(self.kinds[:self.count] == kind, scores, -np.inf)
+            k = min(k, self.count)
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = [int(row) for row in top[np.argsort(-scores[top])] if np.isfinite(scores[row])]
+            if not top:
+                return []
+            entries = {
+                row: (key, entry_kind, ref, metadata)
+                for row, key, entry_kind, ref, metadata in self.conn.execute(
+                    f"SELECT row, key, kind, ref, metadata FROM entries WHERE row IN ({','.join('?' * len(top))})", top
+                )
+            }
+        results = []
+        for row in top:
+            key, entry_kind, ref, metadata = entries[row]
+            # 其他进程删除的行在本进程的类型缓存中可能还是原来的类型
+            if kind is not None and entry_kind != kind:
+                continue
+            results.append({
+                "key": key,
+                "kind": entry_kind,
+                "ref": ref,
+                "metadata": json.loads(metadata) if metadata else {},
+                "score": round(float(scores[row]), 4)
+            })
+        return results
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            rows = self.conn.execute("SELECT kind, COUNT(*) FROM entries GROUP BY kind").fetchall()
+        return dict(rows, dim=self.dim, bytes=os.path.getsize(self.vector_path))
+
+class EmbeddingIndex:
+    """论文片段和历史项目主题的语义索引
+
+    论文片段与本地全文索引使用相同的切分方式；历史项目以翻译后的检索词编码，
+    元数据中记录引用的论文和使用的模型，供相似的新项目复用论文或方案。
+    """
+
+    def __init__(self, vectors: VectorIndex):
+        self.vectors = vectors
+
+    def add_paper(self, paper: Dict[str, Any], content: str):
+        """把论文的标题摘要和正文片段加入索引"""
+        chunks = [f"{paper.get('title', '')}. {paper.get('summary', '')}"] + split_chunks(content)
+        self.vectors.add([
+            (f"chunk:{paper['id']}#{i}", "chunk", paper["id"], None, embed_text(text))
+            for i, text in enumerate(chunks)
+        ])
+
+    def has_paper(self, paper_id: str) -> bool:
+        return self.vectors.has(f"chunk:{paper_id}#0")
+
+    def add_project(self, project_id: str, query: str, paper_ids: List[str], model_type: str, options: str):
+        """记录已完成项目的检索词、引用论文和除主题外的请求指纹(options)"""
+        self.vectors.add([(
+            f"project:{project_id}", "project", project_id,
+            {"query": query, "paper_ids": paper_ids, "model_type": model_type, "options": options},
+            embed_text(query)
+        )])
+
+    def remove_projects(self, project_ids: List[str]) -> int:
+        """删除已过期项目的检索词记录"""
+        return self.vectors.remove([f"project:{project_id}" for project_id in project_ids])
+
+    def find_similar_projects(self, query: str, k: int = 5,
+                              threshold: float = EMBEDDING_PROJECT_THRESHOLD) -> List[Dict[str, Any]]:
+        """查找检索词相似的历史项目"""
+        return [hit for hit in self.vectors.search(embed_text(query), k, kind="project") if hit["score"] >= threshold]
+
+    def find_similar_proposal(self, query: str, options: str,
+                              threshold: float = EMBEDDING_PROPOSAL_THRESHOLD) -> Optional[Dict[str, Any]]:
+        """查找检索词几乎相同、其余请求参数完全相同的历史项目，其方案可直接复用
+
+        options为proposal_cache.options_fingerprint计算的除主题外的请求指纹，
+        没有记录该指纹的旧项目不参与复用。
+        """
+        for hit in self.find_similar_projects(query, threshold=threshold):
+            if hit["metadata"].get("options") == options:
+                return hit
+        return None
+
+    def find_related_papers(self, query: str, limit: int) -> List[Dict[str, Any]]:
+        """按语义相似度从本地索引中查找论文
+
+        优先使用相似历史项目引用的论文，不足时按相似片段所属的论文补充。
+        返回的论文带有正文content和相似度similarity。
+        """
+        similarity: Dict[str, float] = {}
+        for hit in self.find_similar_projects(query):
+            for paper_id in hit["metadata"].get("paper_ids", []):
+                similarity.setdefault(paper_id, hit["score"])
+        if len(similarity) < limit:
+            for hit in self.vectors.search(embed_text(query), CANDIDATE_CHUNKS, kind="chunk"):
+                if hit["score"] >= EMBEDDING_PAPER_THRESHOLD and hit["ref"] not in similarity:
+                    similarity[hit["ref"]] = hit["score"]
+
+        papers = []
+        for paper_id in sorted(similarity, key=similarity.get, reverse=True):
+            paper = corpus.get_paper(paper_id)
+            if paper is not None:
+                papers.append(dict(paper, similarity=similarity[paper_id]))
+            if len(papers) >= limit:
+                break
+        return papers
+
+    def stats(self) -> Dict[str, Any]:
+        return self.vectors.stats()
+
+# 创建全局语义索引实例
+embedding_index = EmbeddingIndex(VectorIndex())
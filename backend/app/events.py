@@ -0,0 +1,90 @@
+import asyncio
+import threading
+import logging
+from typing import Dict, List, Optional, Any, Tuple
+
+from .models import StreamingResponse as StreamEvent
+
+# 配置日志
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("events")
+
+# 项目进入这些状态后事件流结束
+TERMINAL_EVENTS = ("completed", "failed")
+# 订阅队列溢出后发送的事件，客户端收到后重新连接，以订阅时的完整方案文本为准
+RESYNC_EVENT = "resync"
+
+class ProjectEventBus:
+    """项目事件总线
+
+    项目处理在调度器线程的事件循环中执行，SSE连接在uvicorn的事件循环中等待，
+    因此发布事件时通过call_soon_threadsafe投递到订阅者所属的事件循环。
+    """
+
+    def __init__(self, max_queue_size: int = 1000):
+        self.subscribers: Dict[str, List[Tuple[asyncio.AbstractEventLoop, asyncio.Queue]]] = {}
+        # 已生成的方案文本，供中途连接的订阅者补齐
+        self.partial_proposals: Dict[str, str] = {}
+        self.max_queue_size = max_queue_size
+        self.lock = threading.RLock()
+
+    def subscribe(self, project_id: str) -> Tuple[asyncio.Queue, str]:
+        """订阅项目事件（必须在事件循环中调用）
+
+        返回事件队列和订阅时已生成的方案文本，两者在同一把锁内获取，
+        保证token既不丢失也不重复。
+        """
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.max_queue_size)
+        with self.lock:
+            self.subscribers.setdefault(project_id, []).append((loop, queue))
+            partial = self.partial_proposals.get(project_id, "")
+        return queue, partial
+
+    def unsubscribe(self, project_id: str, queue: asyncio.Queue):
+        """取消订阅"""
+        with self.lock:
+            subscribers = self.subscribers.get(project_id, [])
+            self.subscribers[project_id] = [s for s in subscribers if s[1] is not queue]
+            if not self.subscribers[project_id]:
+                del self.subscribers[project_id]
+
+    def publish(self, project_id: str, event: str, data: Dict[str, Any]):
+        """发布项目事件，可在任意线程中调用"""
+        message = StreamEvent(event=event, data=data)
+
+        with self.lock:
+            if event == "token":
+                self.partial_proposals[project_id] = self.partial_proposals.get(project_id, "") + data.get("content", "")
+            elif event in TERMINAL_EVENTS:
+                self.partial_proposals.pop(project_id, None)
+            subscribers = list(self.subscribers.get(project_id, []))
+
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(self._put, queue, message)
+            except RuntimeError:
+                # 订阅者的事件循环已关闭
+                self.unsubscribe(project_id, queue)
+
+    def clear(self, project_id: str):
+        """项目处理结束时释放已生成的方案文本(取消、租约丢失等不会发布终止事件的情况)"""
+        with self.lock:
+            self.partial_proposals.pop(project_id, None)
+
+    def _put(self, queue: asyncio.Queue, message: StreamEvent):
+        """向订阅队列投递事件
+
+        队列已满时丢弃任何事件都会在方案文本中间留下缺口，因此清空队列，
+        只保留一个resync事件，由订阅者重新连接并获取完整的已生成文本。
+        """
+        if queue.full():
+            while not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait(StreamEvent(event=RESYNC_EVENT, data={"reason": "queue_full"}))
+            logger.warning("事件队列已满，通知订阅者重新同步")
+            return
+        queue.put_nowait(message)
+
+# 创建全局事件总线实例
+events = ProjectEventBus()
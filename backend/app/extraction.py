@@ -0,0 +1,320 @@
+import os
+import time
+import signal
+import asyncio
+import threading
+import logging
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List, Optional, Any, Tuple, AsyncIterator
+
+from .config import (
+    CACHE_DIR,
+    EXTRACTION_WORKERS,
+    EXTRACTION_PAGES_PER_TASK,
+    EXTRACTION_TIME_BUDGET,
+    EXTRACTION_CPU_BUDGET,
+    EXTRACTION_CACHE_MAX_BYTES
+)
+from .cache import SqliteCache, file_hasher
+
+# 配置日志
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("extraction")
+
+# 流式提取纯文本文件时每块读取的字节数
+TEXT_BLOCK_BYTES = 256 * 1024
+# 流式提取Word文档时每节包含的段落数
+DOCX_PARAGRAPHS_PER_SECTION = 50
+
+# 以下函数在子进程中执行，只能使用可序列化的参数和返回值
+
+def run_with_limit(seconds: float, func, *args):
+    """执行func，超过seconds秒(墙钟时间)时由SIGALRM的默认动作终止子进程
+
+    PyMuPDF提取单页时持有GIL且不检查信号，页与页之间的预算检查、Python层的超时和取消都无法打断它。
+    不支持SIGALRM的平台(Windows)上不限制。
+    """
+    if seconds <= 0 or not hasattr(signal, "setitimer"):
+        return func(*args)
+    signal.signal(signal.SIGALRM, signal.SIG_DFL)
+    signal.setitimer(signal.ITIMER_REAL, seconds)
+    try:
+        return func(*args)
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+
+def pdf_page_count(file_path: str) -> int:
+    """获取PDF页数"""
+    import fitz  # PyMuPDF
+
+    with fitz.open(file_path) as doc:
+        return len(doc)
+
+def extract_pdf_page_range(file_path: str, start: int, end: int, cpu_budget: float) -> Tuple[List[str], bool]:
+    """提取PDF中[start, end)页的文本
+
+    每页提取后检查CPU时间，超出预算时停止并返回已提取的页面。
+    返回(每页文本列表, 是否被截断)
+    """
+    import fitz  # PyMuPDF
+
+    cpu_started = time.process_time()
+    pages = []
+    with fitz.open(file_path) as doc:
+        for i in range(start, min(end, len(doc))):
+            pages.append(doc[i].get_text())
+            if time.process_time() - cpu_started > cpu_budget:
+                return pages, i + 1 < min(end, len(doc))
+    return pages, False
+
+def extract_docx_sections(file_path: str, paragraphs_per_section: int) -> List[str]:
+    """提取Word文档文本，每paragraphs_per_section个段落为一节"""
+    import docx
+
+    paragraphs = [paragraph.text for paragraph in docx.Document(file_path).paragraphs]
+    return [
+        "\n\n".join(paragraphs[i:i + paragraphs_per_section])
+        for i in range(0, len(paragraphs), paragraphs_per_section)
+    ]
+
+def read_text_block(file_path: str, offset: int, block_bytes: int) -> Tuple[str, int]:
+    """从offset开始读取约block_bytes字节的文本并读到行尾，返回(文本, 下一块的起始位置)，读完时位置为-1"""
+    with open(file_path, "rb") as f:
+        f.seek(offset)
+        data = f.read(block_bytes)
+        if len(data) == block_bytes:
+            data += f.readline(block_bytes)
+    if not data:
+        return "", -1
+    return data.decode("utf-8", errors="ignore"), offset + len(data)
+
+class ExtractionService:
+    """基于进程池的文档文本提取服务
+
+    PyMuPDF在提取过程中长时间持有GIL，放在线程池中会拖慢事件循环，
+    因此使用独立进程执行。大文档按页范围拆分到多个进程并行提取，
+    每个文档受总耗时预算约束，每个子任务受CPU时间预算约束，
+    超出预算时返回已完成部分。进程池在首次使用时创建。
+    CPU预算只能在页与页之间检查，因此子进程中的每次调用还受墙钟时间硬限制(文档的总耗时预算)，
+    超出时子进程被终止，卡住的页面不会一直占用子进程；进程池随之失效，下次使用时重新创建。
+
+    PDF提取结果按(文件内容SHA-256, max_pages)缓存，相同文件再次提取时
+    不再调用PyMuPDF。被截断的结果不写入缓存。
+    """
+
+    def __init__(self, max_workers: int = EXTRACTION_WORKERS):
+        self.max_workers = max_workers
+        self.executor: Optional[ProcessPoolExecutor] = None
+        self.lock = threading.Lock()
+        self.cache = SqliteCache(
+            os.path.join(CACHE_DIR, "extraction.db"),
+            EXTRACTION_CACHE_MAX_BYTES,
+            name="extraction_cache"
+        )
+        self.stats = {"documents": 0, "pages": 0, "truncated": 0, "timeouts": 0, "recycled": 0}
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self.lock:
+            # 子进程被终止时等待它的任务可能已因超时取消，没有机会丢弃失效的进程池
+            if self.executor is not None and self.executor._broken:
+                self.executor.shutdown(wait=False, cancel_futures=True)
+                self.executor = None
+                self.stats["recycled"] += 1
+            if self.executor is None:
+                self.executor = ProcessPoolExecutor(max_workers=self.max_workers)
+                logger.info(f"创建PDF提取进程池, 进程数: {self.max_workers}")
+            return self.executor
+
+    async def _run(self, func, *args, limit: float = EXTRACTION_TIME_BUDGET):
+        """在进程池中执行函数，在子进程中执行超过limit秒时终止该子进程"""
+        loop = asyncio.get_running_loop()
+        executor = self._get_executor()
+        try:
+            return await loop.run_in_executor(executor, run_with_limit, limit, func, *args)
+        except BrokenProcessPool:
+            # 子进程被终止后整个进程池失效，同一进程池中其他进行中的任务同样失败，调用方按提取出错处理
+            self._discard(executor)
+            raise
+
+    def _discard(self, executor: ProcessPoolExecutor):
+        """丢弃已失效的进程池，下次使用时重新创建"""
+        with self.lock:
+            if self.executor is not executor:
+                return
+            self.executor = None
+            self.stats["recycled"] += 1
+        executor.shutdown(wait=False, cancel_futures=True)
+        logger.warning("PDF提取子进程超出时间限制被终止，重新创建提取进程池")
+
+    async def extract_pdf_pages(
+        self,
+        file_path: str,
+        max_pages: Optional[int] = None,
+        time_budget: float = EXTRACTION_TIME_BUDGET
+    ) -> List[str]:
+        """提取PDF每页的文本，max_pages为None时提取全部页面
+
+        页数不超过EXTRACTION_PAGES_PER_TASK时直接在一个子进程中完成，
+        否则先获取页数，再按页范围分发到多个子进程。
+        """
+        deadline = time.monotonic() + time_budget
+
+        # 先查询提取缓存
+        cache_key = self._cache_key(await asyncio.to_thread(file_hasher.sha256, file_path), max_pages)
+        cached = await asyncio.to_thread(self.cache.get, cache_key)
+        if cached is not None:
+            return cached
+
+        if max_pages is not None and max_pages <= EXTRACTION_PAGES_PER_TASK:
+            ranges = [(0, max_pages)]
+        else:
+            page_count = await asyncio.wait_for(self._run(pdf_page_count, file_path, limit=time_budget),
+                                                timeout=time_budget)
+            if max_pages is not None:
+                page_count = min(page_count, max_pages)
+            ranges = [
+                (start, min(start + EXTRACTION_PAGES_PER_TASK, page_count))
+                for start in range(0, page_count, EXTRACTION_PAGES_PER_TASK)
+            ] or [(0, 0)]
+
+        tasks = [
+            asyncio.ensure_future(self._run(extract_pdf_page_range, file_path, start, end, EXTRACTION_CPU_BUDGET,
+                                            limit=time_budget))
+            for start, end in ranges
+        ]
+        done, pending = await asyncio.wait(tasks, timeout=max(0.0, deadline - time.monotonic()))
+        for task in pending:
+            task.cancel()
+
+        pages: List[str] = []
+        truncated = bool(pending)
+        for task in tasks:
+            if task not in done:
+                continue
+            if task.exception() is not None:
+                logger.error(f"提取 {os.path.basename(file_path)} 部分页面出错: {str(task.exception())}")
+                truncated = True
+                continue
+            range_pages, range_truncated = task.result()
+            pages.extend(range_pages)
+            truncated = truncated or range_truncated
+
+        with self.lock:
+            self.stats["documents"] += 1
+            self.stats["pages"] += len(pages)
+            if truncated:
+                self.stats["truncated"] += 1
+            if pending:
+                self.stats["timeouts"] += 1
+
+        if pending and not pages:
+            raise asyncio.TimeoutError(f"提取 {os.path.basename(file_path)} 超出时间预算")
+        if truncated:
+            logger.warning(f"提取 {os.path.basename(file_path)} 超出预算，仅返回 {len(pages)} 页")
+        else:
+            await asyncio.to_thread(self.cache.set, cache_key, pages)
+        return pages
+
+    def _cache_key(self, content_hash: str, max_pages: Optional[int]) -> str:
+        """提取缓存键: 文件内容哈希 + 提取参数"""
+        return f"pdf:{content_hash}:{max_pages if max_pages is not None else 'all'}"
+
+    async def extract_pdf(self, file_path: str, max_pages: Optional[int] = 5) -> str:
+        """提取PDF文本"""
+        return "".join(await self.extract_pdf_pages(file_path, max_pages))
+
+    async def iter_document_pages(
+        self,
+        file_path: str,
+        file_type: str,
+        time_budget: float = EXTRACTION_TIME_BUDGET
+    ) -> AsyncIterator[Tuple[int, List[str], bool]]:
+        """按文档顺序逐批产出(起始页序号, 每页文本列表, 该批是否缺页)，不把整个文档拼接成一个字符串
+
+        PDF每批EXTRACTION_PAGES_PER_TASK页，最多max_workers批同时在进程池中提取，
+        超出CPU预算或提取出错的批次标记为缺页(出错时文本列表为空)；
+        纯文本和Markdown按TEXT_BLOCK_BYTES分块读取；Word文档按段落分节。
+        超出time_budget时抛出asyncio.TimeoutError，此前产出的部分仍然有效。
+        """
+        deadline = time.monotonic() + time_budget
+        file_type = file_type.lower()
+        name = os.path.basename(file_path)
+
+        if file_type.endswith(".pdf"):
+            page_count = await asyncio.wait_for(self._run(pdf_page_count, file_path, limit=time_budget),
+                                                timeout=time_budget)
+            ranges = deque(
+                (start, min(start + EXTRACTION_PAGES_PER_TASK, page_count))
+                for start in range(0, page_count, EXTRACTION_PAGES_PER_TASK)
+            )
+            in_flight: deque = deque()
+            extracted, truncated = 0, False
+            try:
+                while ranges or in_flight:
+                    while ranges and len(in_flight) < self.max_workers:
+                        start, end = ranges.popleft()
+                        in_flight.append((start, asyncio.ensure_future(
+                            self._run(extract_pdf_page_range, file_path, start, end, EXTRACTION_CPU_BUDGET,
+                                      limit=time_budget)
+                        )))
+                    start, task = in_flight.popleft()
+                    try:
+                        pages, range_truncated = await asyncio.wait_for(
+                            task, timeout=max(0.0, deadline - time.monotonic())
+                        )
+                    except asyncio.TimeoutError:
+                        truncated = True
+                        with self.lock:
+                            self.stats["timeouts"] += 1
+                        raise asyncio.TimeoutError(f"提取 {name} 超出时间预算，已提取 {extracted} 页")
+                    except Exception as e:
+                        logger.error(f"提取 {name} 第{start + 1}页起的页面出错: {str(e)}")
+                        pages, range_truncated = [], True
+                    truncated = truncated or range_truncated
+                    extracted += len(pages)
+                    with self.lock:
+                        self.stats["pages"] += len(pages)
+                    yield start, pages, range_truncated
+            finally:
+                for _, task in in_flight:
+                    task.cancel()
+                with self.lock:
+                    self.stats["documents"] += 1
+                    if truncated:
+                        self.stats["truncated"] += 1
+        elif file_type.endswith((".txt", ".md")):
+            offset, index = 0, 0
+            while True:
+                if time.monotonic() > deadline:
+                    raise asyncio.TimeoutError(f"读取 {name} 超出时间预算")
+                text, offset = await asyncio.to_thread(read_text_block, file_path, offset, TEXT_BLOCK_BYTES)
+                if offset < 0:
+                    break
+                yield index, [text], False
+                index += 1
+        elif file_type.endswith(".docx"):
+            sections = await asyncio.wait_for(
+                self._run(extract_docx_sections, file_path, DOCX_PARAGRAPHS_PER_SECTION, limit=time_budget),
+                timeout=time_budget
+            )
+            for index, section in enumerate(sections):
+                yield index, [section], False
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取提取统计信息"""
+        with self.lock:
+            stats = dict(self.stats, workers=self.max_workers)
+        stats["cache"] = self.cache.stats()
+        return stats
+
+    def shutdown(self):
+        """关闭进程池"""
+        with self.lock:
+            if self.executor is not None:
+                self.executor.shutdown(wait=False, cancel_futures=True)
+                self.executor = None
+
+# 创建全局提取服务实例
+extraction_service = ExtractionService()
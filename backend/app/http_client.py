@@ -0,0 +1,141 @@
+import asyncio
+import threading
+import logging
+from typing import Dict, List, Optional, Any, Tuple
+from urllib.parse import urlparse
+
+import httpx
+
+from .config import (
+    HTTP_MAX_CONNECTIONS,
+    HTTP_MAX_KEEPALIVE_CONNECTIONS,
+    HTTP_KEEPALIVE_EXPIRY,
+    HTTP_CONNECT_TIMEOUT,
+    HTTP2_ENABLED
+)
+
+# 配置日志
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("http_client")
+
+# HTTP/2依赖h2包，未安装时回退到HTTP/1.1
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+class HttpClientManager:
+    """应用生命周期内共享的出站HTTP客户端管理器
+
+    每个(事件循环, 主机)对应一个独立的连接池。API请求运行在uvicorn的事件循环中，
+    而项目处理运行在调度器线程的事件循环中，httpx客户端不能跨事件循环复用，
+    因此按事件循环区分客户端。
+    """
+
+    def __init__(self):
+        self.clients: Dict[Tuple[asyncio.AbstractEventLoop, str], httpx.AsyncClient] = {}
+        self.request_counts: Dict[str, int] = {}
+        self.lock = threading.RLock()
+        self.started = False
+        self.http2 = HTTP2_ENABLED and HTTP2_AVAILABLE
+        if HTTP2_ENABLED and not HTTP2_AVAILABLE:
+            logger.warning("未安装h2，出站请求将使用HTTP/1.1")
+
+    def _create_client(self, host: str) -> httpx.AsyncClient:
+        """为指定主机创建带连接池的客户端"""
+        limits = httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY
+        )
+
+        async def on_request(request: httpx.Request):
+            with self.lock:
+                self.request_counts[host] = self.request_counts.get(host, 0) + 1
+
+        return httpx.AsyncClient(
+            http2=self.http2,
+            limits=limits,
+            timeout=httpx.Timeout(60.0, connect=HTTP_CONNECT_TIMEOUT),
+            follow_redirects=True,
+            event_hooks={"request": [on_request]}
+        )
+
+    def get_client(self, url: str) -> httpx.AsyncClient:
+        """获取目标URL所在主机的共享客户端（必须在事件循环中调用）"""
+        loop = asyncio.get_running_loop()
+        host = urlparse(url).netloc
+        key = (loop, host)
+
+        with self.lock:
+            client = self.clients.get(key)
+            if client is None or client.is_closed:
+                client = self._create_client(host)
+                self.clients[key] = client
+                logger.info(f"创建HTTP连接池: {host}, HTTP/2: {self.http2}")
+            return client
+
+    async def startup(self):
+        """应用启动时调用"""
+        self.started = True
+        logger.info("HTTP客户端管理器已启动")
+
+    async def shutdown(self):
+        """应用关闭时关闭所有连接池"""
+        current_loop = asyncio.get_running_loop()
+        with self.lock:
+            items = list(self.clients.items())
+            self.clients.clear()
+            self.started = False
+
+        for (loop, host), client in items:
+            try:
+                if loop is current_loop:
+                    await client.aclose()
+                elif loop.is_running():
+                    # 其他线程的事件循环中创建的客户端需要在其所属循环中关闭
+                    future = asyncio.run_coroutine_threadsafe(client.aclose(), loop)
+                    await asyncio.wrap_future(future)
+            except Exception as e:
+                logger.error(f"关闭HTTP连接池 {host} 时出错: {str(e)}")
+
+        logger.info("HTTP客户端管理器已关闭")
+
+    def _pool_connections(self, client: httpx.AsyncClient) -> List[Any]:
+        """读取底层httpcore连接池中的连接"""
+        pool = getattr(client._transport, "_pool", None)
+        return list(getattr(pool, "connections", []) or [])
+
+    def stats(self) -> Dict[str, Any]:
+        """获取各主机连接池的使用情况"""
+        hosts: Dict[str, Dict[str, Any]] = {}
+        with self.lock:
+            for (loop, host), client in self.clients.items():
+                connections = self._pool_connections(client)
+                idle = sum(1 for c in connections if c.is_idle())
+                entry = hosts.setdefault(host, {
+                    "pools": 0,
+                    "connections": 0,
+                    "idle_connections": 0,
+                    "active_connections": 0
+                })
+                entry["pools"] += 1
+                entry["connections"] += len(connections)
+                entry["idle_connections"] += idle
+                entry["active_connections"] += len(connections) - idle
+
+            for host, entry in hosts.items():
+                entry["requests_total"] = self.request_counts.get(host, 0)
+                entry["utilization"] = round(entry["active_connections"] / (HTTP_MAX_CONNECTIONS * entry["pools"]), 4)
+
+        return {
+            "http2": self.http2,
+            "max_connections": HTTP_MAX_CONNECTIONS,
+            "max_keepalive_connections": HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            "hosts": hosts
+        }
+
+# 创建全局HTTP客户端管理器实例
+http_clients = HttpClientManager()
@@ -0,0 +1,263 @@
+import os
+import json
+import time
+import uuid
+import socket
+import sqlite3
+import asyncio
+import threading
+import logging
+from contextlib import asynccontextmanager, contextmanager
+from typing import Dict, List, Optional, Any, Callable, Coroutine
+
+from .config import JOB_DB_PATH, JOB_LEASE_SECONDS, JOB_HEARTBEAT_INTERVAL, JOB_POLL_INTERVAL
+from .scheduler import scheduler
+
+# 配置日志
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("jobs")
+
+# 项目处理的检查点阶段，按执行顺序排列
+STAGES = ("translated", "searched", "extracted")
+
+class JobQueue:
+    """基于SQLite的持久化项目任务队列
+
+    每个项目对应一个任务，记录请求参数和最近完成的处理阶段的检查点。
+    进程重启后，未完成的任务从最后一个检查点继续执行，
+    不再重复已完成的翻译、搜索和论文处理。
+
+    多个进程共享同一个数据库文件。进程通过租约领取任务，持有期间(包括在调度器中
+    排队)由续约线程定期续约，进程退出或崩溃后租约过期，任务可被其他进程重新领取。
+    """
+
+    def __init__(self, db_path: str = JOB_DB_PATH):
+        self.db_path = db_path
+        # 当前进程实例的标识，作为租约持有者
+        self.instance_id = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.lock = threading.RLock()
+        # 当前进程持有租约的任务(包括在调度器中排队等待的任务)
+        self.held: set = set()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL,
+                stage TEXT,
+                checkpoint TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                owner TEXT,
+                lease_expires REAL,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        """)
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(jobs)")]
+        if "lease_expires" not in columns:
+            self.conn.execute("ALTER TABLE jobs ADD COLUMN lease_expires REAL")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, created_at)")
+
+        # 启动续约线程
+        self.heartbeat_thread = threading.Thread(target=self._heartbeat_scheduler, daemon=True)
+        self.heartbeat_thread.start()
+
+    def _heartbeat_scheduler(self):
+        """定期为持有的任务续约"""
+        while True:
+            time.sleep(JOB_HEARTBEAT_INTERVAL)
+            try:
+                self.heartbeat()
+            except Exception as e:
+                logger.error(f"任务续约出错: {str(e)}")
+
+    @contextmanager
+    def _transaction(self):
+        """写事务，BEGIN IMMEDIATE保证多个进程领取任务时互斥"""
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self.conn
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def enqueue(self, job_id: str, payload: Dict[str, Any], claim: bool = False):
+        """加入新任务，claim为True时由当前进程直接持有租约并开始执行"""
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO jobs (id, payload, status, attempts, owner, lease_expires, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, json.dumps(payload, ensure_ascii=False),
+                 "running" if claim else "queued", 1 if claim else 0,
+                 self.instance_id if claim else None, now + JOB_LEASE_SECONDS if claim else None,
+                 now, now)
+            )
+            if claim:
+                self.held.add(job_id)
+
+    def claim(self) -> Optional[Dict[str, Any]]:
+        """领取最早的待执行任务或租约已过期的任务，没有可领取的任务时返回None"""
+        now = time.time()
+        with self._transaction() as conn:
+            row = conn.execute(
+                "SELECT id, payload, stage, attempts, owner FROM jobs "
+                "WHERE status = 'queued' OR (status = 'running' AND (lease_expires IS NULL OR lease_expires < ?)) "
+                "ORDER BY created_at LIMIT 1",
+                (now,)
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = 'running', attempts = attempts + 1, owner = ?, "
+                "lease_expires = ?, updated_at = ? WHERE id = ?",
+                (self.instance_id, now + JOB_LEASE_SECONDS, now, row[0])
+            )
+            self.held.add(row[0])
+        return {
+            "id": row[0],
+            "payload": json.loads(row[1]),
+            "stage": row[2],
+            "attempts": row[3] + 1,
+            "previous_owner": row[4]
+        }
+
+    def heartbeat(self):
+        """为持有的全部任务续约，已被其他进程接管或已删除的任务不再持有"""
+        with self.lock:
+            if not self.held:
+                return
+            job_ids = list(self.held)
+            placeholders = ",".join("?" * len(job_ids))
+            self.conn.execute(
+                f"UPDATE jobs SET lease_expires = ? WHERE owner = ? AND id IN ({placeholders})",
+                (time.time() + JOB_LEASE_SECONDS, self.instance_id, *job_ids)
+            )
+            owned = {row[0] for row in self.conn.execute(
+                f"SELECT id FROM jobs WHERE owner = ? AND id IN ({placeholders})",
+                (self.instance_id, *job_ids)
+            )}
+            lost = self.held - owned
+            self.held &= owned
+        for job_id in lost:
+            logger.warning(f"任务 {job_id} 的租约已失效")
+
+    def holds(self, job_id: str) -> bool:
+        """当前进程是否仍持有任务租约"""
+        with self.lock:
+            return job_id in self.held
+
+    @asynccontextmanager
+    async def keep_alive(self, job_id: str):
+        """执行期间检查租约，租约丢失时取消当前任务，避免两个进程同时处理同一项目"""
+        current = asyncio.current_task()
+
+        async def watch():
+            while True:
+                await asyncio.sleep(JOB_HEARTBEAT_INTERVAL)
+                if not self.holds(job_id):
+                    logger.warning(f"任务 {job_id} 已被其他进程接管，停止处理")
+                    current.cancel()
+                    return
+
+        watch_task = asyncio.create_task(watch())
+        try:
+            yield
+        finally:
+            watch_task.cancel()
+
+    def checkpoint(self, job_id: str, stage: str, data: Dict[str, Any]):
+        """记录阶段检查点，data与之前的检查点合并"""
+        with self.lock:
+            row = self.conn.execute("SELECT checkpoint FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None:
+                return
+            checkpoint = json.loads(row[0]) if row[0] else {}
+            checkpoint.update(data)
+            self.conn.execute(
+                "UPDATE jobs SET stage = ?, checkpoint = ?, updated_at = ? WHERE id = ?",
+                (stage, json.dumps(checkpoint, ensure_ascii=False), time.time(), job_id)
+            )
+
+    def get_checkpoint(self, job_id: str) -> Dict[str, Any]:
+        """获取任务的检查点，包含已完成阶段stage和各阶段保存的数据"""
+        with self.lock:
+            row = self.conn.execute("SELECT stage, checkpoint FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None or row[0] is None:
+            return {}
+        return dict(json.loads(row[1]) if row[1] else {}, stage=row[0])
+
+    def finish(self, job_id: str):
+        """任务结束(完成或失败)，删除任务记录，结果和错误信息保存在项目数据中"""
+        with self.lock:
+            self.conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+            self.held.discard(job_id)
+
+    def release(self):
+        """进程正常退出时交还持有的任务，其他进程可以立即领取，不必等待租约过期"""
+        with self.lock:
+            cursor = self.conn.execute(
+                "UPDATE jobs SET status = 'queued', owner = NULL, lease_expires = NULL, updated_at = ? "
+                "WHERE owner = ? AND status = 'running'",
+                (time.time(), self.instance_id)
+            )
+            self.held.clear()
+        if cursor.rowcount:
+            logger.info(f"已交还 {cursor.rowcount} 个未完成的任务")
+
+    def count_queued(self) -> int:
+        """等待领取的任务数"""
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued'").fetchone()[0]
+
+    def stats(self) -> Dict[str, int]:
+        """按状态统计任务数"""
+        with self.lock:
+            rows = self.conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return {status: count for status, count in rows}
+
+class JobConsumer:
+    """从任务队列领取任务并提交到本进程的调度器执行
+
+    只在调度器有空闲槽位时领取，领取到的任务由handler(job)处理。
+    API进程(inline模式)用它接管崩溃进程遗留的任务，worker进程用它执行全部任务。
+    """
+
+    def __init__(self, queue: JobQueue, handler: Callable[[Dict[str, Any]], Coroutine],
+                 poll_interval: float = JOB_POLL_INTERVAL):
+        self.queue = queue
+        self.handler = handler
+        self.poll_interval = poll_interval
+        self.claimed = 0
+
+    async def run(self):
+        """持续领取任务"""
+        logger.info(f"任务消费者 {self.queue.instance_id} 已启动")
+        while True:
+            try:
+                job = None
+                if scheduler.idle_slots() > 0:
+                    job = await asyncio.to_thread(self.queue.claim)
+                if job is not None:
+                    self.claimed += 1
+                    logger.info(f"领取任务 {job['id']} (第{job['attempts']}次执行, 检查点: {job['stage'] or '无'})")
+                    scheduler.submit_task(self.handler(job), queue="projects", bypass_limit=True)
+                    continue
+            except Exception as e:
+                logger.error(f"领取任务出错: {str(e)}")
+            await asyncio.sleep(self.poll_interval)
+
+    def start(self):
+        """在调度器事件循环中运行"""
+        return asyncio.run_coroutine_threadsafe(self.run(), scheduler.loop)
+
+def stage_done(checkpoint: Dict[str, Any], stage: str) -> bool:
+    """检查点是否已经完成指定阶段"""
+    current = checkpoint.get("stage")
+    return current in STAGES and STAGES.index(current) >= STAGES.index(stage)
+
+# 创建全局任务队列实例
+job_queue = JobQueue()
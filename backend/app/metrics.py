@@ -0,0 +1,167 @@
+import time
+import bisect
+import threading
+import logging
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, List, Optional, Any, Callable, Tuple
+
+# 配置日志
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("metrics")
+
+# 阶段耗时直方图的桶上限(秒)
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+def escape_label_value(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def format_labels(labels: Dict[str, Any]) -> str:
+    """格式化Prometheus标签"""
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{escape_label_value(v)}"' for k, v in sorted(labels.items())) + "}"
+
+def format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+class Counter:
+    """只增计数器"""
+    type = "counter"
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self.values: Dict[Tuple, float] = {}
+        self.lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def collect(self) -> List[str]:
+        with self.lock:
+            return [f"{self.name}{format_labels(dict(key))} {format_value(value)}" for key, value in self.values.items()]
+
+class Histogram:
+    """按桶统计观测值分布"""
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(sorted(buckets))
+        # 标签 -> [各桶计数(非累积), 总和, 总数]
+        self.values: Dict[Tuple, List[Any]] = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            entry = self.values.get(key)
+            if entry is None:
+                entry = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][bisect.bisect_left(self.buckets, value)] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def collect(self) -> List[str]:
+        lines = []
+        with self.lock:
+            for key, (counts, total, count) in self.values.items():
+                labels = dict(key)
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += bucket_count
+                    lines.append(f"{self.name}_bucket{format_labels(dict(labels, le=format_value(bound)))} {cumulative}")
+                lines.append(f"{self.name}_sum{format_labels(labels)} {format_value(total)}")
+                lines.append(f"{self.name}_count{format_labels(labels)} {count}")
+        return lines
+
+class CallbackMetric:
+    """采集时调用函数读取当前值，用于导出已有的统计信息(调度器、缓存等)
+
+    collect_func返回[(标签字典, 值), ...]
+    """
+
+    def __init__(self, name: str, help: str, type: str, collect_func: Callable[[], List[Tuple[Dict[str, str], float]]]):
+        self.name = name
+        self.help = help
+        self.type = type
+        self.collect_func = collect_func
+
+    def collect(self) -> List[str]:
+        return [f"{self.name}{format_labels(labels)} {format_value(value)}" for labels, value in self.collect_func()]
+
+class MetricsRegistry:
+    """指标注册表，按Prometheus文本格式导出"""
+
+    def __init__(self):
+        self.metrics: Dict[str, Any] = {}
+        self.lock = threading.Lock()
+
+    def register(self, metric):
+        with self.lock:
+            self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str) -> Counter:
+        return self.register(Counter(name, help))
+
+    def histogram(self, name: str, help: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help, buckets))
+
+    def callback(self, name: str, help: str, type: str, collect_func) -> CallbackMetric:
+        return self.register(CallbackMetric(name, help, type, collect_func))
+
+    def render(self) -> str:
+        """生成Prometheus文本格式"""
+        with self.lock:
+            metrics = list(self.metrics.values())
+        lines = []
+        for metric in metrics:
+            try:
+                samples = metric.collect()
+            except Exception as e:
+                logger.error(f"采集指标 {metric.name} 出错: {str(e)}")
+                continue
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(samples)
+        return "\n".join(lines) + "\n"
+
+# 创建全局指标注册表实例
+metrics = MetricsRegistry()
+
+# 处理阶段耗时: translate / search / download / extract / pipeline / generate
+stage_seconds = metrics.histogram("proposal_stage_duration_seconds", "项目各处理阶段耗时")
+llm_tokens = metrics.counter("proposal_llm_tokens_total", "大模型API消耗的token数")
+download_bytes = metrics.counter("proposal_download_bytes_total", "下载的论文PDF字节数")
+projects_total = metrics.counter("proposal_projects_total", "按结果统计的已处理项目数")
+reclaimed_bytes = metrics.counter("proposal_reclaimed_bytes_total", "数据清理释放的字节数")
+
+@contextmanager
+def timed_stage(stage: str, spans: Optional[List[Dict[str, Any]]] = None, **attributes):
+    """记录一个处理阶段的耗时
+
+    耗时写入stage_seconds直方图；传入spans时同时追加一条计时记录，用于保存到项目数据中。
+    """
+    started_at = datetime.now().isoformat()
+    started = time.monotonic()
+    outcome = "ok"
+    try:
+        yield
+    except BaseException:
+        outcome = "error"
+        raise
+    finally:
+        duration = time.monotonic() - started
+        stage_seconds.observe(duration, stage=stage)
+        if spans is not None:
+            spans.append(dict(attributes, stage=stage, started_at=started_at,
+                              duration=round(duration, 3), outcome=outcome))
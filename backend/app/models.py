@@ -29,14 +29,14 @@ class PaperInfo(BaseModel):
     authors: List[str]
     summary: str
     published: str
-    pdf_url: str
+    pdf_url: Optional[str] = None
     local_path: Optional[str] = None
     content_extracted: bool = False
 
 class ProjectResult(BaseModel):
     technical_proposal: str
     architecture_diagram: Optional[str] = None
-    implementation_steps: List[Dict[str, str]] = []
+    implementation_steps: List[Dict[str, Any]] = []
     resources_needed: List[Dict[str, str]] = []
     references: List[PaperInfo] = []
     translated_topic: Optional[str] = None
@@ -50,6 +50,9 @@ class Project(BaseModel):
     updated_at: Optional[str] = None
     status: ProjectStatus
     params: Dict[str, Any] = {}
+    timings: List[Dict[str, Any]] = []
+    prompt_stats: Optional[Dict[str, Any]] = None
+    reused_from: Optional[str] = None
     result: Optional[ProjectResult] = None
 
 class StreamingResponse(BaseModel):
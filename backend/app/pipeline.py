@@ -0,0 +1,111 @@
+import math
+import time
+import asyncio
+import logging
+from typing import Dict, List, Optional, Any, Tuple, Callable
+
+from .config import PIPELINE_QUORUM_RATIO, PIPELINE_GRACE_SECONDS, EXTRACTION_WORKERS
+from .downloader import downloader
+from .ai_service import extract_paper_content
+
+# 配置日志
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("pipeline")
+
+async def run_paper_pipeline(
+    papers: List[Dict[str, Any]],
+    download_timeout: int = 60,
+    max_pages: int = 5,
+    on_progress: Optional[Callable[[int, int], None]] = None
+) -> Tuple[List[Dict[str, Any]], List[str], Dict[str, Any]]:
+    """以流水线方式下载并提取论文
+
+    每篇论文下载完成后立即进入提取队列，由多个提取协程并发处理，
+    不必等待全部下载结束。当就绪论文达到法定数量(PIPELINE_QUORUM_RATIO)后，
+    再最多等待PIPELINE_GRACE_SECONDS秒，剩余论文将被放弃。
+
+    返回(就绪论文列表, 对应的提取内容列表, 流水线统计信息)
+    """
+    started = time.monotonic()
+    total = len(papers)
+    quorum = max(1, min(total, math.ceil(total * PIPELINE_QUORUM_RATIO)))
+    stats = {"total": total, "quorum": quorum, "ready": 0, "abandoned": 0, "quorum_at": None, "elapsed": 0.0}
+    if not papers:
+        return [], [], stats
+
+    extract_queue: asyncio.Queue = asyncio.Queue()
+    contents: Dict[int, str] = {}
+    quorum_reached = asyncio.Event()
+    all_done = asyncio.Event()
+    finished = 0
+
+    def mark_finished():
+        """一篇论文离开流水线（就绪或失败）"""
+        nonlocal finished
+        finished += 1
+        if on_progress:
+            on_progress(len(contents), total)
+        if len(contents) >= quorum and not quorum_reached.is_set():
+            stats["quorum_at"] = round(time.monotonic() - started, 3)
+            quorum_reached.set()
+        if finished >= total:
+            all_done.set()
+            quorum_reached.set()
+
+    async def download_stage(index: int, paper: Dict[str, Any]):
+        """下载阶段，成功后把论文放入提取队列"""
+        try:
+            result_path = await downloader.download(paper, download_timeout)
+            if result_path:
+                paper["local_path"] = result_path
+                await extract_queue.put(index)
+                return
+            logger.warning(f"论文 {paper['id']} 下载失败，跳过")
+        except Exception as e:
+            logger.error(f"下载论文 {paper['id']} 时出错: {str(e)}")
+        mark_finished()
+
+    async def extract_worker():
+        """提取阶段，从队列中取出已下载的论文"""
+        while True:
+            index = await extract_queue.get()
+            try:
+                contents[index] = await extract_paper_content(papers[index], max_pages)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"提取论文 {papers[index]['id']} 时出错: {str(e)}")
+            mark_finished()
+
+    tasks = [asyncio.create_task(download_stage(i, paper)) for i, paper in enumerate(papers)]
+    tasks += [asyncio.create_task(extract_worker()) for _ in range(min(EXTRACTION_WORKERS, total))]
+
+    try:
+        await quorum_reached.wait()
+        if not all_done.is_set():
+            try:
+                await asyncio.wait_for(all_done.wait(), timeout=PIPELINE_GRACE_SECONDS)
+            except asyncio.TimeoutError:
+                logger.warning(f"已有 {len(contents)}/{total} 篇论文就绪，放弃剩余论文")
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    ready = sorted(contents)
+    ready_papers = [papers[i] for i in ready]
+    ready_contents = [contents[i] for i in ready]
+
+    # 确保至少有一篇论文可用
+    if not ready_papers:
+        logger.warning("所有论文下载失败，但仍将使用元数据继续处理")
+        ready_papers = [papers[0]]
+        ready_contents = [papers[0].get("summary", "")]
+
+    stats.update({
+        "ready": len(ready),
+        "abandoned": total - finished,
+        "elapsed": round(time.monotonic() - started, 3)
+    })
+    logger.info(f"论文流水线完成: {stats}")
+    return ready_papers, ready_contents, stats
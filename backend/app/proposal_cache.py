@@ -0,0 +1,200 @@
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+import unicodedata
+import logging
+from typing import Dict, List, Optional, Any, Callable
+
+from .config import PROPOSAL_CACHE_DB_PATH, PROPOSAL_CACHE_TTL
+
+# 配置日志
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("proposal_cache")
+
+def normalize_text(text: Optional[str]) -> str:
+    """统一全半角、大小写和空白"""
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFKC", text or "")).strip().lower()
+
+def canonical_request(request: Dict[str, Any]) -> Dict[str, Any]:
+    """项目请求中影响生成结果的字段的规范化表示
+
+    标题不影响生成结果，不包含在内；关键词去重排序。
+    """
+    model_type = request.get("model_type") or "default"
+    return {
+        "topic": normalize_text(request.get("topic")),
+        "description": normalize_text(request.get("description")),
+        "model_type": getattr(model_type, "value", model_type),
+        "max_papers": request.get("max_papers") or 5,
+        "custom_keywords": sorted({normalize_text(k) for k in request.get("custom_keywords") or [] if k.strip()}),
+        "params": request.get("params") or {}
+    }
+
+def digest(canonical: Dict[str, Any]) -> str:
+    return hashlib.sha256(json.dumps(canonical, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8")).hexdigest()
+
+def request_fingerprint(request: Dict[str, Any]) -> str:
+    """计算项目请求的规范化指纹"""
+    return digest(canonical_request(request))
+
+def options_fingerprint(request: Dict[str, Any]) -> str:
+    """除主题外的请求指纹
+
+    语义索引按相似度比较主题，其余字段(描述、模型、论文数、关键词等)需要完全相同才能复用方案。
+    """
+    canonical = canonical_request(request)
+    del canonical["topic"]
+    return digest(canonical)
+
+def paper_key(papers: List[Dict[str, Any]]) -> str:
+    """参考论文ID集合的规范化表示"""
+    return ",".join(sorted({paper["id"] for paper in papers if paper.get("id")}))
+
+class ProposalCache:
+    """技术方案结果缓存和相同请求合并
+
+    结果按(请求指纹, 参考论文ID集合)保存，在PROPOSAL_CACHE_TTL内有效。
+    同一指纹的请求正在处理时，新项目登记为跟随者，不再单独执行，
+    领头项目结束后把结果(或错误)复制给所有跟随者。
+    数据保存在SQLite中，多个API和worker进程共享。
+    """
+
+    def __init__(self, db_path: str = PROPOSAL_CACHE_DB_PATH, ttl: float = PROPOSAL_CACHE_TTL):
+        self.ttl = ttl
+        self.lock = threading.RLock()
+        self.counters = {"hits": 0, "misses": 0, "coalesced": 0}
+        self.conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS results (
+                fingerprint TEXT NOT NULL,
+                paper_key TEXT NOT NULL,
+                project_id TEXT NOT NULL,
+                result TEXT NOT NULL,
+                papers TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                PRIMARY KEY (fingerprint, paper_key)
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_results_created ON results (created_at)")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS inflight (
+                fingerprint TEXT PRIMARY KEY,
+                project_id TEXT NOT NULL,
+                started_at REAL NOT NULL
+            )
+        """)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS followers (
+                project_id TEXT PRIMARY KEY,
+                leader TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_followers_leader ON followers (leader)")
+
+    def lookup(self, fingerprint: str, papers_key: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """查找有效期内的结果，不指定论文集合时返回该请求最新的结果"""
+        if self.ttl <= 0:
+            return None
+        query = "SELECT project_id, result, papers, created_at FROM results WHERE fingerprint = ? AND created_at >= ?"
+        args = [fingerprint, time.time() - self.ttl]
+        if papers_key is not None:
+            query += " AND paper_key = ?"
+            args.append(papers_key)
+        with self.lock:
+            row = self.conn.execute(query + " ORDER BY created_at DESC LIMIT 1", args).fetchone()
+            self.counters["hits" if row else "misses"] += 1
+        if row is None:
+            return None
+        project_id, result, papers, created_at = row
+        return {"project_id": project_id, "result": json.loads(result), "papers": json.loads(papers), "created_at": created_at}
+
+    def put(self, fingerprint: str, papers_key: str, project_id: str,
+            result: Dict[str, Any], papers: List[Dict[str, Any]]):
+        """保存结果，同时删除过期的结果"""
+        if self.ttl <= 0:
+            return
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO results (fingerprint, paper_key, project_id, result, papers, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (fingerprint, papers_key, project_id, json.dumps(result, ensure_ascii=False),
+                 json.dumps(papers, ensure_ascii=False), now)
+            )
+            self.conn.execute("DELETE FROM results WHERE created_at < ?", (now - self.ttl,))
+
+    def join(self, fingerprint: str, project_id: str, is_active: Callable[[str], bool]) -> Optional[str]:
+        """登记进行中的请求
+
+        已有相同指纹的项目正在处理(is_active返回True)时，把project_id登记为它的跟随者并返回领头项目ID；
+        否则project_id成为领头项目，返回None。
+        """
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self.conn.execute("SELECT project_id FROM inflight WHERE fingerprint = ?", (fingerprint,)).fetchone()
+                if row and row[0] != project_id and is_active(row[0]):
+                    self.conn.execute(
+                        "INSERT OR REPLACE INTO followers (project_id, leader, created_at) VALUES (?, ?, ?)",
+                        (project_id, row[0], time.time())
+                    )
+                    self.counters["coalesced"] += 1
+                    leader = row[0]
+                else:
+                    self.conn.execute(
+                        "INSERT OR REPLACE INTO inflight (fingerprint, project_id, started_at) VALUES (?, ?, ?)",
+                        (fingerprint, project_id, time.time())
+                    )
+                    leader = None
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        return leader
+
+    def settle(self, project_id: str) -> List[str]:
+        """领头项目结束后移除进行中记录，返回需要同步结果的跟随者"""
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                self.conn.execute("DELETE FROM inflight WHERE project_id = ?", (project_id,))
+                followers = [row[0] for row in self.conn.execute(
+                    "SELECT project_id FROM followers WHERE leader = ?", (project_id,)
+                )]
+                self.conn.execute("DELETE FROM followers WHERE leader = ?", (project_id,))
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        return followers
+
+    def forget(self, project_ids: List[str]):
+        """删除已过期项目的结果和合并记录"""
+        if not project_ids:
+            return
+        placeholders = ",".join("?" * len(project_ids))
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                self.conn.execute(f"DELETE FROM results WHERE project_id IN ({placeholders})", project_ids)
+                self.conn.execute(f"DELETE FROM inflight WHERE project_id IN ({placeholders})", project_ids)
+                self.conn.execute(f"DELETE FROM followers WHERE project_id IN ({placeholders})", project_ids)
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            results = self.conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+            inflight = self.conn.execute("SELECT COUNT(*) FROM inflight").fetchone()[0]
+            followers = self.conn.execute("SELECT COUNT(*) FROM followers").fetchone()[0]
+            return dict(self.counters, results=results, inflight=inflight, followers=followers, ttl=self.ttl)
+
+# 创建全局方案缓存实例
+proposal_cache = ProposalCache()
@@ -0,0 +1,196 @@
+import os
+import time
+import shutil
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, List, Any
+
+from .config import (
+    PDF_DIR,
+    UPLOAD_DIR,
+    DATA_RETENTION_HOURS,
+    BLOB_GC_GRACE_HOURS,
+    RETENTION_BATCH_SIZE,
+    RETENTION_MAX_BATCHES
+)
+from .blobs import blob_store, project_owner
+from .documents import document_ingestor
+from .embeddings import embedding_index
+from .proposal_cache import proposal_cache
+from .metrics import reclaimed_bytes
+
+# 配置日志
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("retention")
+
+# 清理的各个阶段: 过期项目 -> 未引用的存储文件 -> 旧版本遗留和中断留下的临时文件
+PHASES = ("projects", "blobs", "files")
+
+def tree_size(path: str) -> int:
+    """目录(或文件)占用的字节数"""
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+def remove_tree(path: str) -> int:
+    """删除目录，返回释放的字节数，目录不存在时返回0"""
+    if not os.path.isdir(path):
+        return 0
+    size = tree_size(path)
+    shutil.rmtree(path, ignore_errors=True)
+    return size
+
+class RetentionEngine:
+    """按过期索引分批清理数据
+
+    过期项目由存储后端按created_at顺序给出(SQLite使用索引范围查询，JSON目录使用最小堆)，
+    每批最多删除RETENTION_BATCH_SIZE个项目并释放它们对文件存储的引用；
+    随后分批回收不再被引用的论文PDF和上传文件(连同上传文档的解析结果)，
+    以及PDF_DIR、上传目录中旧版本遗留的文件和中断留下的临时文件。
+    每一批是一次独立的操作，调用方可以在批之间让出写入线程；
+    单次清理最多执行RETENTION_MAX_BATCHES批，剩余的留到下一次。
+    """
+
+    def __init__(self, database, batch_size: int = RETENTION_BATCH_SIZE,
+                 max_batches: int = RETENTION_MAX_BATCHES):
+        self.database = database
+        self.batch_size = batch_size
+        self.max_batches = max_batches
+        self.last_report: Dict[str, Any] = {}
+        self.totals = {"runs": 0, "projects": 0, "blobs": 0, "files": 0, "reclaimed_bytes": 0}
+
+    def start(self) -> Dict[str, Any]:
+        """开始一次清理，返回记录进度和结果的报告"""
+        now = datetime.now()
+        return {
+            "started_at": now.isoformat(),
+            "expire_before": (now - timedelta(hours=DATA_RETENTION_HOURS)).isoformat(),
+            "phase": PHASES[0],
+            "batches": 0,
+            "projects": 0,
+            "project_bytes": 0,
+            "blobs": 0,
+            "blob_bytes": 0,
+            "files": 0,
+            "file_bytes": 0,
+            "more": False,
+            "started": time.monotonic()
+        }
+
+    def step(self, report: Dict[str, Any]) -> bool:
+        """执行当前阶段的一批清理，返回是否还需要继续执行"""
+        if report["phase"] is None:
+            return False
+        if report["batches"] >= self.max_batches:
+            report["more"] = True
+            report["phase"] = None
+            return False
+
+        phase = report["phase"]
+        if phase == "projects":
+            count = self._expire_projects(report)
+        elif phase == "blobs":
+            count = self._collect_blobs(report)
+        else:
+            count = self._sweep_files(report)
+        report["batches"] += 1
+
+        # 不满一批说明当前阶段已经完成
+        if count < self.batch_size:
+            index = PHASES.index(phase) + 1
+            report["phase"] = PHASES[index] if index < len(PHASES) else None
+        return report["phase"] is not None
+
+    def finish(self, report: Dict[str, Any]) -> Dict[str, Any]:
+        """汇总清理结果"""
+        report.pop("phase", None)
+        report["elapsed"] = round(time.monotonic() - report.pop("started"), 3)
+        report["reclaimed_bytes"] = report["project_bytes"] + report["blob_bytes"] + report["file_bytes"]
+        self.last_report = report
+        self.totals["runs"] += 1
+        for key in ("projects", "blobs", "files", "reclaimed_bytes"):
+            self.totals[key] += report[key]
+        if report["projects"] or report["blobs"] or report["files"]:
+            logger.info(
+                f"数据清理完成: 项目 {report['projects']} 个, 文件 {report['blobs'] + report['files']} 个, "
+                f"释放 {report['reclaimed_bytes']} 字节, 耗时 {report['elapsed']}秒"
+                + (", 剩余部分下次继续" if report["more"] else "")
+            )
+        return report
+
+    def run(self) -> Dict[str, Any]:
+        """同步执行一次完整的清理"""
+        report = self.start()
+        while self.step(report):
+            pass
+        return self.finish(report)
+
+    def _expire_projects(self, report: Dict[str, Any]) -> int:
+        project_ids = self.database.backend.list_expired(report["expire_before"], self.batch_size)
+        if not project_ids:
+            return 0
+        # 持有flush_lock，避免正在进行的写入在删除之后把项目写回存储
+        with self.database.flush_lock:
+            with self.database.pending_lock:
+                for project_id in project_ids:
+                    self.database.pending.pop(project_id, None)
+            size = self.database.backend.delete_many(project_ids)
+        blob_store.release([project_owner(project_id) for project_id in project_ids])
+        # 过期项目不再作为相似项目或缓存结果被复用
+        embedding_index.remove_projects(project_ids)
+        proposal_cache.forget(project_ids)
+        # 旧版本保存在项目目录中的上传文件
+        for project_id in project_ids:
+            size += remove_tree(os.path.join(self.database.projects_dir, project_id))
+
+        report["projects"] += len(project_ids)
+        report["project_bytes"] += size
+        reclaimed_bytes.inc(size, kind="projects")
+        return len(project_ids)
+
+    def _collect_blobs(self, report: Dict[str, Any]) -> int:
+        removed = blob_store.collect_garbage(BLOB_GC_GRACE_HOURS, self.batch_size)
+        # 删除已回收的上传文档的解析结果
+        document_ingestor.forget(removed["sha256s"])
+        report["blobs"] += removed["blobs"]
+        report["blob_bytes"] += removed["bytes"]
+        reclaimed_bytes.inc(removed["bytes"], kind="blobs")
+        return removed["blobs"]
+
+    def _sweep_files(self, report: Dict[str, Any]) -> int:
+        """删除超过宽限期的遗留文件: 旧版本按论文ID保存的PDF、按摘要保存的上传文件，以及未完成的临时文件"""
+        cutoff = time.time() - BLOB_GC_GRACE_HOURS * 3600
+        removed, size = 0, 0
+        for directory in (PDF_DIR, UPLOAD_DIR, os.path.join(UPLOAD_DIR, "tmp"), blob_store.temp_dir):
+            if not os.path.isdir(directory):
+                continue
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if removed >= self.batch_size:
+                        break
+                    try:
+                        if not entry.is_file(follow_symlinks=False):
+                            continue
+                        stat = entry.stat(follow_symlinks=False)
+                        if stat.st_mtime >= cutoff:
+                            continue
+                        os.remove(entry.path)
+                    except FileNotFoundError:
+                        continue
+                    removed += 1
+                    size += stat.st_size
+
+        report["files"] += removed
+        report["file_bytes"] += size
+        reclaimed_bytes.inc(size, kind="files")
+        return removed
+
+    def stats(self) -> Dict[str, Any]:
+        return {"last_run": self.last_report, "totals": self.totals, "batch_size": self.batch_size}
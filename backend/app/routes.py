@@ -1,27 +1,38 @@
-from fastapi import FastAPI, HTTPException, BackgroundTasks, File, UploadFile, Form, Depends, Query
-from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi import FastAPI, HTTPException, BackgroundTasks, File, UploadFile, Form, Depends, Query, Request
+from fastapi.responses import JSONResponse, StreamingResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
 import asyncio
 import json
-import os
-import shutil
 from typing import Dict, List, Optional, Any
 import logging
 import time
 
 from .models import ProjectRequest, Project, ProjectStatus, ErrorResponse
-from .database import db
-from .scheduler import scheduler
+from .database import db, async_db
+from .scheduler import scheduler, SchedulerSaturated
+from .http_client import http_clients
+from .events import events, TERMINAL_EVENTS, RESYNC_EVENT
 from .ai_service import (
+    search_cache,
+    translation_cache,
     translate_to_english,
     search_arxiv_papers,
-    download_papers,
-    extract_paper_content,
     generate_technical_proposal,
     process_uploaded_file,
     analyze_web_content
 )
-from .config import PDF_DIR
+from .pipeline import run_paper_pipeline
+from .downloader import downloader
+from .blobs import blob_store
+from .documents import document_ingestor, is_supported
+from .extraction import extraction_service
+from .jobs import job_queue, stage_done, JobConsumer
+from .corpus import corpus
+from .embeddings import embedding_index
+from .proposal_cache import proposal_cache, request_fingerprint, options_fingerprint, paper_key
+from .uploads import StreamingUpload, UploadError, UploadTooLarge, MULTIPART_OVERHEAD, store_upload
+from .metrics import metrics, timed_stage, projects_total
+from .config import UPLOAD_MAX_BYTES, RETENTION_INTERVAL, DOCUMENT_WAIT_SECONDS, DOCUMENT_CONTEXT_CHUNKS, CORPUS_SKIP_SEARCH, JOB_MAX_ATTEMPTS, JOB_EXECUTION_MODE, JOB_LEASE_SECONDS, JOB_POLL_INTERVAL, SCHEDULER_MAX_QUEUE
 
 # 配置日志
 logging.basicConfig(level=logging.INFO)
@@ -37,34 +48,121 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
+def collect_health() -> Dict[str, Any]:
+    """汇总各组件的状态，其中多项需要查询SQLite，由调用方放到I/O线程中执行"""
+    return {
+        "status": "ok",
+        "message": "服务正常运行",
+        "http_pool": http_clients.stats(),
+        "scheduler": scheduler.get_stats(),
+        "jobs": job_queue.stats(),
+        "corpus": corpus.stats(),
+        "embeddings": embedding_index.stats(),
+        "proposal_cache": proposal_cache.stats(),
+        "blobs": blob_store.usage(),
+        "documents": document_ingestor.stats(),
+        "retention": db.retention.stats()
+    }
+
 @app.get("/api/health")
 async def health_check():
     """健康检查接口"""
-    return {"status": "ok", "message": "服务正常运行"}
+    return await async_db.run(collect_health)
+
+@app.get("/metrics")
+async def export_metrics():
+    """以Prometheus文本格式导出指标，部分指标需要查询SQLite，在线程中生成"""
+    body = await asyncio.to_thread(metrics.render)
+    return Response(body, media_type="text/plain; version=0.0.4; charset=utf-8")
+
+def collect_scheduler_metrics():
+    stats = scheduler.get_stats()
+    return [({"state": "running"}, stats["running"]), ({"state": "queued"}, stats["queue_depth"])]
+
+def collect_cache_metrics(result: str):
+    caches = {
+        "search": search_cache.stats(),
+        "translation": translation_cache.stats(),
+        "extraction": extraction_service.cache.stats(),
+        "proposal": proposal_cache.stats()
+    }
+    return [({"cache": name}, stats[result]) for name, stats in caches.items()]
+
+def collect_blob_metrics():
+    usage = blob_store.usage()
+    return [({"kind": "stored"}, usage["bytes"]), ({"kind": "referenced"}, usage["referenced_bytes"])]
+
+metrics.callback("proposal_scheduler_tasks", "调度器中运行和排队的任务数", "gauge", collect_scheduler_metrics)
+metrics.callback("proposal_cache_hits_total", "缓存命中次数", "counter", lambda: collect_cache_metrics("hits"))
+metrics.callback("proposal_cache_misses_total", "缓存未命中次数", "counter", lambda: collect_cache_metrics("misses"))
+metrics.callback("proposal_corpus_papers", "本地论文索引中的论文数", "gauge",
+                 lambda: [({}, corpus.stats()["papers"])])
+metrics.callback("proposal_blob_bytes", "文件存储的磁盘占用(stored)和项目引用的内容大小(referenced)", "gauge",
+                 collect_blob_metrics)
+metrics.callback("proposal_jobs", "持久化任务队列中按状态统计的任务数", "gauge",
+                 lambda: [({"status": status}, count) for status, count in job_queue.stats().items()])
 
 @app.post("/api/projects", response_model=Dict[str, Any])
 async def create_project(project_request: ProjectRequest):
-    """创建新的技术方案项目"""
+    """创建新的技术方案项目
+
+    相同请求在有效期内已有结果时直接返回已完成的项目；相同请求正在处理时合并到该项目，不再重复执行。
+    """
+    fingerprint = request_fingerprint(project_request.dict())
+    cached = await async_db.run(proposal_cache.lookup, fingerprint)
+    
+    # 任务队列已满时拒绝请求，提示客户端稍后重试
+    if not cached:
+        try:
+            await async_db.run(check_capacity)
+        except SchedulerSaturated as e:
+            raise_busy(e)
+    
     try:
         # 创建项目记录
-        project_id = db.create_project(
+        project_id = await async_db.create_project(
             title=project_request.title,
             topic=project_request.topic,
             params=project_request.dict()
         )
         
-        # 提交后台任务
-        task_id = scheduler.submit_task(
-            process_project(project_id, project_request)
-        )
+        if cached:
+            await complete_with_result(project_id, cached["result"], cached["papers"], cached["project_id"],
+                                 "已返回相同请求的缓存结果")
+            return {
+                "status": "success",
+                "message": "已返回相同请求的缓存结果",
+                "project_id": project_id,
+                "task_id": None,
+                "reused_from": cached["project_id"]
+            }
         
-        # 更新项目状态为处理中
-        db.update_project(project_id, {
-            "status": "processing",
-            "task_id": task_id
-        })
+        leader = await async_db.run(proposal_cache.join, fingerprint, project_id, is_project_active)
+        if leader:
+            await update_project_status(project_id, {
+                "status": "processing",
+                "status_message": "相同的请求正在处理中，完成后同步结果"
+            })
+            return {
+                "status": "success",
+                "message": "相同的请求正在处理中，完成后同步结果",
+                "project_id": project_id,
+                "task_id": None,
+                "coalesced_with": leader
+            }
+        
+        # 已登记为进行中的请求，未能开始处理时必须撤销登记，否则之后的相同请求会合并到一个不会执行的项目
+        try:
+            task_id = await start_project(project_id, project_request)
+        except SchedulerSaturated as e:
+            await abandon_project(project_id, "服务繁忙，请稍后重试")
+            raise_busy(e)
+        except Exception as e:
+            await abandon_project(project_id, f"创建项目时出错: {str(e)[:100]}")
+            raise
         
         return {
             "status": "success",
@@ -72,157 +170,603 @@ async def create_project(project_request: ProjectRequest):
             "project_id": project_id,
             "task_id": task_id
         }
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"创建项目时出错: {str(e)}")
         raise HTTPException(status_code=500, detail=f"创建项目时出错: {str(e)}")
 
+async def start_project(project_id: str, project_request: ProjectRequest,
+                        bypass_limit: bool = False) -> Optional[str]:
+    """把项目写入任务队列并开始处理，返回调度器任务ID(worker模式下为None)
+
+    调度器等待队列已满时撤回任务并抛出SchedulerSaturated。
+    """
+    if JOB_EXECUTION_MODE == "worker":
+        # 写入共享任务队列，由worker进程领取执行
+        await async_db.run(job_queue.enqueue, project_id, project_request.dict())
+        await update_project_status(project_id, {
+            "status": "processing",
+            "status_message": "已加入任务队列，等待处理"
+        })
+        return None
+    
+    # 先写入持久化任务队列，服务重启后可以恢复
+    await async_db.run(job_queue.enqueue, project_id, project_request.dict(), claim=True)
+    
+    # 提交后台任务
+    try:
+        task_id = scheduler.submit_task(
+            process_project(project_id, project_request),
+            queue="projects",
+            bypass_limit=bypass_limit
+        )
+    except SchedulerSaturated:
+        await async_db.run(job_queue.finish, project_id)
+        raise
+    
+    # 更新项目状态为处理中
+    await update_project_status(project_id, {
+        "status": "processing",
+        "task_id": task_id
+    })
+    return task_id
+
+def check_capacity():
+    """检查是否还能接受新项目，worker模式下按共享队列中等待的任务数判断"""
+    if JOB_EXECUTION_MODE == "worker":
+        queued = job_queue.count_queued()
+        if queued >= SCHEDULER_MAX_QUEUE:
+            raise SchedulerSaturated(JOB_LEASE_SECONDS, queued)
+    else:
+        scheduler.check_capacity("projects")
+
+def raise_busy(error: SchedulerSaturated):
+    """返回429，并通过Retry-After告知客户端重试时间"""
+    logger.warning(f"任务队列已满，拒绝新项目: {str(error)}")
+    raise HTTPException(
+        status_code=429,
+        detail=f"服务繁忙，请在 {error.retry_after} 秒后重试",
+        headers={"Retry-After": str(error.retry_after)}
+    )
+
+def publish_status(project_id: str, data: Dict[str, Any]):
+    """向SSE订阅者推送状态变化"""
+    event_data = {k: v for k, v in data.items() if k in ("status", "status_message", "translated_topic", "error")}
+    if event_data:
+        events.publish(project_id, "status", event_data)
+
+async def update_project_status(project_id: str, data: Dict[str, Any]):
+    """更新项目数据并向SSE订阅者推送状态变化"""
+    await async_db.update_project(project_id, data)
+    publish_status(project_id, data)
+
+async def reuse_similar_proposal(project_id: str, query: str, request: ProjectRequest,
+                                 timings: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """检索词与已完成的历史项目几乎相同、其余请求参数完全相同时，复制其技术方案，不再检索和生成"""
+    # 有上传文档的项目需要结合文档内容生成
+    project = await async_db.get_project(project_id)
+    if project and project.get("files"):
+        return None
+    try:
+        hit = await asyncio.to_thread(embedding_index.find_similar_proposal, query, options_fingerprint(request.dict()))
+    except Exception as e:
+        logger.error(f"查找相似历史项目时出错: {str(e)}")
+        return None
+    if hit is None or hit["ref"] == project_id:
+        return None
+    source = await async_db.get_project(hit["ref"])
+    if not source or source.get("status") != "completed" or not source.get("result"):
+        return None
+
+    logger.info(f"项目 {project_id} 复用相似项目 {hit['ref']} 的技术方案 (相似度 {hit['score']})")
+    await complete_with_result(project_id, source["result"], source.get("papers", []), hit["ref"],
+                         "已复用相似项目的技术方案", timings)
+    await async_db.run(job_queue.finish, project_id)
+    return {"success": True, "project_id": project_id, "reused_from": hit["ref"]}
+
+async def collect_documents(project_id: str, query: str,
+                            timings: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """取出项目上传文档中与query相关的片段
+
+    上传时已提交后台解析，这里补交尚未解析的文档(如由其他进程上传)，最多等待DOCUMENT_WAIT_SECONDS秒，
+    届时仍未解析完成或解析失败的文档不参与本次生成。
+    """
+    project = await async_db.get_project(project_id)
+    files: Dict[str, Dict[str, Any]] = {}
+    for file in (project or {}).get("files", []):
+        if file.get("sha256") and is_supported(file["filename"]):
+            files.setdefault(file["sha256"], file)
+    if not files:
+        return []
+
+    with timed_stage("documents", timings):
+        await update_project_status(project_id, {"status_message": f"正在解析上传的文档 ({len(files)} 个)"})
+        for sha256, file in files.items():
+            await process_uploaded_file(blob_store.path(sha256), file["filename"], sha256)
+        states = await document_ingestor.wait(list(files), DOCUMENT_WAIT_SECONDS)
+        ready = [sha256 for sha256 in files if states.get(sha256, {}).get("status") == "ready"]
+        chunks = await asyncio.to_thread(document_ingestor.top_chunks, ready, query, DOCUMENT_CONTEXT_CHUNKS)
+    if len(ready) < len(files):
+        logger.warning(f"项目 {project_id} 有 {len(files) - len(ready)} 个上传文档解析失败或未能及时完成，本次生成不使用")
+    return [
+        {
+            "filename": files[sha256]["filename"],
+            "sha256": sha256,
+            "pages": states[sha256]["pages"],
+            "truncated": states[sha256]["truncated"],
+            "chunks": chunks.get(sha256, [])
+        }
+        for sha256 in ready
+    ]
+
+async def complete_with_result(project_id: str, result: Dict[str, Any], papers: List[Dict[str, Any]],
+                         reused_from: str, message: str, timings: Optional[List[Dict[str, Any]]] = None):
+    """把已有项目的技术方案复制到项目中并标记为完成"""
+    await async_db.save_project_result(project_id, result)
+    await async_db.attach_papers(project_id, [paper["id"] for paper in papers])
+    data = {
+        "status": "completed",
+        "papers": papers,
+        "reused_from": reused_from,
+        "status_message": message
+    }
+    if timings is not None:
+        data["timings"] = timings
+    await update_project_status(project_id, data)
+    projects_total.inc(status="completed")
+    events.publish(project_id, "completed", {"status": "completed", "status_message": message})
+
+async def settle_followers(project_id: str, error: Optional[str] = None):
+    """项目结束后把结果或错误同步给合并到它的相同请求
+
+    结合上传文档生成的方案只属于该项目，合并到它的相同请求改为各自单独处理。
+    error不为None时按失败处理(项目的失败状态可能未能写入)。
+    """
+    project = await async_db.get_project(project_id)
+    if error is not None:
+        project = dict(project or {}, status="failed", error=error)
+    if not project or project.get("status") not in ("completed", "failed"):
+        return
+    followers = await async_db.run(proposal_cache.settle, project_id)
+    for follower in followers:
+        if project["status"] == "completed" and project.get("result"):
+            if project["result"].get("documents"):
+                await restart_follower(follower)
+            else:
+                await complete_with_result(follower, project["result"], project.get("papers", []), project_id,
+                                     "已复用相同请求的技术方案")
+        else:
+            error = project.get("error") or "合并处理的相同请求失败"
+            await update_project_status(follower, {"status": "failed", "error": error})
+            projects_total.inc(status="failed")
+            events.publish(follower, "failed", {"status": "failed", "error": error})
+    if followers:
+        logger.info(f"项目 {project_id} 的结果已同步给 {len(followers)} 个相同请求")
+
+async def abandon_project(project_id: str, error: str):
+    """项目未能开始处理时标记为失败，撤销它在进行中请求里的登记并让合并到它的请求失败"""
+    try:
+        await update_project_status(project_id, {"status": "failed", "error": error})
+    except Exception as e:
+        logger.error(f"标记项目 {project_id} 失败时出错: {str(e)}")
+    await settle_followers(project_id, error)
+
+async def restart_follower(project_id: str):
+    """让合并到其他项目的请求单独执行，它在创建时已被接受，不受调度器队列上限限制"""
+    try:
+        project = await async_db.get_project(project_id)
+        if not project:
+            return
+        await update_project_status(project_id, {"status_message": "相同的请求使用了上传文档，正在单独处理"})
+        await start_project(project_id, ProjectRequest(**project["params"]), bypass_limit=True)
+    except Exception as e:
+        logger.error(f"单独处理项目 {project_id} 时出错: {str(e)}")
+        await update_project_status(project_id, {"status": "failed", "error": f"无法执行任务: {str(e)[:100]}"})
+        projects_total.inc(status="failed")
+        events.publish(project_id, "failed", {"status": "failed", "error": str(e)})
+
+def is_project_active(project_id: str) -> bool:
+    """在I/O线程中由proposal_cache.join调用"""
+    project = db.get_project(project_id)
+    return bool(project) and project.get("status") not in ("completed", "failed")
+
 async def process_project(project_id: str, request: ProjectRequest):
-    """处理项目的后台任务"""
+    """处理项目的后台任务，执行期间持续续约任务租约，结束后同步合并的相同请求"""
+    try:
+        async with job_queue.keep_alive(project_id):
+            return await run_project_stages(project_id, request)
+    finally:
+        events.clear(project_id)
+        await settle_followers(project_id)
+
+async def run_project_stages(project_id: str, request: ProjectRequest):
+    """依次执行项目的各个处理阶段
+
+    每个阶段完成后在持久化任务队列中记录检查点，服务重启后从最后一个检查点继续。
+    """
     try:
+        checkpoint = await async_db.run(job_queue.get_checkpoint, project_id)
+        if checkpoint:
+            logger.info(f"项目 {project_id} 从检查点 {checkpoint['stage']} 恢复")
+        # 各阶段耗时记录，恢复执行时保留之前的记录
+        timings = (await async_db.get_project(project_id) or {}).get("timings", [])
+
         # 1. 如果是中文主题，翻译为英文关键词
         topic = request.topic
-        translated_topic = None
+        translated_topic = checkpoint.get("translated_topic")
         
-        if any('\u4e00' <= c <= '\u9fff' for c in topic):
-            translated_topic = await translate_to_english(topic)
+        if stage_done(checkpoint, "translated"):
+            search_query = checkpoint["search_query"]
+        elif any('\u4e00' <= c <= '\u9fff' for c in topic):
+            with timed_stage("translate", timings):
+                translated_topic = await translate_to_english(topic)
             search_query = translated_topic
             # 更新项目状态
-            db.update_project(project_id, {
+            await update_project_status(project_id, {
                 "translated_topic": translated_topic,
+                "timings": timings,
                 "status_message": "已翻译主题，正在搜索相关论文"
             })
         else:
             search_query = topic
-            db.update_project(project_id, {
+            await update_project_status(project_id, {
                 "status_message": "正在搜索相关论文"
             })
+        if not stage_done(checkpoint, "translated"):
+            await async_db.run(job_queue.checkpoint, project_id, "translated", {
+                "translated_topic": translated_topic,
+                "search_query": search_query
+            })
         
-        # 2. 搜索arXiv论文
-        max_papers = request.max_papers if request.max_papers else 5
-        papers = await search_arxiv_papers(search_query, max_papers)
+        # 检索词与历史项目几乎相同时直接复用历史方案
+        if not stage_done(checkpoint, "searched"):
+            reused = await reuse_similar_proposal(project_id, search_query, request, timings)
+            if reused:
+                return reused
         
-        # 即使没有找到论文，也尝试继续处理
-        if not papers:
-            logger.warning(f"未找到与主题 '{topic}' 相关的论文，将尝试生成基本方案")
-            # 创建一个基本的论文结构
-            papers = [{
-                "id": "default_paper",
-                "title": f"关于 {topic} 的技术方案",
-                "authors": ["系统生成"],
-                "summary": f"由于未找到相关学术论文，系统将基于主题 '{topic}' 生成基本技术方案。",
-                "published": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
-                "pdf_url": None,
-                "local_path": None,
-                "content_extracted": False
-            }]
+        # 2. 搜索论文，本地索引已充分覆盖主题时直接使用本地论文，跳过arXiv检索和下载。
+        #    先按检索词匹配全文索引，不足时按语义相似度查找相似项目引用的论文和相似片段所属的论文
+        local_papers = []
+        if stage_done(checkpoint, "searched"):
+            papers = checkpoint["papers"]
+        else:
+            max_papers = request.max_papers if request.max_papers else 5
+            if CORPUS_SKIP_SEARCH:
+                try:
+                    with timed_stage("corpus", timings):
+                        local_source = "local_corpus"
+                        local_papers = await asyncio.to_thread(corpus.find_papers, search_query, max_papers)
+                        if len(local_papers) < max_papers:
+                            local_source = "similar_papers"
+                            local_papers = await asyncio.to_thread(
+                                embedding_index.find_related_papers, search_query, max_papers
+                            )
+                except Exception as e:
+                    logger.error(f"检索本地论文索引时出错: {str(e)}")
+                if len(local_papers) < max_papers:
+                    local_papers = []
         
-        # 更新项目状态
-        db.update_project(project_id, {
-            "papers": papers,
-            "status_message": "正在下载论文PDF"
-        })
+        if local_papers:
+            logger.info(f"项目 {project_id} 使用本地索引中的 {len(local_papers)} 篇论文")
+            extracted_contents = [paper.pop("content") for paper in local_papers]
+            papers = []
+            for paper in local_papers:
+                paper.pop("coverage", None)
+                paper.pop("similarity", None)
+                papers.append(dict(paper, local_path=None, content_extracted=True))
+            pipeline_stats = {"source": local_source, "papers": len(papers)}
+            await async_db.run(job_queue.checkpoint, project_id, "searched", {"papers": papers})
+            await async_db.run(job_queue.checkpoint, project_id, "extracted", {
+                "papers": papers,
+                "extracted_contents": extracted_contents,
+                "pipeline": pipeline_stats
+            })
+        elif not stage_done(checkpoint, "searched"):
+            with timed_stage("search", timings):
+                papers = await search_arxiv_papers(search_query, max_papers)
+            
+            # 即使没有找到论文，也尝试继续处理
+            if not papers:
+                logger.warning(f"未找到与主题 '{topic}' 相关的论文，将尝试生成基本方案")
+                # 创建一个基本的论文结构
+                papers = [{
+                    "id": "default_paper",
+                    "title": f"关于 {topic} 的技术方案",
+                    "authors": ["系统生成"],
+                    "summary": f"由于未找到相关学术论文，系统将基于主题 '{topic}' 生成基本技术方案。",
+                    "published": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                    "pdf_url": None,
+                    "local_path": None,
+                    "content_extracted": False
+                }]
+            await async_db.run(job_queue.checkpoint, project_id, "searched", {"papers": papers})
         
-        # 3. 下载论文PDF（添加超时参数）
-        papers = await download_papers(papers, timeout=60)
-        db.update_project(project_id, {
-            "papers": papers,
-            "status_message": "正在提取论文内容"
-        })
+        # 3. 下载并提取论文内容（流水线，每篇论文下载完成后立即提取）
+        if stage_done(checkpoint, "extracted"):
+            papers = checkpoint["papers"]
+            extracted_contents = checkpoint["extracted_contents"]
+            pipeline_stats = checkpoint.get("pipeline")
+        elif not local_papers:
+            # 更新项目状态
+            await update_project_status(project_id, {
+                "papers": papers,
+                "status_message": "正在下载论文PDF"
+            })
+            
+            def report_progress(ready: int, total: int):
+                # 流水线的同步回调，提交更新后不等待写入完成
+                data = {"status_message": f"正在下载论文并提取内容 ({ready}/{total})"}
+                async_db.update_project_nowait(project_id, data)
+                publish_status(project_id, data)
+            
+            with timed_stage("pipeline", timings):
+                papers, extracted_contents, pipeline_stats = await run_paper_pipeline(
+                    papers,
+                    download_timeout=60,
+                    on_progress=report_progress
+                )
+            await async_db.run(job_queue.checkpoint, project_id, "extracted", {
+                "papers": papers,
+                "extracted_contents": extracted_contents,
+                "pipeline": pipeline_stats
+            })
+        
+        # 项目保留期内引用的论文PDF不会被回收
+        await async_db.attach_papers(project_id, [paper["id"] for paper in papers])
         
-        # 4. 提取论文内容
-        extracted_contents = []
-        for paper in papers:
-            content = await extract_paper_content(paper)
-            extracted_contents.append(content)
+        # 上传到项目的文档与论文一起作为生成方案的参考
+        documents = await collect_documents(project_id, f"{topic} {search_query}", timings)
         
         # 更新项目状态
-        db.update_project(project_id, {
+        await update_project_status(project_id, {
+            "papers": papers,
+            "pipeline": pipeline_stats,
+            "timings": timings,
             "status_message": "正在生成技术方案"
         })
         
-        # 5. 生成技术方案
-        result = await generate_technical_proposal(
-            topic=topic,
-            papers=papers,
-            extracted_contents=extracted_contents,
-            model_type=request.model_type,
-            max_tokens=4000
-        )
+        # 4. 生成技术方案，相同请求和相同参考论文在有效期内已生成过时直接使用缓存结果(有上传文档时不使用缓存)
+        fingerprint = request_fingerprint(request.dict())
+        cached = None if documents else await async_db.run(proposal_cache.lookup, fingerprint, paper_key(papers))
+        if cached:
+            logger.info(f"项目 {project_id} 使用项目 {cached['project_id']} 缓存的技术方案")
+            result, prompt_stats = dict(cached["result"]), None
+        else:
+            with timed_stage("generate", timings):
+                result = await generate_technical_proposal(
+                    topic=topic,
+                    papers=papers,
+                    extracted_contents=extracted_contents,
+                    model_type=request.model_type,
+                    max_tokens=4000,
+                    on_token=lambda token: events.publish(project_id, "token", {"content": token}),
+                    query=f"{topic} {search_query}",
+                    documents=documents
+                )
+            prompt_stats = result.pop("prompt_stats", None)
         
         if "error" in result:
             # 处理生成失败的情况
-            db.update_project(project_id, {
+            timings[-1]["outcome"] = "error"
+            await update_project_status(project_id, {
                 "status": "failed",
-                "error": result["error"]
+                "error": result["error"],
+                "timings": timings
             })
+            projects_total.inc(status="failed")
+            events.publish(project_id, "failed", {"status": "failed", "error": result["error"]})
+            await async_db.run(job_queue.finish, project_id)
             return {"error": result["error"]}
         
         # 如果有翻译过的主题，添加到结果中
         if translated_topic:
             result["translated_topic"] = translated_topic
+        if documents:
+            result["documents"] = [
+                {key: document[key] for key in ("filename", "sha256", "pages", "truncated")}
+                for document in documents
+            ]
         
-        # 6. 保存项目结果
-        db.save_project_result(project_id, result)
+        # 5. 保存项目结果，并把检索词和引用论文加入语义索引，供相似的新项目复用；
+        # 结合上传文档生成的方案只属于当前项目，不进入缓存和语义索引
+        await async_db.save_project_result(project_id, result)
+        if not cached and not documents:
+            await async_db.run(proposal_cache.put, fingerprint, paper_key(papers), project_id, result, papers)
+        if not documents:
+            try:
+                await asyncio.to_thread(
+                    embedding_index.add_project, project_id, search_query,
+                    [paper["id"] for paper in papers if paper.get("content_extracted")], request.model_type,
+                    options_fingerprint(request.dict())
+                )
+            except Exception as e:
+                logger.error(f"项目 {project_id} 加入语义索引时出错: {str(e)}")
         
-        # 7. 更新项目状态为已完成
-        db.update_project(project_id, {
+        # 6. 更新项目状态为已完成
+        await update_project_status(project_id, {
             "status": "completed",
+            "timings": timings,
+            "prompt_stats": prompt_stats,
+            "reused_from": cached["project_id"] if cached else None,
             "status_message": "技术方案生成完成"
         })
+        projects_total.inc(status="completed")
+        events.publish(project_id, "completed", {"status": "completed", "status_message": "技术方案生成完成"})
+        await async_db.run(job_queue.finish, project_id)
         
         return {"success": True, "project_id": project_id}
     
     except Exception as e:
         logger.error(f"处理项目 {project_id} 时出错: {str(e)}")
         # 更新项目状态为失败
-        db.update_project(project_id, {
+        await update_project_status(project_id, {
             "status": "failed",
             "error": str(e),
             "status_message": f"处理失败: {str(e)[:100]}" # 限制错误消息长度
         })
+        projects_total.inc(status="failed")
+        events.publish(project_id, "failed", {"status": "failed", "error": str(e)})
+        await async_db.run(job_queue.finish, project_id)
         return {"error": str(e)}
 
 @app.get("/api/projects/{project_id}", response_model=Optional[Project])
 async def get_project(project_id: str):
     """获取项目详情"""
-    project = db.get_project(project_id)
+    project = await async_db.get_project(project_id)
     if not project:
         raise HTTPException(status_code=404, detail=f"找不到项目ID: {project_id}")
     return project
 
+@app.get("/api/projects/{project_id}/stream")
+async def stream_project(project_id: str, request: Request):
+    """以Server-Sent Events推送项目状态变化和方案生成token"""
+    project = await async_db.get_project(project_id)
+    if not project:
+        raise HTTPException(status_code=404, detail=f"找不到项目ID: {project_id}")
+
+    def format_event(event: str, data: Dict[str, Any]) -> str:
+        return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+    # 先订阅再读取快照，避免错过两者之间发布的事件
+    queue, partial_proposal = events.subscribe(project_id)
+    project = await async_db.get_project(project_id) or project
+
+    async def event_stream():
+        try:
+            yield format_event("status", {
+                "status": project.get("status"),
+                "status_message": project.get("status_message")
+            })
+            if project.get("status") in TERMINAL_EVENTS:
+                yield format_event(project["status"], {"status": project["status"], "error": project.get("error")})
+                return
+            if partial_proposal:
+                yield format_event("token", {"content": partial_proposal})
+
+            # worker模式下项目在其他进程中处理，事件不经过本进程，改为定期读取数据库
+            poll_database = JOB_EXECUTION_MODE == "worker"
+            last_status = (project.get("status"), project.get("status_message"))
+            last_keep_alive = time.monotonic()
+            while True:
+                if await request.is_disconnected():
+                    break
+                try:
+                    message = await asyncio.wait_for(queue.get(), timeout=JOB_POLL_INTERVAL if poll_database else 15)
+                except asyncio.TimeoutError:
+                    if poll_database:
+                        current = await async_db.get_project(project_id) or {}
+                        status = (current.get("status"), current.get("status_message"))
+                        if status != last_status:
+                            last_status = status
+                            yield format_event("status", {"status": status[0], "status_message": status[1]})
+                        if status[0] in TERMINAL_EVENTS:
+                            yield format_event(status[0], {"status": status[0], "error": current.get("error")})
+                            break
+                    # 保持连接，防止代理超时断开
+                    if time.monotonic() - last_keep_alive >= 15:
+                        last_keep_alive = time.monotonic()
+                        yield ": keep-alive\n\n"
+                    continue
+                yield format_event(message.event, message.data)
+                # 订阅队列溢出后不再推送，客户端重新连接
+                if message.event in TERMINAL_EVENTS or message.event == RESYNC_EVENT:
+                    break
+        finally:
+            events.unsubscribe(project_id, queue)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.get("/api/projects", response_model=List[Project])
-async def list_projects(limit: int = Query(10, ge=1, le=100)):
-    """列出最近的项目"""
-    return db.list_projects(limit)
+async def list_projects(
+    response: Response,
+    limit: int = Query(10, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="上一页响应头X-Next-Cursor中的游标"),
+    status: Optional[ProjectStatus] = Query(None)
+):
+    """列出最近的项目，按创建时间倒序分页"""
+    try:
+        projects, next_cursor = await async_db.list_projects_page(limit, cursor, status.value if status else None)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="无效的分页游标")
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return projects
 
-@app.post("/api/upload")
-async def upload_file(file: UploadFile = File(...), project_id: Optional[str] = Form(None)):
-    """上传文件接口"""
+@app.post("/api/upload", openapi_extra={
+    "requestBody": {
+        "required": True,
+        "content": {"multipart/form-data": {"schema": {
+            "type": "object",
+            "required": ["file"],
+            "properties": {
+                "file": {"type": "string", "format": "binary"},
+                "project_id": {"type": "string"}
+            }
+        }}}
+    }
+})
+async def upload_file(request: Request):
+    """上传文件接口(multipart/form-data，字段file和可选的project_id)
+
+    请求体边接收边写入磁盘并计算SHA-256，超过UPLOAD_MAX_BYTES时立即中止。
+    文件按内容摘要保存在文件存储中，相同内容只保存一份，项目只记录对文件的引用。
+    关联到项目的PDF、DOCX、TXT和MD文件随即提交后台解析，生成方案时作为参考资料。
+    """
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > UPLOAD_MAX_BYTES + MULTIPART_OVERHEAD:
+        raise HTTPException(status_code=413, detail=f"文件超过大小限制 {UPLOAD_MAX_BYTES} 字节")
+    
+    try:
+        receiver = StreamingUpload(request.headers.get("content-type", ""))
+        fields, upload = await receiver.receive(request.stream())
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except UploadError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if upload is None:
+        raise HTTPException(status_code=400, detail="请求中没有文件")
+    
     try:
-        # 创建临时文件保存上传的内容
-        file_location = os.path.join(PDF_DIR, file.filename)
-        with open(file_location, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        stored_path, deduplicated = await async_db.run(store_upload, upload)
         
         # 如果提供了项目ID，将文件关联到项目
+        project_id = fields.get("project_id")
+        ingestion = None
         if project_id:
-            relative_path = db.save_file(project_id, file.filename, await file.read())
-            db.update_project(project_id, {
-                "files": db.get_project(project_id).get("files", []) + [
+            project = await async_db.get_project(project_id)
+            if not project:
+                raise HTTPException(status_code=404, detail=f"找不到项目ID: {project_id}")
+            relative_path = await async_db.attach_file(project_id, upload["filename"], upload["sha256"])
+            await async_db.update_project(project_id, {
+                "files": project.get("files", []) + [
                     {
-                        "filename": file.filename,
+                        "filename": upload["filename"],
                         "path": relative_path,
-                        "content_type": file.content_type
+                        "content_type": upload["content_type"],
+                        "size": upload["size"],
+                        "sha256": upload["sha256"]
                     }
                 ]
             })
+            ingestion = await process_uploaded_file(stored_path, upload["filename"], upload["sha256"])
         
         return {
             "status": "success", 
-            "filename": file.filename,
-            "file_path": file_location,
-            "content_type": file.content_type
+            "filename": upload["filename"],
+            "file_path": stored_path,
+            "content_type": upload["content_type"],
+            "size": upload["size"],
+            "sha256": upload["sha256"],
+            "deduplicated": deduplicated,
+            "ingestion": ingestion
         }
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"文件上传出错: {str(e)}")
         raise HTTPException(status_code=500, detail=f"文件上传出错: {str(e)}")
@@ -240,8 +784,8 @@ async def analyze_url(url: str = Form(...)):
 @app.get("/api/papers/{paper_id}/pdf")
 async def get_paper_pdf(paper_id: str):
     """获取论文PDF文件"""
-    file_path = os.path.join(PDF_DIR, f"{paper_id}.pdf")
-    if not os.path.exists(file_path):
+    file_path = await asyncio.to_thread(downloader.cached_path, paper_id)
+    if not file_path:
         raise HTTPException(status_code=404, detail="论文PDF不存在")
     
     return StreamingResponse(
@@ -250,17 +794,77 @@ async def get_paper_pdf(paper_id: str):
         headers={"Content-Disposition": f"attachment; filename={paper_id}.pdf"}
     )
 
-# 定期清理任务 - 每天运行一次
+@app.get("/api/corpus/search")
+async def search_corpus(
+    q: str = Query(..., min_length=1, description="检索词，支持中英文"),
+    limit: int = Query(10, ge=1, le=100)
+):
+    """在本地论文全文索引中检索相关片段"""
+    started = time.monotonic()
+    results = await asyncio.to_thread(corpus.search, q, limit)
+    return {
+        "query": q,
+        "results": results,
+        "elapsed_ms": round((time.monotonic() - started) * 1000, 2)
+    }
+
+@app.on_event("startup")
+async def start_http_clients():
+    """启动共享HTTP客户端管理器"""
+    await http_clients.startup()
+
+@app.on_event("shutdown")
+async def stop_http_clients():
+    """关闭所有共享HTTP连接池和PDF提取进程池，写入未保存的项目数据，交还未完成的任务"""
+    await http_clients.shutdown()
+    extraction_service.shutdown()
+    await async_db.flush()
+    async_db.shutdown()
+    job_queue.release()
+
+async def run_job(job: Dict[str, Any]):
+    """执行从任务队列领取的项目任务(新任务或其他进程遗留的任务)"""
+    project_id = job["id"]
+    project = await async_db.get_project(project_id)
+    if not project or project.get("status") in ("completed", "failed"):
+        await async_db.run(job_queue.finish, project_id)
+        await settle_followers(project_id)
+        return {"project_id": project_id}
+    
+    try:
+        request = ProjectRequest(**job["payload"])
+        if job["attempts"] > JOB_MAX_ATTEMPTS:
+            raise RuntimeError(f"已达到最大执行次数 {JOB_MAX_ATTEMPTS}，不再重试")
+    except Exception as e:
+        logger.error(f"无法执行项目任务 {project_id}: {str(e)}")
+        await async_db.run(job_queue.finish, project_id)
+        await update_project_status(project_id, {"status": "failed", "error": f"无法执行任务: {str(e)[:100]}"})
+        events.publish(project_id, "failed", {"status": "failed", "error": str(e)})
+        await settle_followers(project_id)
+        return {"project_id": project_id}
+    
+    await update_project_status(project_id, {
+        "status": "processing",
+        "status_message": "正在从检查点恢复处理" if job["stage"] else "正在处理"
+    })
+    return await process_project(project_id, request)
+
+@app.on_event("startup")
+async def start_job_consumer():
+    """inline模式下接管崩溃或重启的进程遗留的任务，worker模式下由worker进程执行任务"""
+    if JOB_EXECUTION_MODE != "worker":
+        JobConsumer(job_queue, run_job).start()
+
+# 定期清理任务 - 每RETENTION_INTERVAL秒运行一次
 @app.on_event("startup")
 async def schedule_cleanup():
-    """启动时调度定期清理任务"""
+    """启动时调度定期清理任务，清理过期项目和不再被引用的文件"""
     def cleanup_task_factory():
         async def cleanup():
             logger.info("执行定期数据清理任务")
-            db.cleanup_old_data()
-            return {"status": "success"}
+            report = await async_db.cleanup_old_data()
+            return {"status": "success", "report": report}
         return cleanup()
     
-    # 每86400秒(24小时)运行一次清理任务
-    scheduler.schedule_periodic_task(cleanup_task_factory, 86400, "cleanup")
+    scheduler.schedule_periodic_task(cleanup_task_factory, RETENTION_INTERVAL, "cleanup")
     logger.info("已调度定期清理任务") 
\ No newline at end of file
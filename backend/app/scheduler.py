@@ -1,74 +1,219 @@
 import asyncio
+import heapq
+import itertools
+import math
 import threading
 import logging
 import time
 from typing import Dict, List, Optional, Any, Callable, Coroutine
 from datetime import datetime
 import uuid
+from collections import OrderedDict
+
+from .config import SCHEDULER_MAX_CONCURRENT, SCHEDULER_MAX_QUEUE, TASK_RECORD_TTL, TASK_MAX_FINISHED
 
 # 配置日志
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("scheduler")
 
+# 任务优先级，数值越小越先执行
+PRIORITY_HIGH = -10
+PRIORITY_NORMAL = 0
+
+# 还没有任务结束时估算Retry-After使用的任务运行时间
+DEFAULT_RUN_SECONDS = 60.0
+
+class SchedulerSaturated(Exception):
+    """等待队列已满，暂时无法接受新任务"""
+
+    def __init__(self, retry_after: int, queue_depth: int):
+        super().__init__(f"任务队列已满 ({queue_depth})，请在 {retry_after} 秒后重试")
+        self.retry_after = retry_after
+        self.queue_depth = queue_depth
+
+# 任务结束后的状态
+FINISHED_STATUSES = ("completed", "failed")
+
+class TaskRecord:
+    """任务记录
+
+    使用__slots__减少内存占用。任务结果不保存在内存中，只保留指向数据库的引用
+    (如项目ID)，完整结果通过数据库查询。
+    """
+    __slots__ = ("id", "status", "queue", "priority", "created_at", "updated_at", "result_ref", "error")
+
+    def __init__(self, task_id: str, queue: str, priority: int):
+        now = time.time()
+        self.id = task_id
+        self.status = "pending"
+        self.queue = queue
+        self.priority = priority
+        self.created_at = now
+        self.updated_at = now
+        self.result_ref: Optional[Dict[str, str]] = None
+        self.error: Optional[str] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "status": self.status,
+            "queue": self.queue,
+            "priority": self.priority,
+            "created_at": datetime.fromtimestamp(self.created_at).isoformat(),
+            "updated_at": datetime.fromtimestamp(self.updated_at).isoformat(),
+            "result": self.result_ref,
+            "error": self.error
+        }
+
+def result_reference(result: Any) -> Optional[Dict[str, str]]:
+    """从任务结果中提取数据库引用，其余内容不保留"""
+    if isinstance(result, dict) and result.get("project_id"):
+        return {"project_id": result["project_id"]}
+    return None
+
 class TaskScheduler:
-    def __init__(self):
-        """初始化任务调度器"""
-        self.tasks: Dict[str, Dict[str, Any]] = {}
+    def __init__(self, max_concurrent: int = SCHEDULER_MAX_CONCURRENT, max_queue: int = SCHEDULER_MAX_QUEUE):
+        """初始化任务调度器
+
+        最多同时运行max_concurrent个任务，其余任务按(优先级, 提交顺序)在等待队列中排队，
+        等待队列超过max_queue时拒绝新任务。
+        """
+        # 运行中/等待中的任务和已结束的任务分开索引，已结束的任务按结束顺序排列便于淘汰
+        self.active: Dict[str, TaskRecord] = {}
+        self.finished: "OrderedDict[str, TaskRecord]" = OrderedDict()
+        self.record_ttl = TASK_RECORD_TTL
+        self.max_finished = TASK_MAX_FINISHED
+        self.evicted = 0
         self.lock = threading.RLock()
         self.loop = asyncio.new_event_loop()
-        
+
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.pending_heap: List[tuple] = []
+        self.sequence = itertools.count()
+        self.running = 0
+        # 各队列的等待时间和平均运行时间统计
+        self.queue_stats: Dict[str, Dict[str, Any]] = {}
+
         # 启动调度器线程
         self.scheduler_thread = threading.Thread(target=self._run_scheduler, daemon=True)
         self.scheduler_thread.start()
-    
+
     def _run_scheduler(self):
         """在独立线程中运行事件循环"""
         asyncio.set_event_loop(self.loop)
         self.loop.run_forever()
-    
-    def submit_task(self, coroutine, task_id: Optional[str] = None) -> str:
-        """提交异步任务到调度器"""
+
+    def _queue_stats(self, queue: str) -> Dict[str, Any]:
+        return self.queue_stats.setdefault(queue, {
+            "submitted": 0,
+            "rejected": 0,
+            "started": 0,
+            "wait_seconds_total": 0.0,
+            "wait_seconds_max": 0.0,
+            # 任务平均运行时间(指数移动平均)，用于估算Retry-After
+            "run_seconds_avg": DEFAULT_RUN_SECONDS
+        })
+
+    def queue_depth(self) -> int:
+        """等待队列中的任务数"""
+        with self.lock:
+            return len(self.pending_heap)
+
+    def idle_slots(self) -> int:
+        """空闲的执行槽位数(已扣除等待中的任务)"""
+        with self.lock:
+            return self.max_concurrent - self.running - len(self.pending_heap)
+
+    def retry_after(self, queue: str = "default") -> int:
+        """按queue队列任务的平均运行时间估算等待队列有空位所需的秒数
+
+        清理、维护等短任务不计入被拒绝的项目任务的平均运行时间。
+        """
+        with self.lock:
+            excess = len(self.pending_heap) - self.max_queue + 1
+            avg_run_seconds = self._queue_stats(queue)["run_seconds_avg"]
+            return max(1, math.ceil(max(excess, 1) * avg_run_seconds / self.max_concurrent))
+
+    def check_capacity(self, queue: str = "default"):
+        """等待队列已满时抛出SchedulerSaturated"""
+        with self.lock:
+            if len(self.pending_heap) >= self.max_queue:
+                self._queue_stats(queue)["rejected"] += 1
+                raise SchedulerSaturated(self.retry_after(queue), len(self.pending_heap))
+
+    def submit_task(self, coroutine, task_id: Optional[str] = None,
+                    priority: int = PRIORITY_NORMAL, queue: str = "default",
+                    bypass_limit: bool = False) -> str:
+        """提交异步任务到调度器
+
+        任务先进入等待队列，有空闲槽位时开始执行。等待队列已满时关闭协程并抛出
+        SchedulerSaturated，bypass_limit为True的任务(如系统维护任务)不受队列上限限制。
+        """
         with self.lock:
+            stats = self._queue_stats(queue)
+            if not bypass_limit and len(self.pending_heap) >= self.max_queue:
+                stats["rejected"] += 1
+                coroutine.close()
+                raise SchedulerSaturated(self.retry_after(queue), len(self.pending_heap))
+
             if task_id is None:
                 task_id = str(uuid.uuid4())
-            
+
             # 创建任务记录
-            task_record = {
-                "id": task_id,
-                "status": "pending",
-                "created_at": datetime.now().isoformat(),
-                "updated_at": datetime.now().isoformat(),
-                "result": None,
-                "error": None
-            }
-            
-            self.tasks[task_id] = task_record
-            
+            self.finished.pop(task_id, None)
+            self.active[task_id] = TaskRecord(task_id, queue, priority)
+            stats["submitted"] += 1
+            heapq.heappush(self.pending_heap, (priority, next(self.sequence), time.monotonic(), task_id, coroutine))
+
+        # 在事件循环中分发任务
+        self.loop.call_soon_threadsafe(self._dispatch)
+        return task_id
+
+    def _dispatch(self):
+        """在空闲槽位上启动等待中的任务（在调度器事件循环中执行）"""
+        while True:
+            with self.lock:
+                if self.running >= self.max_concurrent or not self.pending_heap:
+                    return
+                priority, _, queued_at, task_id, coroutine = heapq.heappop(self.pending_heap)
+                self.running += 1
+                waited = time.monotonic() - queued_at
+                record = self.active.get(task_id)
+                stats = self._queue_stats(record.queue if record else "default")
+                stats["started"] += 1
+                stats["wait_seconds_total"] += waited
+                stats["wait_seconds_max"] = max(stats["wait_seconds_max"], waited)
+
             # 创建任务并设置回调
-            future = asyncio.run_coroutine_threadsafe(self._run_task(coroutine, task_id), self.loop)
-            future.add_done_callback(lambda f: self._handle_task_result(task_id, f))
-            
-            return task_id
-    
-    async def _run_task(self, coroutine, task_id: str) -> Any:
-        """执行异步任务并捕获异常"""
+            task = self.loop.create_task(self._run_task(coroutine, task_id, stats))
+            task.add_done_callback(lambda f, task_id=task_id: self._handle_task_result(task_id, f))
+
+    async def _run_task(self, coroutine, task_id: str, stats: Dict[str, Any]) -> Any:
+        """执行异步任务并捕获异常，stats为任务所在队列的统计"""
+        started = time.monotonic()
         try:
             # 更新任务状态为处理中
             self._update_task_status(task_id, "processing")
-            
+
             # 执行协程任务
             result = await coroutine
-            
+
             # 更新任务状态为已完成
             self._update_task_status(task_id, "completed", result=result)
             return result
-        
+
         except Exception as e:
             # 记录错误并更新状态
             logger.error(f"任务 {task_id} 执行出错: {str(e)}")
             self._update_task_status(task_id, "failed", error=str(e))
             raise e
-    
+        finally:
+            with self.lock:
+                self.running -= 1
+                stats["run_seconds_avg"] = 0.8 * stats["run_seconds_avg"] + 0.2 * (time.monotonic() - started)
+            self._dispatch()
+
     def _handle_task_result(self, task_id: str, future):
         """处理任务完成后的结果"""
         try:
@@ -77,32 +222,74 @@ class TaskScheduler:
         except Exception as e:
             # 任务在_run_task中已经处理了异常，这里不需要再做额外处理
             pass
-    
+
     def _update_task_status(self, task_id: str, status: str, result=None, error=None):
-        """更新任务状态和结果"""
+        """更新任务状态，结束的任务移入已结束索引"""
         with self.lock:
-            if task_id in self.tasks:
-                self.tasks[task_id].update({
-                    "status": status,
-                    "updated_at": datetime.now().isoformat()
-                })
-                
-                if result is not None:
-                    self.tasks[task_id]["result"] = result
-                
-                if error is not None:
-                    self.tasks[task_id]["error"] = error
-    
+            record = self.active.get(task_id)
+            if record is None:
+                return
+
+            record.status = status
+            record.updated_at = time.time()
+
+            if result is not None:
+                record.result_ref = result_reference(result)
+
+            if error is not None:
+                record.error = error[:500]
+
+            if status in FINISHED_STATUSES:
+                del self.active[task_id]
+                self.finished[task_id] = record
+                self._evict_finished()
+
+    def _evict_finished(self):
+        """淘汰超过保留时间或超出数量上限的已结束任务记录"""
+        expire_before = time.time() - self.record_ttl
+        while self.finished:
+            task_id, record = next(iter(self.finished.items()))
+            if record.updated_at >= expire_before and len(self.finished) <= self.max_finished:
+                break
+            self.finished.popitem(last=False)
+            self.evicted += 1
+
     def get_task_status(self, task_id: str) -> Optional[Dict[str, Any]]:
         """获取任务状态"""
         with self.lock:
-            return self.tasks.get(task_id)
-    
+            record = self.active.get(task_id) or self.finished.get(task_id)
+            return record.to_dict() if record else None
+
     def get_active_tasks(self) -> List[Dict[str, Any]]:
         """获取所有活动的任务"""
         with self.lock:
-            return [task for task in self.tasks.values() if task["status"] in ("pending", "processing")]
-    
+            return [record.to_dict() for record in self.active.values()]
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取调度器负载和各队列等待时间统计"""
+        with self.lock:
+            self._evict_finished()
+            queues = {}
+            for name, stats in self.queue_stats.items():
+                started = stats["started"]
+                queues[name] = dict(
+                    stats,
+                    wait_seconds_avg=round(stats["wait_seconds_total"] / started, 3) if started else 0.0,
+                    run_seconds_avg=round(stats["run_seconds_avg"], 3)
+                )
+            return {
+                "running": self.running,
+                "max_concurrent": self.max_concurrent,
+                "queue_depth": len(self.pending_heap),
+                "max_queue": self.max_queue,
+                "saturated": len(self.pending_heap) >= self.max_queue,
+                "avg_run_seconds": round(self._queue_stats("projects")["run_seconds_avg"], 3),
+                "active_tasks": len(self.active),
+                "finished_tasks": len(self.finished),
+                "evicted_tasks": self.evicted,
+                "queues": queues
+            }
+
     def schedule_periodic_task(self, coroutine_factory, interval_seconds: int, task_id_prefix: str = "periodic"):
         """调度定期任务"""
         async def periodic_runner():
@@ -110,20 +297,21 @@ class TaskScheduler:
                 try:
                     # 生成唯一的任务ID
                     task_id = f"{task_id_prefix}_{int(time.time())}"
-                    
-                    # 创建协程并提交任务
+
+                    # 创建协程并提交任务，维护任务优先执行且不受队列上限限制
                     coroutine = coroutine_factory()
-                    self.submit_task(coroutine, task_id)
-                    
+                    self.submit_task(coroutine, task_id, priority=PRIORITY_HIGH,
+                                     queue="maintenance", bypass_limit=True)
+
                     # 等待下一个间隔
                     await asyncio.sleep(interval_seconds)
-                
+
                 except Exception as e:
                     logger.error(f"定期任务调度出错: {str(e)}")
                     await asyncio.sleep(10)  # 出错时短暂等待后重试
-        
+
         # 提交定期任务运行器
         asyncio.run_coroutine_threadsafe(periodic_runner(), self.loop)
 
 # 创建全局任务调度器实例
-scheduler = TaskScheduler() 
\ No newline at end of file
+scheduler = TaskScheduler()
@@ -0,0 +1,161 @@
+import os
+import uuid
+import asyncio
+import hashlib
+import logging
+from typing import Dict, List, Optional, Any, Tuple, AsyncIterator
+
+from multipart.multipart import MultipartParser, parse_options_header
+
+from .config import UPLOAD_DIR, UPLOAD_MAX_BYTES
+from .blobs import blob_store
+
+# 配置日志
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("uploads")
+
+# multipart边界和字段头的额外开销，用于根据Content-Length提前拒绝过大的请求
+MULTIPART_OVERHEAD = 64 * 1024
+
+class UploadError(Exception):
+    """上传请求格式错误"""
+
+class UploadTooLarge(Exception):
+    """上传文件超过大小限制"""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        super().__init__(f"文件超过大小限制 {max_bytes} 字节")
+
+def safe_filename(filename: str) -> str:
+    """去掉客户端文件名中的路径部分"""
+    name = os.path.basename((filename or "").replace("\\", "/")).strip()
+    return name if name not in ("", ".", "..") else "upload"
+
+class StreamingUpload:
+    """流式接收multipart/form-data上传请求
+
+    文件内容边接收边写入临时文件并计算SHA-256，不在内存或临时目录中保留完整副本；
+    超过max_bytes时立即中止。只接受一个文件字段，其余字段作为普通表单值返回。
+    """
+
+    def __init__(self, content_type: str, max_bytes: int = UPLOAD_MAX_BYTES, temp_dir: str = UPLOAD_DIR):
+        _, params = parse_options_header(content_type)
+        if b"boundary" not in params:
+            raise UploadError("缺少multipart边界")
+        self.charset = params.get(b"charset", b"utf-8").decode("latin-1")
+        self.max_bytes = max_bytes
+        self.temp_dir = os.path.join(temp_dir, "tmp")
+        os.makedirs(self.temp_dir, exist_ok=True)
+        self.parser = MultipartParser(params[b"boundary"], {
+            "on_part_begin": self.on_part_begin,
+            "on_part_data": self.on_part_data,
+            "on_part_end": self.on_part_end,
+            "on_header_field": self.on_header_field,
+            "on_header_value": self.on_header_value,
+            "on_header_end": self.on_header_end,
+            "on_headers_finished": self.on_headers_finished
+        })
+        self.fields: Dict[str, str] = {}
+        self.file: Optional[Dict[str, Any]] = None
+        self.digest = hashlib.sha256()
+        self.handle = None
+        self.pending: List[bytes] = []
+        self.headers: Dict[bytes, bytes] = {}
+        self.header_name = b""
+        self.header_value = b""
+        self.part_name = ""
+        self.part_data = b""
+        self.part_is_file = False
+
+    def on_part_begin(self):
+        self.headers = {}
+        self.part_data = b""
+        self.part_is_file = False
+
+    def on_header_field(self, data: bytes, start: int, end: int):
+        self.header_name += data[start:end]
+
+    def on_header_value(self, data: bytes, start: int, end: int):
+        self.header_value += data[start:end]
+
+    def on_header_end(self):
+        self.headers[self.header_name.lower()] = self.header_value
+        self.header_name = self.header_value = b""
+
+    def on_headers_finished(self):
+        _, options = parse_options_header(self.headers.get(b"content-disposition", b""))
+        if b"name" not in options:
+            raise UploadError("表单字段缺少name")
+        self.part_name = options[b"name"].decode(self.charset, errors="replace")
+        if b"filename" in options:
+            if self.file is not None:
+                raise UploadError("一次只能上传一个文件")
+            self.part_is_file = True
+            self.file = {
+                "field": self.part_name,
+                "filename": safe_filename(options[b"filename"].decode(self.charset, errors="replace")),
+                "content_type": self.headers.get(b"content-type", b"application/octet-stream").decode("latin-1"),
+                "size": 0,
+                "temp_path": os.path.join(self.temp_dir, f"{uuid.uuid4().hex}.part")
+            }
+
+    def on_part_data(self, data: bytes, start: int, end: int):
+        if self.part_is_file:
+            self.file["size"] += end - start
+            if self.file["size"] > self.max_bytes:
+                raise UploadTooLarge(self.max_bytes)
+            self.pending.append(data[start:end])
+        else:
+            self.part_data += data[start:end]
+            if len(self.part_data) > MULTIPART_OVERHEAD:
+                raise UploadError(f"表单字段 {self.part_name} 过长")
+
+    def on_part_end(self):
+        if not self.part_is_file:
+            self.fields[self.part_name] = self.part_data.decode(self.charset, errors="replace")
+
+    def _write_pending(self):
+        """在I/O线程中写入已解析的文件数据并更新摘要"""
+        if self.handle is None:
+            self.handle = open(self.file["temp_path"], "wb")
+        for piece in self.pending:
+            self.digest.update(piece)
+            self.handle.write(piece)
+
+    def _discard(self):
+        if self.handle is not None:
+            self.handle.close()
+        if self.file and os.path.exists(self.file["temp_path"]):
+            os.remove(self.file["temp_path"])
+
+    async def receive(self, stream: AsyncIterator[bytes]) -> Tuple[Dict[str, str], Optional[Dict[str, Any]]]:
+        """读取请求体，返回(表单字段, 文件信息)
+
+        文件信息包含filename、content_type、size、sha256和temp_path，
+        调用方负责把temp_path移动到最终位置。
+        """
+        try:
+            async for chunk in stream:
+                self.parser.write(chunk)
+                if self.pending:
+                    await asyncio.to_thread(self._write_pending)
+                    self.pending = []
+            self.parser.finalize()
+            if self.file is not None:
+                # 空文件也要创建临时文件
+                await asyncio.to_thread(self._write_pending)
+                self.handle.close()
+                self.file["sha256"] = self.digest.hexdigest()
+        except BaseException:
+            await asyncio.to_thread(self._discard)
+            raise
+        return self.fields, self.file
+
+def store_upload(upload: Dict[str, Any]) -> Tuple[str, bool]:
+    """把上传的临时文件移入按内容寻址的文件存储，相同内容只保存一份
+
+    返回(存储路径, 是否已存在相同内容)
+    """
+    _, path, deduplicated = blob_store.put_file(upload["temp_path"], upload["sha256"])
+    return path, deduplicated
@@ -0,0 +1,204 @@
+"""存储层事件循环阻塞压测
+
+在同一个事件循环中并发执行项目读写(读取详情、分页列表、更新状态、保存结果)，
+同时用一个定时协程测量事件循环延迟，对比直接调用VirtualDatabase(同步，阻塞事件循环)
+和通过AsyncDatabase(I/O线程)两种方式的阻塞时间。
+任务队列路径按项目处理流程执行加入任务、记录各阶段检查点、读取检查点和结束任务，
+同样对比直接调用JobQueue和通过AsyncDatabase.run两种方式。
+
+示例:
+    cd backend
+    python benchmarks/loop_stall.py --projects 200 --concurrency 20
+    python benchmarks/loop_stall.py --backend json --disk-latency 0.005
+    python benchmarks/loop_stall.py --paths jobs --disk-latency 0.003
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from typing import Dict, List, Any
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(BACKEND_DIR)
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from run_benchmark import percentile
+
+class SlowBackend:
+    """在存储后端的每次调用前加入固定延迟，模拟慢磁盘"""
+
+    def __init__(self, backend, latency: float):
+        self.backend = backend
+        self.latency = latency
+
+    def __getattr__(self, name):
+        attr = getattr(self.backend, name)
+        if not callable(attr):
+            return attr
+
+        def slow(*args, **kwargs):
+            time.sleep(self.latency)
+            return attr(*args, **kwargs)
+        return slow
+
+async def monitor_loop(stop: asyncio.Event, interval: float, lags: List[float]):
+    """定时唤醒，记录实际唤醒时间比预期晚了多少"""
+    while not stop.is_set():
+        expected = time.perf_counter() + interval
+        await asyncio.sleep(interval)
+        lags.append(max(0.0, time.perf_counter() - expected))
+
+def make_result(size_kb: int) -> Dict[str, Any]:
+    paragraph = "本段为压测用的技术方案正文，包含架构设计和实施步骤。" * 8
+    return {
+        "technical_proposal": "\n\n".join([paragraph] * max(1, size_kb * 1024 // len(paragraph.encode("utf-8")))),
+        "implementation_steps": [{"step": i, "description": paragraph} for i in range(10)],
+        "references": []
+    }
+
+async def run_mode(mode: str, database, async_database, project_ids: List[str], args) -> Dict[str, Any]:
+    """以sync或async方式执行固定数量的存储操作，返回吞吐量和事件循环延迟"""
+    result = make_result(args.result_kb)
+    rng = random.Random(args.seed)
+    ops = {"get": 0, "list": 0, "update": 0, "save": 0}
+
+    async def call(name: str, *call_args):
+        if mode == "sync":
+            return getattr(database, name)(*call_args)
+        return await getattr(async_database, name)(*call_args)
+
+    async def worker():
+        for _ in range(args.operations // args.concurrency):
+            project_id = rng.choice(project_ids)
+            choice = rng.random()
+            if choice < 0.5:
+                await call("get_project", project_id)
+                ops["get"] += 1
+            elif choice < 0.65:
+                await call("list_projects_page", 20, None, None)
+                ops["list"] += 1
+            elif choice < 0.9:
+                # 进入终止状态时立即写入存储
+                await call("update_project", project_id, {"status": rng.choice(["processing", "completed"]),
+                                                          "status_message": f"{mode} {time.time()}"})
+                ops["update"] += 1
+            else:
+                await call("save_project_result", project_id, result)
+                ops["save"] += 1
+            # 让出事件循环，模拟处理请求的其余部分
+            await asyncio.sleep(0)
+
+    return await measure(mode, ops, [worker() for _ in range(args.concurrency)], args)
+
+async def run_jobs_mode(mode: str, job_queue, async_database, project_ids: List[str], args) -> Dict[str, Any]:
+    """以sync或async方式执行项目任务在队列中的完整生命周期，返回吞吐量和事件循环延迟"""
+    content = make_result(args.result_kb)["technical_proposal"]
+    papers = [{"id": f"paper-{i}", "title": f"paper {i}", "content_extracted": True} for i in range(5)]
+    ops = {"enqueue": 0, "checkpoint": 0, "get_checkpoint": 0, "finish": 0}
+
+    async def call(name: str, *call_args, **call_kwargs):
+        ops[name] += 1
+        if mode == "sync":
+            return getattr(job_queue, name)(*call_args, **call_kwargs)
+        return await async_database.run(getattr(job_queue, name), *call_args, **call_kwargs)
+
+    async def worker(worker_id: int):
+        for i in range(args.operations // args.concurrency // 6):
+            job_id = f"{project_ids[(worker_id + i * args.concurrency) % len(project_ids)]}-{mode}-{i}"
+            await call("enqueue", job_id, {"topic": "loop stall", "max_papers": 5}, claim=True)
+            await call("checkpoint", job_id, "translated", {"translated_topic": None, "search_query": "loop stall"})
+            await call("checkpoint", job_id, "searched", {"papers": papers})
+            await call("get_checkpoint", job_id)
+            await call("checkpoint", job_id, "extracted", {"papers": papers, "extracted_contents": [content] * 2})
+            await call("finish", job_id)
+            await asyncio.sleep(0)
+
+    return await measure(f"jobs-{mode}", ops, [worker(i) for i in range(args.concurrency)], args)
+
+async def measure(mode: str, ops: Dict[str, int], workers: List[Any], args) -> Dict[str, Any]:
+    """并发执行workers，同时采样事件循环延迟"""
+    lags: List[float] = []
+    stop = asyncio.Event()
+    monitor = asyncio.create_task(monitor_loop(stop, args.interval, lags))
+    started = time.perf_counter()
+    await asyncio.gather(*workers)
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await monitor
+
+    return {
+        "mode": mode,
+        "operations": sum(ops.values()),
+        "ops": ops,
+        "elapsed_seconds": round(elapsed, 3),
+        "ops_per_second": round(sum(ops.values()) / elapsed, 1),
+        "lag_p50_ms": round((percentile(lags, 0.50) or 0) * 1000, 2),
+        "lag_p99_ms": round((percentile(lags, 0.99) or 0) * 1000, 2),
+        "lag_max_ms": round(max(lags, default=0) * 1000, 2),
+        # 事件循环无法处理其他请求的总时长
+        "stalled_seconds": round(sum(lag for lag in lags if lag > args.interval), 3)
+    }
+
+def print_report(results: List[Dict[str, Any]]):
+    print(f"\n{'方式':<12}{'操作数':>8}{'耗时(s)':>10}{'ops/s':>10}{'延迟p50(ms)':>14}{'p99(ms)':>10}{'max(ms)':>10}{'阻塞(s)':>10}")
+    for r in results:
+        print(f"{r['mode']:<12}{r['operations']:>8}{r['elapsed_seconds']:>10.3f}{r['ops_per_second']:>10.1f}"
+              f"{r['lag_p50_ms']:>14.2f}{r['lag_p99_ms']:>10.2f}{r['lag_max_ms']:>10.2f}{r['stalled_seconds']:>10.3f}")
+    print("\n延迟: 事件循环定时器的唤醒延迟；阻塞: 延迟超过定时间隔的部分之和")
+
+def main():
+    parser = argparse.ArgumentParser(description="存储层事件循环阻塞压测")
+    parser.add_argument("--backend", choices=["sqlite", "json"], default="sqlite", help="项目存储后端")
+    parser.add_argument("--paths", nargs="+", choices=["storage", "jobs"], default=["storage", "jobs"],
+                        help="测量的路径: 项目存储、任务队列")
+    parser.add_argument("--projects", type=int, default=200, help="预先创建的项目数")
+    parser.add_argument("--result-kb", type=int, default=64, help="每个项目结果的大小(KB)")
+    parser.add_argument("--operations", type=int, default=2000, help="每种方式执行的存储操作总数")
+    parser.add_argument("--concurrency", type=int, default=20, help="并发协程数")
+    parser.add_argument("--disk-latency", type=float, default=0.0, help="每次存储后端调用额外增加的延迟(秒)")
+    parser.add_argument("--interval", type=float, default=0.005, help="事件循环延迟的采样间隔(秒)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="把结果写入JSON文件")
+    args = parser.parse_args()
+
+    data_dir = tempfile.mkdtemp(prefix="proposal-stall-")
+    os.environ.update(DATA_DIR=data_dir, STORAGE_BACKEND=args.backend)
+    try:
+        from app.database import VirtualDatabase, AsyncDatabase
+        from app.jobs import JobQueue
+
+        database = VirtualDatabase()
+        result = make_result(args.result_kb)
+        project_ids = []
+        for i in range(args.projects):
+            project_id = database.create_project(f"stall {i}", f"topic {i}", {"max_papers": 5})
+            database.save_project_result(project_id, result)
+            project_ids.append(project_id)
+        job_queue = JobQueue(os.path.join(data_dir, "loop_stall_jobs.db"))
+        if args.disk_latency > 0:
+            database.backend = SlowBackend(database.backend, args.disk_latency)
+            job_queue = SlowBackend(job_queue, args.disk_latency)
+        async_database = AsyncDatabase(database)
+
+        results = []
+        for mode in ("sync", "async"):
+            if "storage" in args.paths:
+                results.append(asyncio.run(run_mode(mode, database, async_database, project_ids, args)))
+            if "jobs" in args.paths:
+                results.append(asyncio.run(run_jobs_mode(mode, job_queue, async_database, project_ids, args)))
+        async_database.shutdown()
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+    print_report(results)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""压测用的本地模拟服务
+
+在同一个端口上模拟三个外部依赖:
+- 方舟chat completions API: POST /ark/chat/completions，支持流式输出，可配置首token延迟和token间隔
+- arXiv查询API: GET /arxiv/api/query，返回Atom格式的搜索结果
+- 论文PDF主机: GET /pdf/{paper_id}.pdf，返回生成的示例PDF
+
+单独运行: python benchmarks/mock_services.py --port 18600
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import re
+import threading
+import time
+from dataclasses import dataclass
+from html import escape
+from urllib.parse import parse_qs
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+
+@dataclass
+class MockSettings:
+    """模拟服务的延迟和数据规模"""
+    translate_latency: float = 0.3     # 非流式请求(翻译)的响应延迟
+    first_token_latency: float = 1.0   # 流式请求的首token延迟
+    token_interval: float = 0.02       # 流式token之间的间隔
+    completion_tokens: int = 200       # 每个方案输出的token数
+    arxiv_latency: float = 0.5         # arXiv查询延迟
+    pdf_latency: float = 0.2           # PDF响应延迟
+    pdf_pages: int = 12                # 示例PDF页数
+
+def make_pdf(pages: int) -> bytes:
+    """生成示例PDF，每页包含一段英文正文"""
+    import fitz  # PyMuPDF
+
+    doc = fitz.open()
+    for i in range(pages):
+        page = doc.new_page()
+        text = (f"Section {i + 1}. Large language model inference relies on batching, "
+                "KV cache reuse, quantization and speculative decoding to reduce latency. ") * 6
+        page.insert_textbox(fitz.Rect(72, 72, 540, 770), text, fontsize=10)
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+def proposal_tokens(count: int):
+    """生成方案文本的token序列"""
+    header = ["# 技术方案\n\n", "## 架构设计\n\n", "```mermaid\ngraph TD\nA[请求]-->B[推理服务]\n```\n\n",
+              "## 所需资源\n\n", "- GPU服务器\n", "- 向量数据库\n\n", "## 方案说明\n\n"]
+    body = [f"第{i}段说明。" for i in range(max(0, count - len(header)))]
+    return header + body
+
+def arxiv_feed(base_url: str, query: str, start: int, max_results: int) -> str:
+    """生成arXiv Atom格式的搜索结果，不同查询返回不同的论文ID"""
+    digest = int(hashlib.sha1(query.encode("utf-8")).hexdigest()[:6], 16) % 90000
+    entries = []
+    for i in range(start, start + max_results):
+        paper_id = f"{2400 + digest // 10000}.{digest % 10000:04d}{i}v1"
+        entries.append(f"""
+  <entry>
+    <id>http://arxiv.org/abs/{paper_id}</id>
+    <updated>2024-01-01T00:00:00Z</updated>
+    <published>2024-01-01T00:00:00Z</published>
+    <title>{escape(query)} study {i}</title>
+    <summary>Benchmark abstract for {escape(query)} ({i}).</summary>
+    <author><name>Bench Author</name></author>
+    <link href="{base_url}/abs/{paper_id}" rel="alternate" type="text/html"/>
+    <link title="pdf" href="{base_url}/pdf/{paper_id}.pdf" rel="related" type="application/pdf"/>
+    <arxiv:primary_category xmlns:arxiv="http://arxiv.org/schemas/atom" term="cs.LG" scheme="http://arxiv.org/schemas/atom"/>
+    <category term="cs.LG" scheme="http://arxiv.org/schemas/atom"/>
+  </entry>""")
+    return f"""<?xml version="1.0" encoding="UTF-8"?>
+<feed xmlns="http://www.w3.org/2005/Atom" xmlns:opensearch="http://a9.com/-/spec/opensearch/1.1/">
+  <title>ArXiv Query</title>
+  <opensearch:totalResults>{start + max_results}</opensearch:totalResults>
+  <opensearch:startIndex>{start}</opensearch:startIndex>
+  <opensearch:itemsPerPage>{max_results}</opensearch:itemsPerPage>{"".join(entries)}
+</feed>
+"""
+
+def create_mock_app(settings: MockSettings) -> FastAPI:
+    """创建模拟服务应用"""
+    app = FastAPI(title="压测模拟服务")
+    pdf_bytes = make_pdf(settings.pdf_pages)
+    app.state.requests = {"chat": 0, "chat_stream": 0, "arxiv": 0, "pdf": 0}
+
+    @app.post("/ark/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        if not body.get("stream"):
+            app.state.requests["chat"] += 1
+            await asyncio.sleep(settings.translate_latency)
+            # 保留主题中的编号，使不同主题的翻译和搜索结果不同
+            numbers = re.findall(r"\d+", body["messages"][-1]["content"])
+            translation = " ".join(["large language model inference acceleration"] + numbers[-1:])
+            return JSONResponse({
+                "choices": [{"message": {"role": "assistant", "content": translation}}],
+                "usage": {"prompt_tokens": 60, "completion_tokens": 6, "total_tokens": 66}
+            })
+
+        app.state.requests["chat_stream"] += 1
+        prompt_tokens = sum(len(m.get("content", "")) for m in body.get("messages", [])) // 2
+
+        async def stream():
+            await asyncio.sleep(settings.first_token_latency)
+            tokens = proposal_tokens(settings.completion_tokens)
+            for token in tokens:
+                yield "data: " + json.dumps({"choices": [{"index": 0, "delta": {"content": token}}]}, ensure_ascii=False) + "\n\n"
+                await asyncio.sleep(settings.token_interval)
+            if (body.get("stream_options") or {}).get("include_usage"):
+                usage = {"prompt_tokens": prompt_tokens, "completion_tokens": len(tokens)}
+                yield "data: " + json.dumps({"choices": [], "usage": usage}) + "\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(stream(), media_type="text/event-stream")
+
+    @app.get("/arxiv/api/query")
+    async def arxiv_query(request: Request):
+        app.state.requests["arxiv"] += 1
+        args = parse_qs(request.url.query)
+        await asyncio.sleep(settings.arxiv_latency)
+        feed = arxiv_feed(
+            str(request.base_url).rstrip("/"),
+            args.get("search_query", [""])[0],
+            int(args.get("start", ["0"])[0]),
+            int(args.get("max_results", ["5"])[0])
+        )
+        return Response(feed, media_type="application/atom+xml")
+
+    @app.get("/pdf/{paper_id}.pdf")
+    async def pdf(paper_id: str):
+        app.state.requests["pdf"] += 1
+        await asyncio.sleep(settings.pdf_latency)
+        return Response(pdf_bytes, media_type="application/pdf")
+
+    @app.get("/stats")
+    async def stats():
+        return app.state.requests
+
+    return app
+
+def start_in_thread(settings: MockSettings, host: str = "127.0.0.1", port: int = 18600) -> uvicorn.Server:
+    """在后台线程中启动模拟服务，返回后服务已可用"""
+    server = uvicorn.Server(uvicorn.Config(create_mock_app(settings), host=host, port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="启动压测用的本地模拟服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=18600)
+    args = parser.parse_args()
+    uvicorn.run(create_mock_app(MockSettings()), host=args.host, port=args.port, log_level="warning")
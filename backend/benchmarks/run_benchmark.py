@@ -0,0 +1,292 @@
+"""端到端压测: POST /api/projects -> process_project
+
+启动本地模拟服务(方舟API、arXiv、PDF主机)和使用临时数据目录的API服务进程，
+并发创建N个项目并等待完成，输出各阶段耗时的p50/p95/p99、每分钟完成项目数和服务进程峰值内存。
+
+示例:
+    cd backend
+    python benchmarks/run_benchmark.py --projects 20 --concurrency 10
+    python benchmarks/run_benchmark.py --projects 50 --first-token-latency 2 --json result.json
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import Dict, List, Optional, Any
+
+import httpx
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from mock_services import MockSettings, start_in_thread
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 按单篇论文记录的阶段，只能从/metrics直方图估算分位数
+HISTOGRAM_STAGES = ("download", "extract")
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """线性插值计算分位数"""
+    if not values:
+        return None
+    values = sorted(values)
+    position = (len(values) - 1) * q
+    lower, upper = math.floor(position), math.ceil(position)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+def histogram_quantile(buckets: List[tuple], q: float) -> Optional[float]:
+    """按Prometheus histogram_quantile的方式从累积桶估算分位数"""
+    if not buckets or buckets[-1][1] == 0:
+        return None
+    rank = q * buckets[-1][1]
+    previous_bound, previous_count = 0.0, 0
+    for bound, count in buckets:
+        if count >= rank:
+            if bound == float("inf"):
+                return previous_bound
+            return previous_bound + (bound - previous_bound) * (rank - previous_count) / max(count - previous_count, 1)
+        previous_bound, previous_count = bound, count
+    return previous_bound
+
+def parse_stage_histograms(text: str) -> Dict[str, List[tuple]]:
+    """从/metrics输出中解析各阶段耗时直方图的累积桶"""
+    buckets: Dict[str, List[tuple]] = {}
+    pattern = re.compile(r'proposal_stage_duration_seconds_bucket\{le="([^"]+)",stage="([^"]+)"\} (\d+)')
+    for bound, stage, count in pattern.findall(text):
+        buckets.setdefault(stage, []).append((float("inf") if bound == "+Inf" else float(bound), int(count)))
+    return {stage: sorted(values) for stage, values in buckets.items()}
+
+class RssSampler:
+    """定期采样服务进程及其子进程(提取进程池)的常驻内存之和，记录峰值"""
+
+    def __init__(self, pid: int, interval: float = 0.2):
+        self.pid = pid
+        self.interval = interval
+        self.peak_bytes = 0
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def _process_tree(self, pid: int) -> List[int]:
+        pids = [pid]
+        try:
+            for task in os.listdir(f"/proc/{pid}/task"):
+                with open(f"/proc/{pid}/task/{task}/children") as f:
+                    for child in f.read().split():
+                        pids.extend(self._process_tree(int(child)))
+        except OSError:
+            pass
+        return pids
+
+    def _rss(self, pid: int) -> int:
+        try:
+            with open(f"/proc/{pid}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        return int(line.split()[1]) * 1024
+        except OSError:
+            pass
+        return 0
+
+    def _run(self):
+        while not self.stopped.is_set():
+            self.peak_bytes = max(self.peak_bytes, sum(self._rss(pid) for pid in self._process_tree(self.pid)))
+            self.stopped.wait(self.interval)
+
+    def start(self):
+        if os.path.exists(f"/proc/{self.pid}/status"):
+            self.thread.start()
+
+    def stop(self) -> Optional[int]:
+        self.stopped.set()
+        if self.thread.is_alive():
+            self.thread.join()
+            return self.peak_bytes
+        return None
+
+def start_api_server(args, data_dir: str, mock_url: str) -> subprocess.Popen:
+    """使用临时数据目录启动API服务进程"""
+    env = dict(
+        os.environ,
+        DATA_DIR=data_dir,
+        VOLCANO_API_URL=f"{mock_url}/ark/chat/completions",
+        VOLCANO_API_KEY="benchmark",
+        ARXIV_API_URL=f"{mock_url}/arxiv/api/query?{{}}",
+        SCHEDULER_MAX_QUEUE=str(max(args.projects, 50))
+    )
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app:app", "--host", "127.0.0.1", "--port", str(args.api_port),
+         "--log-level", "warning"],
+        cwd=BACKEND_DIR,
+        env=env,
+        stdout=subprocess.DEVNULL if not args.verbose else None,
+        stderr=subprocess.DEVNULL if not args.verbose else None
+    )
+
+async def wait_for_api(client: httpx.AsyncClient, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if (await client.get("/api/health")).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError("API服务启动超时")
+
+async def run_project(client: httpx.AsyncClient, index: int, args) -> Dict[str, Any]:
+    """创建一个项目并等待完成，返回客户端观测到的耗时和项目记录的阶段耗时"""
+    topic = f"大模型推理加速 {index}" if args.distinct_topics else "大模型推理加速"
+    started = time.monotonic()
+    while True:
+        response = await client.post("/api/projects", json={
+            "title": f"benchmark {index}", "topic": topic, "max_papers": args.papers
+        })
+        if response.status_code != 429:
+            break
+        await asyncio.sleep(float(response.headers.get("Retry-After", "1")))
+    response.raise_for_status()
+    project_id = response.json()["project_id"]
+
+    while True:
+        await asyncio.sleep(args.poll_interval)
+        project = (await client.get(f"/api/projects/{project_id}")).json()
+        if project["status"] in ("completed", "failed"):
+            break
+    return {
+        "status": project["status"],
+        "elapsed": time.monotonic() - started,
+        "timings": project.get("timings", [])
+    }
+
+async def drive(args) -> Dict[str, Any]:
+    """按并发上限创建项目，汇总结果"""
+    semaphore = asyncio.Semaphore(args.concurrency)
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{args.api_port}", timeout=60) as client:
+        await wait_for_api(client)
+
+        async def limited(index: int):
+            async with semaphore:
+                return await run_project(client, index, args)
+
+        started = time.monotonic()
+        results = await asyncio.gather(*(limited(i) for i in range(args.projects)))
+        wall = time.monotonic() - started
+        metrics_text = (await client.get("/metrics")).text
+    return {"results": results, "wall": wall, "metrics": metrics_text}
+
+def summarize(run: Dict[str, Any], peak_rss: Optional[int]) -> Dict[str, Any]:
+    """计算分位数和吞吐量"""
+    results = run["results"]
+    completed = [r for r in results if r["status"] == "completed"]
+    stage_values: Dict[str, List[float]] = {"end_to_end": [r["elapsed"] for r in results]}
+    for result in results:
+        for span in result["timings"]:
+            stage_values.setdefault(span["stage"], []).append(span["duration"])
+
+    stages = {
+        stage: {
+            "samples": len(values),
+            "p50": percentile(values, 0.50),
+            "p95": percentile(values, 0.95),
+            "p99": percentile(values, 0.99)
+        } for stage, values in stage_values.items()
+    }
+    histograms = parse_stage_histograms(run["metrics"])
+    for stage in HISTOGRAM_STAGES:
+        if stage in histograms:
+            stages[stage] = {
+                "samples": histograms[stage][-1][1],
+                "p50": histogram_quantile(histograms[stage], 0.50),
+                "p95": histogram_quantile(histograms[stage], 0.95),
+                "p99": histogram_quantile(histograms[stage], 0.99),
+                "estimated": True
+            }
+    return {
+        "projects": len(results),
+        "completed": len(completed),
+        "failed": len(results) - len(completed),
+        "wall_seconds": round(run["wall"], 3),
+        "projects_per_minute": round(len(completed) / run["wall"] * 60, 2) if run["wall"] else 0.0,
+        "peak_rss_mb": round(peak_rss / 1024 / 1024, 1) if peak_rss else None,
+        "stages": stages
+    }
+
+def print_report(summary: Dict[str, Any]):
+    print(f"\n项目: {summary['projects']}  完成: {summary['completed']}  失败: {summary['failed']}")
+    print(f"总耗时: {summary['wall_seconds']}s  吞吐量: {summary['projects_per_minute']} 项目/分钟  "
+          f"峰值内存: {summary['peak_rss_mb']} MB")
+    print(f"\n{'阶段':<14}{'样本':>6}{'p50(s)':>10}{'p95(s)':>10}{'p99(s)':>10}")
+    order = ["translate", "corpus", "search", "download", "extract", "pipeline", "documents", "generate", "end_to_end"]
+    for stage in sorted(summary["stages"], key=lambda s: order.index(s) if s in order else len(order)):
+        stats = summary["stages"][stage]
+        name = stage + ("*" if stats.get("estimated") else "")
+        cells = "".join(f"{stats[q]:>10.3f}" if stats[q] is not None else f"{'-':>10}" for q in ("p50", "p95", "p99"))
+        print(f"{name:<14}{stats['samples']:>6}{cells}")
+    print("\n* 按单篇论文统计，分位数由/metrics直方图估算")
+
+def main():
+    parser = argparse.ArgumentParser(description="技术方案生成端到端压测")
+    parser.add_argument("--projects", type=int, default=20, help="创建的项目总数")
+    parser.add_argument("--concurrency", type=int, default=10, help="同时进行中的项目数")
+    parser.add_argument("--papers", type=int, default=5, help="每个项目检索的论文数")
+    parser.add_argument("--distinct-topics", action=argparse.BooleanOptionalAction, default=True,
+                        help="每个项目使用不同的主题，避免命中缓存")
+    parser.add_argument("--poll-interval", type=float, default=0.5)
+    parser.add_argument("--api-port", type=int, default=18700)
+    parser.add_argument("--mock-port", type=int, default=18600)
+    parser.add_argument("--translate-latency", type=float, default=MockSettings.translate_latency)
+    parser.add_argument("--first-token-latency", type=float, default=MockSettings.first_token_latency)
+    parser.add_argument("--token-interval", type=float, default=MockSettings.token_interval)
+    parser.add_argument("--completion-tokens", type=int, default=MockSettings.completion_tokens)
+    parser.add_argument("--arxiv-latency", type=float, default=MockSettings.arxiv_latency)
+    parser.add_argument("--pdf-latency", type=float, default=MockSettings.pdf_latency)
+    parser.add_argument("--pdf-pages", type=int, default=MockSettings.pdf_pages)
+    parser.add_argument("--data-dir", help="API服务的数据目录，默认使用临时目录并在结束后删除")
+    parser.add_argument("--json", help="把结果写入JSON文件")
+    parser.add_argument("--verbose", action="store_true", help="显示API服务日志")
+    args = parser.parse_args()
+
+    settings = MockSettings(
+        translate_latency=args.translate_latency,
+        first_token_latency=args.first_token_latency,
+        token_interval=args.token_interval,
+        completion_tokens=args.completion_tokens,
+        arxiv_latency=args.arxiv_latency,
+        pdf_latency=args.pdf_latency,
+        pdf_pages=args.pdf_pages
+    )
+    start_in_thread(settings, port=args.mock_port)
+    mock_url = f"http://127.0.0.1:{args.mock_port}"
+
+    data_dir = args.data_dir or tempfile.mkdtemp(prefix="proposal-bench-")
+    server = start_api_server(args, data_dir, mock_url)
+    sampler = RssSampler(server.pid)
+    sampler.start()
+    try:
+        run = asyncio.run(drive(args))
+    finally:
+        peak_rss = sampler.stop()
+        server.terminate()
+        try:
+            server.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            server.kill()
+        if not args.data_dir:
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+    summary = summarize(run, peak_rss)
+    print_report(summary)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,8 @@
+import os
+import sys
+import tempfile
+
+# 在导入app之前设置，测试数据写入临时目录，不影响data/下的示例数据
+os.environ["DATA_DIR"] = tempfile.mkdtemp(prefix="proposal-test-")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,42 @@
+import os
+
+from app.blobs import BlobStore
+
+def test_shared_content_is_collected_only_after_the_last_reference_and_grace(tmp_path):
+    store = BlobStore(str(tmp_path))
+    sha256, path, deduplicated = store.put_bytes(b"same content")
+    assert not deduplicated
+    assert store.put_bytes(b"same content")[2]
+
+    store.retain("project:a", "paper.pdf", sha256)
+    store.retain("project:b", "copy.pdf", sha256)
+    # 同一引用重复建立不增加引用计数
+    store.retain("project:b", "copy.pdf", sha256)
+    assert store.usage()["refs"] == 2
+
+    store.release(["project:a"])
+    assert store.collect_garbage(grace_hours=0)["blobs"] == 0
+    assert os.path.exists(path)
+
+    store.release(["project:b"])
+    # 刚释放的文件在宽限期内保留
+    assert store.collect_garbage(grace_hours=1)["blobs"] == 0
+    assert os.path.exists(path)
+
+    removed = store.collect_garbage(grace_hours=0)
+    assert removed["sha256s"] == [sha256]
+    assert not os.path.exists(path)
+
+def test_replacing_a_reference_releases_the_old_content(tmp_path):
+    store = BlobStore(str(tmp_path))
+    old, old_path, _ = store.put_bytes(b"version 1")
+    new, new_path, _ = store.put_bytes(b"version 2")
+    store.set_alias("paper:1", old)
+
+    store.retain("project:a", "paper.pdf", old)
+    store.retain("project:a", "paper.pdf", new)
+
+    assert store.collect_garbage(grace_hours=0)["sha256s"] == [old]
+    assert not os.path.exists(old_path) and os.path.exists(new_path)
+    # 回收的文件的别名一并删除
+    assert store.resolve("paper:1") is None
@@ -0,0 +1,24 @@
+import os
+
+from app.cache import SqliteCache
+
+def test_total_bytes_is_shared_between_connections(tmp_path):
+    path = os.path.join(tmp_path, "cache.db")
+    api = SqliteCache(path, max_bytes=2000)
+    worker = SqliteCache(path, max_bytes=2000)
+    # 不可压缩的值，每条约500字节
+    values = [os.urandom(500).hex() for _ in range(6)]
+
+    for i, value in enumerate(values[:3]):
+        api.set(f"api{i}", value)
+    for i, value in enumerate(values[3:]):
+        worker.set(f"worker{i}", value)
+
+    # 两个连接看到同一个总大小，超过上限后淘汰最早访问的条目
+    assert api.total_bytes == worker.total_bytes <= 2000
+    assert api.get("api0") is None
+    assert worker.get("worker2") == values[5]
+    assert api.stats()["entries"] < 6
+
+    worker.delete("worker2")
+    assert api.total_bytes == worker.total_bytes
@@ -0,0 +1,29 @@
+from fastapi.testclient import TestClient
+
+import app.routes as routes
+from app.database import db
+
+client = TestClient(routes.app, raise_server_exceptions=False)
+
+def test_failed_start_does_not_leave_an_inflight_leader(monkeypatch):
+    async def broken_start_project(project_id, project_request, bypass_limit=False):
+        raise RuntimeError("database is locked")
+
+    monkeypatch.setattr(routes, "start_project", broken_start_project)
+    body = {"title": "t", "topic": "启动失败的请求"}
+    response = client.post("/api/projects", json=body)
+    assert response.status_code == 500
+    failed = [p for p in db.list_projects(100) if p["topic"] == "启动失败的请求"]
+    assert [p["status"] for p in failed] == ["failed"]
+
+    started = []
+
+    async def fake_start_project(project_id, project_request, bypass_limit=False):
+        started.append(project_id)
+        await routes.update_project_status(project_id, {"status": "processing"})
+        return "task"
+
+    monkeypatch.setattr(routes, "start_project", fake_start_project)
+    response = client.post("/api/projects", json=body).json()
+    assert "coalesced_with" not in response
+    assert started == [response["project_id"]]
@@ -0,0 +1,33 @@
+import threading
+
+from app.database import db
+
+def test_reads_see_updates_while_they_are_written(monkeypatch):
+    project_id = db.create_project("t", "写入期间的读取", {})
+    db.flush()
+    db.update_project(project_id, {"status": "processing", "progress": 40})
+    writing = threading.Event()
+    release = threading.Event()
+    update_many = db.backend.update_many
+
+    def slow_update_many(updates):
+        writing.set()
+        assert release.wait(5)
+        update_many(updates)
+
+    monkeypatch.setattr(db.backend, "update_many", slow_update_many)
+    flusher = threading.Thread(target=db.flush)
+    flusher.start()
+    try:
+        assert writing.wait(5)
+        # 写入期间不持有pending_lock，更新和读取不被阻塞
+        db.update_project(project_id, {"progress": 60})
+        project = db.get_project(project_id)
+        assert (project["status"], project["progress"]) == ("processing", 60)
+    finally:
+        release.set()
+        flusher.join(5)
+
+    db.flush()
+    project = db.backend.get_metadata(project_id)
+    assert (project["status"], project["progress"]) == ("processing", 60)
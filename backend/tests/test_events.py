@@ -0,0 +1,27 @@
+import asyncio
+
+from app.events import ProjectEventBus, RESYNC_EVENT
+
+def test_overflow_asks_subscriber_to_resync():
+    bus = ProjectEventBus(max_queue_size=3)
+
+    async def run():
+        queue, _ = bus.subscribe("p")
+        for i in range(5):
+            bus.publish("p", "token", {"content": str(i)})
+        await asyncio.sleep(0.05)
+        first = queue.get_nowait()
+        bus.unsubscribe("p", queue)
+        # 重新连接时获取完整的已生成文本
+        _, partial = bus.subscribe("p")
+        return first, partial
+
+    first, partial = asyncio.run(run())
+    assert first.event == RESYNC_EVENT
+    assert partial == "01234"
+
+def test_clear_releases_partial_proposal():
+    bus = ProjectEventBus()
+    bus.publish("p", "token", {"content": "部分方案"})
+    bus.clear("p")
+    assert bus.partial_proposals == {}
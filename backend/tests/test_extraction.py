@@ -0,0 +1,62 @@
+import asyncio
+import time
+
+import fitz
+import pytest
+
+import app.extraction as extraction
+from app.extraction import ExtractionService, pdf_page_count
+
+def slow_page_range(file_path, start, end, cpu_budget):
+    """模拟提取时卡住的页面，CPU预算在页与页之间检查，这里不会生效"""
+    time.sleep(30)
+    return [], False
+
+@pytest.fixture
+def pdf_path(tmp_path):
+    path = str(tmp_path / "doc.pdf")
+    with fitz.open() as doc:
+        for i in range(3):
+            doc.new_page().insert_text((72, 72), f"page {i}")
+        doc.save(path)
+    return path
+
+def test_slow_page_frees_the_worker(monkeypatch, pdf_path):
+    # 子进程在进程池创建时fork，需要在此之前替换提取函数
+    monkeypatch.setattr(extraction, "extract_pdf_page_range", slow_page_range)
+    service = ExtractionService(max_workers=1)
+
+    async def run():
+        # 超出时间预算时抛出TimeoutError，或子进程先被终止时按提取出错返回空结果
+        try:
+            assert await service.extract_pdf_pages(pdf_path, max_pages=3, time_budget=0.5) == []
+        except asyncio.TimeoutError:
+            pass
+        # 等待子进程达到时间限制被终止；唯一的子进程如果仍在执行卡住的页面，下面的调用要等30秒
+        await asyncio.sleep(0.5)
+        return await asyncio.wait_for(service._run(pdf_page_count, pdf_path), timeout=5)
+
+    try:
+        assert asyncio.run(run()) == 3
+        assert service.get_stats()["recycled"] == 1
+    finally:
+        service.shutdown()
+
+def test_queued_work_is_cancelled_without_recycling(pdf_path):
+    service = ExtractionService(max_workers=1)
+
+    async def run():
+        busy = asyncio.ensure_future(service._run(time.sleep, 1))
+        await asyncio.sleep(0.3)
+        queued = asyncio.ensure_future(service._run(pdf_page_count, pdf_path))
+        await asyncio.sleep(0.1)
+        queued.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await queued
+        await busy
+
+    try:
+        asyncio.run(run())
+        assert service.get_stats()["recycled"] == 0
+    finally:
+        service.shutdown()
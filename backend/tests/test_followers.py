@@ -0,0 +1,55 @@
+import asyncio
+
+import pytest
+
+import app.routes as routes
+from app.database import db
+from app.models import ProjectRequest
+from app.proposal_cache import proposal_cache, request_fingerprint
+
+def coalesced_pair(topic: str):
+    """创建一个处理中的领头项目和一个合并到它的相同请求"""
+    request = ProjectRequest(title="t", topic=topic)
+    leader = db.create_project("t", topic, request.dict())
+    follower = db.create_project("t", topic, request.dict())
+    db.update_project(leader, {"status": "processing"})
+    fingerprint = request_fingerprint(request.dict())
+    assert proposal_cache.join(fingerprint, leader, routes.is_project_active) is None
+    assert proposal_cache.join(fingerprint, follower, routes.is_project_active) == leader
+    return leader, follower
+
+@pytest.fixture
+def started(monkeypatch):
+    calls = []
+
+    async def fake_start_project(project_id, project_request, bypass_limit=False):
+        calls.append((project_id, project_request.topic, bypass_limit))
+
+    monkeypatch.setattr(routes, "start_project", fake_start_project)
+    return calls
+
+def test_follower_of_document_based_leader_runs_on_its_own(started):
+    leader, follower = coalesced_pair("上传文档的方案")
+    db.save_project_result(leader, {
+        "technical_proposal": "基于上传文档的方案",
+        "documents": [{"filename": "private.md", "sha256": "0" * 64, "pages": 1, "truncated": False}]
+    })
+
+    asyncio.run(routes.settle_followers(leader))
+
+    assert started == [(follower, "上传文档的方案", True)]
+    project = db.get_project(follower)
+    assert "result" not in project
+    assert project["status"] != "completed"
+
+def test_follower_of_plain_leader_reuses_result(started):
+    leader, follower = coalesced_pair("普通方案")
+    db.save_project_result(leader, {"technical_proposal": "普通方案"})
+
+    asyncio.run(routes.settle_followers(leader))
+
+    assert started == []
+    project = db.get_project(follower)
+    assert project["status"] == "completed"
+    assert project["result"]["technical_proposal"] == "普通方案"
+    assert project["reused_from"] == leader
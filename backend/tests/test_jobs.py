@@ -0,0 +1,40 @@
+import os
+import time
+
+import app.jobs as jobs
+from app.jobs import JobQueue
+
+def test_expired_lease_is_reclaimed_by_another_process(tmp_path, monkeypatch):
+    monkeypatch.setattr(jobs, "JOB_LEASE_SECONDS", 0.2)
+    db_path = os.path.join(tmp_path, "jobs.db")
+    crashed = JobQueue(db_path)
+    survivor = JobQueue(db_path)
+
+    crashed.enqueue("project-1", {"topic": "租约"}, claim=True)
+    crashed.checkpoint("project-1", "translated", {"search_query": "lease"})
+    # 租约有效期内其他进程不能领取
+    assert survivor.claim() is None
+
+    time.sleep(0.3)
+    job = survivor.claim()
+    assert job["id"] == "project-1"
+    assert job["previous_owner"] == crashed.instance_id
+    assert job["attempts"] == 2
+    assert job["stage"] == "translated"
+    assert survivor.get_checkpoint("project-1")["search_query"] == "lease"
+
+    # 原进程恢复后续约，发现任务已被接管，不再持有
+    crashed.heartbeat()
+    assert not crashed.holds("project-1")
+    assert survivor.holds("project-1")
+    assert crashed.claim() is None
+
+def test_release_hands_jobs_back_without_waiting_for_the_lease(tmp_path):
+    db_path = os.path.join(tmp_path, "jobs.db")
+    stopping = JobQueue(db_path)
+    other = JobQueue(db_path)
+
+    stopping.enqueue("project-2", {"topic": "交还"}, claim=True)
+    assert other.claim() is None
+    stopping.release()
+    assert other.claim()["id"] == "project-2"
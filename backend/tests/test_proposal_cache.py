@@ -0,0 +1,50 @@
+import os
+import asyncio
+
+import app.routes as routes
+from app.database import db
+from app.embeddings import embedding_index
+from app.models import ProjectRequest
+from app.proposal_cache import ProposalCache, options_fingerprint
+
+def completed_project(request: ProjectRequest, query: str) -> str:
+    project_id = db.create_project(request.title, request.topic, request.dict())
+    db.save_project_result(project_id, {"technical_proposal": f"{query}的方案"})
+    db.update_project(project_id, {"status": "completed"})
+    embedding_index.add_project(project_id, query, [], request.model_type, options_fingerprint(request.dict()))
+    return project_id
+
+def test_similar_proposal_requires_the_same_request_options():
+    source = completed_project(
+        ProjectRequest(title="旧标题", topic="图神经网络", max_papers=5, custom_keywords=["GNN"]),
+        "graph neural network survey options"
+    )
+
+    def reuse(**fields):
+        request = ProjectRequest(**dict({"title": "新标题", "topic": "图神经网络"}, **fields))
+        project_id = db.create_project(request.title, request.topic, request.dict())
+        return asyncio.run(routes.reuse_similar_proposal(project_id, "graph neural network survey options", request, []))
+
+    assert reuse(max_papers=10, custom_keywords=["GNN"]) is None
+    assert reuse(max_papers=5, custom_keywords=["GNN"], description="侧重推荐系统") is None
+    assert reuse(max_papers=5, custom_keywords=["transformer"]) is None
+    # 标题不同、关键词大小写不同仍然复用
+    assert reuse(max_papers=5, custom_keywords=["gnn"])["reused_from"] == source
+
+def test_join_coalesces_requests_until_the_leader_settles(tmp_path):
+    cache = ProposalCache(os.path.join(tmp_path, "proposal_cache.db"))
+    active = {"leader"}
+
+    assert cache.join("fp", "leader", active.__contains__) is None
+    assert cache.join("fp", "follower-1", active.__contains__) == "leader"
+    assert cache.join("fp", "follower-2", active.__contains__) == "leader"
+    assert cache.join("other", "unrelated", active.__contains__) is None
+
+    assert sorted(cache.settle("leader")) == ["follower-1", "follower-2"]
+    assert cache.settle("leader") == []
+    stats = cache.stats()
+    assert (stats["inflight"], stats["followers"], stats["coalesced"]) == (1, 0, 2)
+
+    # 领头项目已结束(例如进程崩溃后不再处于处理中)时，新请求自己成为领头项目
+    assert cache.join("other", "next", active.__contains__) is None
+    assert cache.settle("next") == []
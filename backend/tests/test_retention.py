@@ -0,0 +1,31 @@
+from app.database import db
+from app.config import EMBEDDING_DIR
+from app.embeddings import EmbeddingIndex, VectorIndex, embedding_index
+from app.proposal_cache import proposal_cache, request_fingerprint, options_fingerprint
+
+def test_expired_projects_are_no_longer_reused():
+    params = {"title": "t", "topic": "过期项目的语义索引", "model_type": "doubao"}
+    project_id = db.create_project("t", params["topic"], params)
+    db.flush()
+    db.backend.conn.execute(
+        "UPDATE projects SET created_at = ?, metadata = json_set(metadata, '$.created_at', ?) WHERE id = ?",
+        ("2000-01-01", "2000-01-01", project_id)
+    )
+    fingerprint = request_fingerprint(params)
+    options = options_fingerprint(params)
+    embedding_index.add_project(project_id, "expired retention query", [], "doubao", options)
+    proposal_cache.put(fingerprint, "", project_id, {"technical_proposal": "旧方案"}, [])
+    # 另一个进程的索引在删除前已经缓存了这一行的类型
+    other_process = EmbeddingIndex(VectorIndex(EMBEDDING_DIR))
+    for index in (embedding_index, other_process):
+        assert index.find_similar_proposal("expired retention query", options)["ref"] == project_id
+
+    report = db.retention.start()
+    db.retention._expire_projects(report)
+
+    assert report["projects"] >= 1
+    assert db.get_project(project_id) is None
+    for index in (embedding_index, other_process):
+        assert index.find_similar_proposal("expired retention query", options) is None
+    assert not embedding_index.vectors.has(f"project:{project_id}")
+    assert proposal_cache.lookup(fingerprint) is None
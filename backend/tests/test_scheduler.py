@@ -0,0 +1,63 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from app.scheduler import TaskScheduler, SchedulerSaturated, DEFAULT_RUN_SECONDS
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+def test_retry_after_ignores_short_maintenance_tasks():
+    scheduler = TaskScheduler(max_concurrent=1, max_queue=1)
+
+    async def noop():
+        return None
+
+    for _ in range(20):
+        scheduler.submit_task(noop(), queue="maintenance", bypass_limit=True)
+    wait_for(lambda: scheduler.get_stats()["queues"]["maintenance"]["started"] == 20 and scheduler.running == 0)
+
+    stats = scheduler.get_stats()
+    assert stats["queues"]["maintenance"]["run_seconds_avg"] < 1
+    assert stats["avg_run_seconds"] == DEFAULT_RUN_SECONDS
+    # 维护任务很快结束，但项目任务的等待时间仍按项目任务估算
+    assert scheduler.retry_after("projects") == DEFAULT_RUN_SECONDS
+
+def test_full_queue_rejects_new_project_tasks():
+    scheduler = TaskScheduler(max_concurrent=1, max_queue=1)
+    release = threading.Event()
+
+    async def blocked():
+        while not release.is_set():
+            await asyncio.sleep(0.01)
+
+    scheduler.submit_task(blocked(), "running", queue="projects")
+    wait_for(lambda: scheduler.running == 1)
+    scheduler.submit_task(blocked(), "queued", queue="projects")
+
+    rejected = blocked()
+    with pytest.raises(SchedulerSaturated) as e:
+        scheduler.submit_task(rejected, "rejected", queue="projects")
+    assert e.value.queue_depth == 1
+    assert e.value.retry_after >= 1
+    # 被拒绝的协程已关闭，不会留下未等待的协程
+    assert rejected.cr_frame is None
+    with pytest.raises(SchedulerSaturated):
+        scheduler.check_capacity("projects")
+    assert scheduler.get_task_status("rejected") is None
+
+    # 维护任务不受队列上限限制
+    scheduler.submit_task(blocked(), "maintenance", queue="maintenance", bypass_limit=True)
+    stats = scheduler.get_stats()
+    assert stats["saturated"] and stats["queue_depth"] == 2
+    assert stats["queues"]["projects"]["rejected"] == 2
+
+    release.set()
+    wait_for(lambda: scheduler.running == 0 and scheduler.queue_depth() == 0)
+    assert scheduler.get_task_status("queued")["status"] == "completed"
+    scheduler.check_capacity("projects")
@@ -0,0 +1,43 @@
+import asyncio
+
+import app.ai_service as ai_service
+
+def test_boolean_operators_do_not_share_cache_with_lowercase_words(monkeypatch):
+    queries = []
+
+    async def fake_search(query, max_results):
+        queries.append(query)
+        return [{"id": query}]
+
+    monkeypatch.setattr(ai_service, "_search_arxiv", fake_search)
+
+    async def search_all():
+        return [
+            await ai_service.search_arxiv_papers("graph AND learning"),
+            await ai_service.search_arxiv_papers("graph and learning"),
+            await ai_service.search_arxiv_papers("“graph AND learning”")
+        ]
+
+    results = asyncio.run(search_all())
+    assert queries == ["graph AND learning", "graph and learning"]
+    assert [r[0]["id"] for r in results] == ["graph AND learning", "graph and learning", "graph AND learning"]
+
+def test_web_analysis_records_token_usage(monkeypatch):
+    class FakeResponse:
+        def json(self):
+            return {
+                "choices": [{"message": {"content": "网页摘要"}}],
+                "usage": {"prompt_tokens": 120, "completion_tokens": 30}
+            }
+
+    class FakeClient:
+        async def post(self, url, **kwargs):
+            return FakeResponse()
+
+    monkeypatch.setattr(ai_service.http_clients, "get_client", lambda url: FakeClient())
+    key = (("call", "analyze_web"), ("kind", "prompt"))
+    before = ai_service.llm_tokens.values.get(key, 0)
+
+    assert asyncio.run(ai_service.analyze_web_content("https://example.com")) == "网页摘要"
+    assert ai_service.llm_tokens.values[key] - before == 120
+    assert ai_service.llm_tokens.values[(("call", "analyze_web"), ("kind", "completion"))] >= 30
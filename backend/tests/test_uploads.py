@@ -0,0 +1,51 @@
+import os
+import asyncio
+import hashlib
+
+import pytest
+from fastapi.testclient import TestClient
+
+import app.routes as routes
+from app.uploads import StreamingUpload, UploadTooLarge
+
+BOUNDARY = "test-boundary"
+CONTENT_TYPE = f"multipart/form-data; boundary={BOUNDARY}"
+
+def multipart_body(content: bytes) -> bytes:
+    return (
+        f"--{BOUNDARY}\r\n"
+        'Content-Disposition: form-data; name="project_id"\r\n\r\n'
+        "p1\r\n"
+        f"--{BOUNDARY}\r\n"
+        'Content-Disposition: form-data; name="file"; filename="../notes.md"\r\n'
+        "Content-Type: text/markdown\r\n\r\n"
+    ).encode() + content + f"\r\n--{BOUNDARY}--\r\n".encode()
+
+async def chunks(body: bytes, size: int = 1000):
+    for start in range(0, len(body), size):
+        yield body[start:start + size]
+
+def receive(body: bytes, max_bytes: int, temp_dir: str):
+    return asyncio.run(StreamingUpload(CONTENT_TYPE, max_bytes=max_bytes, temp_dir=temp_dir).receive(chunks(body)))
+
+def test_upload_is_streamed_to_a_temp_file(tmp_path):
+    content = os.urandom(5000)
+    fields, upload = receive(multipart_body(content), 5000, str(tmp_path))
+
+    assert fields == {"project_id": "p1"}
+    assert (upload["filename"], upload["size"]) == ("notes.md", 5000)
+    assert upload["sha256"] == hashlib.sha256(content).hexdigest()
+    with open(upload["temp_path"], "rb") as f:
+        assert f.read() == content
+
+def test_oversized_upload_is_aborted_and_cleaned_up(tmp_path):
+    with pytest.raises(UploadTooLarge):
+        receive(multipart_body(os.urandom(5001)), 5000, str(tmp_path))
+    assert os.listdir(os.path.join(tmp_path, "tmp")) == []
+
+def test_oversized_content_length_is_rejected_before_reading(monkeypatch):
+    monkeypatch.setattr(routes, "UPLOAD_MAX_BYTES", 1000)
+    client = TestClient(routes.app)
+    body = multipart_body(b"x" * (routes.MULTIPART_OVERHEAD + 2000))
+    response = client.post("/api/upload", content=body, headers={"Content-Type": CONTENT_TYPE})
+    assert response.status_code == 413
@@ -0,0 +1,38 @@
+import asyncio
+import os
+import sys
+import signal
+
+# 添加当前目录到模块搜索路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.routes import run_job
+from app.jobs import job_queue, JobConsumer
+from app.http_client import http_clients
+from app.extraction import extraction_service
+from app.database import async_db
+
+def handle_sigterm(signum, frame):
+    """收到SIGTERM时按Ctrl+C的方式退出，交还未完成的任务"""
+    # 退出过程中再次收到SIGTERM(如同时发给整个进程组)时不再打断数据写入
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    raise KeyboardInterrupt
+
+if __name__ == "__main__":
+    # API服务需设置JOB_EXECUTION_MODE=worker，项目任务全部交给worker进程执行。
+    # 可以启动多个worker进程，它们通过共享的任务数据库领取任务。
+    signal.signal(signal.SIGTERM, handle_sigterm)
+    print(f"启动任务处理进程: {job_queue.instance_id}")
+    future = JobConsumer(job_queue, run_job).start()
+    try:
+        future.result()
+    except KeyboardInterrupt:
+        print("正在停止任务处理进程")
+    finally:
+        future.cancel()
+        extraction_service.shutdown()
+        # 先等待写入线程中排队的更新完成并写入存储，再交还任务
+        asyncio.run(async_db.flush())
+        async_db.shutdown()
+        job_queue.release()
+        asyncio.run(http_clients.shutdown())
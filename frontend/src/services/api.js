@@ -49,6 +49,11 @@ export default {
     // 获取项目列表
     list(limit = 10) {
       return apiClient.get('/projects', { params: { limit } })
+    },
+    
+    // 订阅项目事件流(SSE)
+    stream(id) {
+      return new EventSource(`${apiClient.defaults.baseURL}/projects/${id}/stream`)
     }
   },
   